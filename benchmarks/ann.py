@@ -0,0 +1,179 @@
+"""
+Évaluation du compromis rappel/latence de l'index ANN sur `Chunk.embedding`.
+
+Les k plus proches voisins exacts de chaque requête sont calculés par un
+parcours séquentiel (index désactivé), puis comparés aux résultats de la
+recherche de l'application (`PgVectorStore.search`) pour chaque réglage :
+`probes` (IVFFlat) ou `ef_search` (HNSW) à la recherche, `lists` ou `m` /
+`ef_construction` à la construction de l'index.
+"""
+
+import logging
+import time
+
+import numpy as np
+from django.db import connection, transaction
+
+from rag.embedding_function import embed_query
+from rag.models import Chunk
+from rag.vector_index import (
+    INDEX_TYPES,
+    TABLE_NAME,
+    current_index_type,
+    rebuild_index,
+    to_vector_literal,
+)
+from rag.vector_store import PgVectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def parse_index_spec(spec: str):
+    """
+    Lit une configuration d'index de la forme "hnsw:m=16,ef_construction=64"
+    ou "ivfflat:lists=100".
+
+    :return: Dictionnaire des arguments de `rebuild_index`.
+    :raises ValueError: Si le type ou un paramètre est inconnu.
+    """
+    index_type, _, options = spec.partition(":")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : '{index_type}'")
+    allowed = ("lists",) if index_type == "ivfflat" else ("m", "ef_construction")
+    config = {"index_type": index_type}
+    for option in filter(None, options.split(",")):
+        name, _, value = option.partition("=")
+        if name not in allowed:
+            raise ValueError(f"Paramètre '{name}' invalide pour un index {index_type}")
+        config[name] = int(value)
+    return config
+
+
+def sample_queries(sample_size: int, questions=None):
+    """
+    Vecteurs de requête : embeddings des questions fournies, sinon embeddings de
+    chunks tirés au hasard (le chunk lui-même est alors exclu de ses voisins).
+
+    :return: Liste de couples (identifiant du chunk ou None, embedding).
+    """
+    if questions:
+        return [(None, embed_query(question)) for question in questions]
+    rows = Chunk.objects.order_by("?").values_list("id", "embedding")[:sample_size]
+    return [(chunk_id, np.asarray(embedding)) for chunk_id, embedding in rows]
+
+
+def exact_neighbors(embedding, top_k: int, exclude=None):
+    """
+    k plus proches voisins exacts (distance cosinus), par parcours séquentiel.
+
+    :return: Liste d'identifiants, du plus proche au moins proche.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Sans index : tri de toutes les lignes
+        cursor.execute("SET LOCAL enable_indexscan = off")
+        cursor.execute(
+            f"SELECT id FROM {TABLE_NAME} "
+            f"ORDER BY embedding <=> %s::vector LIMIT %s",
+            [to_vector_literal(embedding), top_k + (exclude is not None)],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    return [chunk_id for chunk_id in ids if chunk_id != exclude][:top_k]
+
+
+def evaluate_setting(store, queries, truths, top_k: int, **params):
+    """
+    Mesure le rappel@k et la latence de la recherche pour un réglage.
+
+    :param params: `probes` ou `ef_search`.
+    :return: Dictionnaire du rappel moyen et des latences en millisecondes.
+    """
+    # Première requête non mesurée (cache de l'index)
+    store.search(queries[0][1], top_k, **params)
+
+    recalls = []
+    latencies = []
+    for (query_id, embedding), truth in zip(queries, truths):
+        start = time.perf_counter()
+        chunks = store.search(embedding, top_k + (query_id is not None), **params)
+        latencies.append(time.perf_counter() - start)
+        found = [chunk.id for chunk in chunks if chunk.id != query_id][:top_k]
+        recalls.append(len(set(found) & set(truth)) / max(len(truth), 1))
+
+    values = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+        "latency_ms": {
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "mean": round(float(values.mean()), 3),
+        },
+    }
+
+
+def evaluate_index(
+    queries, top_k=5, index_configs=(), probes=(), ef_search=(), progress=None
+):
+    """
+    Évalue l'index en place, ou chacune des configurations demandées (l'index
+    est alors reconstruit pour chacune).
+
+    :param queries: Requêtes de `sample_queries`.
+    :param index_configs: Configurations de `parse_index_spec` (vide : index actuel).
+    :param probes: Valeurs de `ivfflat.probes` testées.
+    :param ef_search: Valeurs de `hnsw.ef_search` testées. La recherche relève
+        ef_search au nombre de candidats demandés à l'index
+        (`PgVectorStore.effective_ef_search`) : les valeurs inférieures sont
+        remplacées par ce minimum et les doublons ignorés, le rapport donnant
+        la valeur réellement appliquée.
+    :param progress: Fonction optionnelle appelée avec chaque résultat.
+    :return: Liste de résultats, un par couple (index, réglage de recherche).
+    """
+    truths = [
+        exact_neighbors(embedding, top_k, exclude=query_id)
+        for query_id, embedding in queries
+    ]
+    store = PgVectorStore()
+    results = []
+
+    # k demandé à la recherche : le chunk requête est exclu de ses voisins
+    search_k = top_k + any(query_id is not None for query_id, _ in queries)
+    minimum = store.candidate_count(search_k)
+    effective = sorted(
+        {store.effective_ef_search(value, search_k) for value in ef_search}
+    )
+    raised = sorted(value for value in ef_search if value < minimum)
+    if raised:
+        logger.warning(
+            f"⚠️ ef_search {raised} inférieur(s) au nombre de candidats "
+            f"({minimum}) : mesuré(s) à {minimum}."
+        )
+
+    for config in index_configs or [None]:
+        if config is None:
+            index = {"type": current_index_type()}
+        else:
+            start = time.perf_counter()
+            index = rebuild_index(**config)
+            index["build_seconds"] = round(time.perf_counter() - start, 3)
+
+        if index["type"] == "ivfflat":
+            settings_sweep = [{"probes": value} for value in probes]
+        elif index["type"] == "hnsw":
+            settings_sweep = [{"ef_search": value} for value in effective]
+        else:
+            # Pas d'index : parcours exact
+            settings_sweep = [{}]
+
+        for params in settings_sweep:
+            result = {
+                "index": index,
+                "search": params,
+                **evaluate_setting(store, queries, truths, top_k, **params),
+            }
+            results.append(result)
+            if progress is not None:
+                progress(result)
+
+    return results
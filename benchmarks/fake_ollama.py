@@ -0,0 +1,219 @@
+"""
+Serveur HTTP local imitant l'API d'Ollama utilisée par l'application, pour
+mesurer les performances sans modèle réel :
+
+- POST /api/embed : embeddings pseudo-aléatoires déterministes (même texte,
+  même vecteur), normalisés ;
+- POST /api/generate : réponse découpée en tokens, en flux NDJSON ou non ;
+- GET /api/ps et /api/tags : modèles « chargés ».
+
+Les latences (par appel d'embedding, avant le premier token, entre deux
+tokens) sont configurables.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "le modèle répond à la question à partir du contexte fourni par les "
+    "documents indexés avec une confiance élevée selon les sources citées"
+).split()
+
+
+@dataclass
+class FakeOllamaConfig:
+    dimensions: int = 768
+    # Latence d'un appel d'embedding, plus un supplément par texte du lot
+    embed_latency: float = 0.02
+    embed_latency_per_text: float = 0.002
+    # Latence avant le premier token, puis entre deux tokens
+    first_token_latency: float = 0.2
+    token_latency: float = 0.02
+    tokens: int = 64
+
+
+def pseudo_embedding(text: str, dimensions: int):
+    """
+    :return: Vecteur unitaire déterministe dérivé du texte.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def pseudo_tokens(prompt: str, count: int):
+    rng = random.Random(prompt)
+    return [rng.choice(WORDS) + " " for _ in range(count)]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self) -> FakeOllamaConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        # Pas de journal par requête pendant les mesures
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ("/api/ps", "/api/tags"):
+            expires_at = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+            models = [
+                {"name": name, "model": name, "size": 0, "expires_at": expires_at}
+                for name in self.server.models
+            ]
+            self._send_json({"models": models})
+        elif self.path == "/":
+            self._send_json({"status": "Ollama is running"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        self.server.count(self.path)
+        if self.path == "/api/embed":
+            self.embed(payload)
+        elif self.path == "/api/generate":
+            self.generate(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def embed(self, payload):
+        texts = payload.get("input", "")
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(
+            self.config.embed_latency + self.config.embed_latency_per_text * len(texts)
+        )
+        self._send_json(
+            {
+                "model": payload.get("model"),
+                "embeddings": [
+                    pseudo_embedding(text, self.config.dimensions) for text in texts
+                ],
+            }
+        )
+
+    def generate(self, payload):
+        model = payload.get("model")
+        prompt = payload.get("prompt", "")
+        # Requête de préchargement : pas de génération
+        tokens = pseudo_tokens(prompt, self.config.tokens) if prompt else []
+        final = {
+            "model": model,
+            "created_at": _now(),
+            "response": "",
+            "done": True,
+            "done_reason": "stop" if tokens else "load",
+            "context": [],
+            "eval_count": len(tokens),
+        }
+
+        if not payload.get("stream", True):
+            time.sleep(
+                self.config.first_token_latency
+                + self.config.token_latency * max(len(tokens) - 1, 0)
+            )
+            self._send_json({**final, "response": "".join(tokens)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i == 0:
+                    time.sleep(self.config.first_token_latency)
+                else:
+                    time.sleep(self.config.token_latency)
+                self._send_chunk(
+                    {
+                        "model": model,
+                        "created_at": _now(),
+                        "response": token,
+                        "done": False,
+                    }
+                )
+            self._send_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client déconnecté en cours de génération
+            self.close_connection = True
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Serveur Ollama factice, lancé dans un thread :
+
+        with FakeOllamaServer(config) as server:
+            ... settings.OLLAMA_API_URL = server.url ...
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config=None, models=(), host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.config = config or FakeOllamaConfig()
+        self.models = [name if ":" in name else f"{name}:latest" for name in models]
+        self.requests = {}
+        self._requests_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path):
+        with self._requests_lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="fake-ollama", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
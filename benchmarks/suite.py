@@ -0,0 +1,317 @@
+"""
+Scénarios de mesure de bout en bout, contre le serveur Ollama factice :
+
+- "ingestion" : envoi de documents par `DocumentViewSet.create`, latence
+  mesurée jusqu'à la fin du job d'ingestion ;
+- "query" : `query_rag`, avec le délai avant le premier token ;
+- "chat_api" : requêtes POST sur la vue asynchrone `chat_api`.
+
+Les scénarios de questions demandent un corpus : sans le scénario "ingestion",
+ou s'il n'a créé aucun chunk, des documents synthétiques sont d'abord ingérés
+hors mesure.
+
+Chaque scénario lance un nombre fixé de requêtes avec une concurrence fixée et
+produit le débit et les percentiles de latence, à comparer entre commits.
+"""
+
+import json
+import logging
+import random
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import close_old_connections
+from django.test import RequestFactory, override_settings
+from rest_framework.test import APIRequestFactory
+
+from rag.ingestion import run_pending_jobs
+from rag.models import Chunk, IngestionJob
+from rag.ollama_client import reset_clients
+from rag.query_data import query_rag
+from rag.views import chat_api
+from rag.viewsets import DocumentViewSet
+
+from .fake_ollama import FakeOllamaConfig, FakeOllamaServer
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("ingestion", "query", "chat_api")
+
+QUESTIONS = [
+    "Quel est le sujet principal du document ?",
+    "Quelles sont les étapes décrites dans la procédure ?",
+    "Quels résultats sont présentés en conclusion ?",
+    "Qui est responsable de la validation ?",
+    "Quelles contraintes sont mentionnées ?",
+]
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """
+    :param latencies: Durées des requêtes réussies, en secondes.
+    :param wall_seconds: Durée totale du scénario.
+    :param errors: Nombre de requêtes en erreur.
+    :return: Dictionnaire du débit et des latences en millisecondes.
+    """
+    values = np.asarray(latencies, dtype=float) * 1000
+    count = len(latencies)
+    summary = {
+        "requests": count + errors,
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(count / wall_seconds, 3) if wall_seconds else 0.0,
+    }
+    if count:
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary["latency_ms"] = {
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "mean": round(float(values.mean()), 2),
+            "max": round(float(values.max()), 2),
+        }
+    return summary
+
+
+def run_concurrently(task, count, concurrency):
+    """
+    Exécute `task(i)` pour i dans [0, count) avec `concurrency` threads.
+
+    :return: Liste des résultats (None pour une requête en erreur), durée totale.
+    """
+
+    def guarded(i):
+        try:
+            return task(i)
+        except Exception as e:
+            logger.error(f"❌ Requête de benchmark {i} en erreur: {str(e)}")
+            return None
+        finally:
+            close_old_connections()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(guarded, range(count)))
+    return results, time.perf_counter() - start
+
+
+def synthetic_text(index, paragraphs):
+    """
+    Texte déterministe d'environ 600 caractères par paragraphe.
+    """
+    rng = random.Random(index)
+    words = (
+        "document procédure résultat analyse contrainte validation étape "
+        "responsable conclusion rapport mesure qualité projet équipe données"
+    ).split()
+    return "\n\n".join(
+        " ".join(rng.choice(words) for _ in range(80)).capitalize() + "."
+        for _ in range(paragraphs)
+    )
+
+
+def upload_document(view, factory, index, paragraphs):
+    """
+    Envoie un document synthétique par `DocumentViewSet.create`.
+
+    :return: Identifiant du job d'ingestion créé.
+    """
+    upload = SimpleUploadedFile(
+        f"bench_{uuid.uuid4().hex}.txt",
+        synthetic_text(index, paragraphs).encode("utf-8"),
+        content_type="text/plain",
+    )
+    response = view(factory.post("/api/document/", {"file": upload}))
+    if response.status_code != 202:
+        raise RuntimeError(response.data)
+    return response.data["job"]["id"]
+
+
+def wait_for_job(job_id, poll_interval=0.05):
+    """
+    Attend la fin d'un job d'ingestion.
+
+    :return: Le job terminé.
+    :raises RuntimeError: Si le job a échoué.
+    """
+    finished = (IngestionJob.Status.DONE, IngestionJob.Status.FAILED)
+    while (job := IngestionJob.objects.get(pk=job_id)).status not in finished:
+        time.sleep(poll_interval)
+    if job.status == IngestionJob.Status.FAILED:
+        raise RuntimeError(job.error)
+    return job
+
+
+def bench_ingestion(count, concurrency, paragraphs=20, poll_interval=0.05):
+    if settings.INGESTION_WORKERS <= 0:
+        raise RuntimeError(
+            "Le scénario d'ingestion demande des workers en processus "
+            "(INGESTION_WORKERS > 0)."
+        )
+    factory = APIRequestFactory()
+    view = DocumentViewSet.as_view({"post": "create"})
+
+    def ingest(i):
+        start = time.perf_counter()
+        job_id = upload_document(view, factory, i, paragraphs)
+        # Attendre la fin du job traité par les workers d'ingestion
+        job = wait_for_job(job_id, poll_interval)
+        return time.perf_counter() - start, job.chunks_total
+
+    results, wall = run_concurrently(ingest, count, concurrency)
+    done = [result for result in results if result is not None]
+    chunks = sum(chunk_count for _, chunk_count in done)
+    summary = summarize(
+        [latency for latency, _ in done], wall, errors=len(results) - len(done)
+    )
+    summary["chunks"] = chunks
+    summary["chunks_per_s"] = round(chunks / wall, 3) if wall else 0.0
+    return summary
+
+
+def seed_documents(count, paragraphs=20):
+    """
+    Ingère des documents synthétiques, hors mesure, pour que les scénarios de
+    questions cherchent dans un vrai corpus au lieu de mesurer la réponse
+    immédiate "aucun document". Les jobs sont traités dans ce thread s'il n'y a
+    pas de workers en processus.
+
+    :return: Nombre de chunks en base.
+    :raises RuntimeError: Si aucun chunk n'a été créé.
+    """
+    factory = APIRequestFactory()
+    view = DocumentViewSet.as_view({"post": "create"})
+    job_ids = [upload_document(view, factory, i, paragraphs) for i in range(count)]
+    run_pending_jobs()
+    for job_id in job_ids:
+        wait_for_job(job_id)
+
+    chunks = Chunk.objects.count()
+    if not chunks:
+        raise RuntimeError("Aucun chunk créé pour les scénarios de questions.")
+    logger.info(f"✅ Corpus de benchmark : {count} documents, {chunks} chunks.")
+    return chunks
+
+
+def bench_query(count, concurrency):
+    def ask(i):
+        # Questions distinctes : pas de réponse servie par les caches
+        start = time.perf_counter()
+        response_generator, _ = query_rag(f"{QUESTIONS[i % len(QUESTIONS)]} ({i})")
+        first_token = None
+        for _ in response_generator:
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        return time.perf_counter() - start, first_token
+
+    results, wall = run_concurrently(ask, count, concurrency)
+    done = [result for result in results if result is not None]
+    summary = summarize(
+        [total for total, _ in done], wall, errors=len(results) - len(done)
+    )
+    ttft = [first for _, first in done if first is not None]
+    if ttft:
+        summary["time_to_first_token_ms"] = summarize(ttft, wall)["latency_ms"]
+    return summary
+
+
+def bench_chat_api(count, concurrency):
+    factory = RequestFactory()
+
+    def chat(i):
+        request = factory.post(
+            "/api/chat/",
+            json.dumps(
+                {
+                    "query": f"{QUESTIONS[i % len(QUESTIONS)]} ({i})",
+                    "uuid": uuid.uuid4().hex,
+                }
+            ),
+            content_type="application/json",
+        )
+        start = time.perf_counter()
+        # Vue asynchrone, exécutée dans une boucle propre à ce thread
+        response = async_to_sync(chat_api)(request)
+        if response.status_code != 200:
+            raise RuntimeError(response.content.decode("utf-8"))
+        return time.perf_counter() - start
+
+    results, wall = run_concurrently(chat, count, concurrency)
+    done = [result for result in results if result is not None]
+    return summarize(done, wall, errors=len(results) - len(done))
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(
+    scenarios=SCENARIOS,
+    requests=20,
+    concurrency=4,
+    documents=10,
+    paragraphs=20,
+    config=None,
+):
+    """
+    Lance les scénarios demandés contre un serveur Ollama factice. Les caches
+    de réponses sont désactivés pour mesurer le pipeline complet.
+
+    :return: Rapport JSON-sérialisable.
+    """
+    config = config or FakeOllamaConfig()
+    report = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "requests": requests,
+            "concurrency": concurrency,
+            "documents": documents,
+            "paragraphs": paragraphs,
+            "fake_ollama": vars(config),
+            "retrieval_mode": settings.RETRIEVAL_MODE,
+            "vector_store": settings.VECTOR_STORE_BACKEND,
+            "mmr": settings.MMR_ENABLED,
+        },
+        "scenarios": {},
+    }
+
+    models = [settings.LANGUAGE_MODEL_NAME, settings.EMBEDDING_MODEL_NAME]
+    with FakeOllamaServer(config, models=models) as server:
+        with override_settings(OLLAMA_API_URL=server.url, ANSWER_CACHE_ENABLED=False):
+            reset_clients()
+            try:
+                if "ingestion" in scenarios:
+                    report["scenarios"]["ingestion"] = bench_ingestion(
+                        documents, concurrency, paragraphs
+                    )
+                asks = {"query", "chat_api"} & set(scenarios)
+                if asks and not Chunk.objects.exists():
+                    # Corpus non ingéré par le scénario "ingestion"
+                    report["seeded_chunks"] = seed_documents(documents, paragraphs)
+                if "query" in scenarios:
+                    report["scenarios"]["query"] = bench_query(requests, concurrency)
+                if "chat_api" in scenarios:
+                    report["scenarios"]["chat_api"] = bench_chat_api(
+                        requests, concurrency
+                    )
+            finally:
+                reset_clients()
+        report["ollama_requests"] = dict(server.requests)
+
+    return report
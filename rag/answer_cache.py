@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from .models import CachedAnswer, Document
+
+logger = logging.getLogger(__name__)
+
+# Dernière suppression des entrées expirées par ce processus
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def find_cached_answer(query_embedding):
+    """
+    Cherche la question en cache la plus proche (distance cosinus, index HNSW).
+
+    :param query_embedding: Embedding de la nouvelle question.
+    :return: L'entrée si sa similarité atteint `ANSWER_CACHE_THRESHOLD`, sinon None.
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+
+    entries = CachedAnswer.objects.filter(
+        embedding_model=settings.EMBEDDING_MODEL_NAME,
+        language_model=settings.LANGUAGE_MODEL_NAME,
+    )
+    if settings.ANSWER_CACHE_TTL:
+        oldest = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+        entries = entries.filter(created_at__gte=oldest)
+
+    # Trier sur la distance elle-même pour que l'index HNSW soit utilisé
+    entry = (
+        entries.annotate(
+            similarity=1 - CosineDistance("question_embedding", query_embedding)
+        )
+        .order_by(CosineDistance("question_embedding", query_embedding))
+        .first()
+    )
+    if entry is None or entry.similarity < settings.ANSWER_CACHE_THRESHOLD:
+        return None
+
+    CachedAnswer.objects.filter(pk=entry.pk).update(hits=F("hits") + 1)
+    logger.info(
+        f"✅ Réponse en cache réutilisée (similarité {entry.similarity:.3f}) "
+        f"pour '{entry.question[:80]}'."
+    )
+    return entry
+
+
+def store_answer(question, query_embedding, answer, sources, chunks):
+    """
+    Enregistre une réponse générée et les documents dont elle dépend.
+
+    :param question: Question posée.
+    :param query_embedding: Embedding de la question.
+    :param answer: Réponse complète du modèle.
+    :param sources: Sources affichées avec la réponse.
+    :param chunks: Chunks utilisés comme contexte.
+    :return: L'entrée créée, ou None si le cache est désactivé.
+    """
+    if not settings.ANSWER_CACHE_ENABLED or not answer:
+        return None
+
+    entry = CachedAnswer.objects.create(
+        question=question,
+        question_embedding=query_embedding,
+        answer=answer,
+        sources=sources,
+        chunk_ids=[chunk.id for chunk in chunks],
+        embedding_model=settings.EMBEDDING_MODEL_NAME,
+        language_model=settings.LANGUAGE_MODEL_NAME,
+    )
+    entry.documents.set({chunk.document_id for chunk in chunks})
+    prune_expired_answers()
+    return entry
+
+
+def prune_expired_answers(force=False):
+    """
+    Supprime les réponses plus anciennes que `ANSWER_CACHE_TTL`. Appelée après
+    chaque enregistrement, elle n'agit qu'une fois par
+    `ANSWER_CACHE_PRUNE_INTERVAL` secondes et par processus.
+
+    :param force: Supprimer sans tenir compte de l'intervalle.
+    :return: Nombre d'entrées supprimées.
+    """
+    global _last_prune
+    if not settings.ANSWER_CACHE_TTL:
+        return 0
+    with _prune_lock:
+        now = time.monotonic()
+        if not force and now - _last_prune < settings.ANSWER_CACHE_PRUNE_INTERVAL:
+            return 0
+        _last_prune = now
+
+    oldest = timezone.now() - timedelta(seconds=settings.ANSWER_CACHE_TTL)
+    _, per_model = CachedAnswer.objects.filter(created_at__lt=oldest).delete()
+    deleted = per_model.get(CachedAnswer._meta.label, 0)
+    if deleted:
+        logger.info(f"✅ {deleted} réponse(s) expirée(s) supprimée(s) du cache.")
+    return deleted
+
+
+def caching_stream(response_generator, question, query_embedding, sources, chunks):
+    """
+    Relaie le flux de réponse du modèle et, une fois la génération terminée
+    normalement, l'enregistre dans le cache.
+
+    :return: Générateur des morceaux de réponse.
+    """
+    parts = []
+    for part in response_generator:
+        parts.append(part)
+        yield part
+
+    try:
+        store_answer(question, query_embedding, "".join(parts), sources, chunks)
+    except Exception as e:
+        logger.error(f"❌ Erreur d'enregistrement de la réponse en cache: {str(e)}")
+
+
+async def acaching_stream(
+    response_generator, question, query_embedding, sources, chunks
+):
+    """
+    Variante asyncio de `caching_stream`. Si la tâche est annulée (client
+    déconnecté), le flux vers Ollama est fermé, ce qui interrompt la génération,
+    et rien n'est mis en cache.
+
+    :return: Générateur asynchrone des morceaux de réponse.
+    """
+    parts = []
+    try:
+        async for part in response_generator:
+            parts.append(part)
+            yield part
+    finally:
+        await response_generator.aclose()
+
+    try:
+        await sync_to_async(store_answer)(
+            question, query_embedding, "".join(parts), sources, chunks
+        )
+    except Exception as e:
+        logger.error(f"❌ Erreur d'enregistrement de la réponse en cache: {str(e)}")
+
+
+def invalidate_documents(document_ids):
+    """
+    Supprime les réponses en cache construites à partir de ces documents.
+
+    :param document_ids: Identifiants des documents supprimés ou ré-ingérés.
+    :return: Nombre d'entrées supprimées.
+    """
+    _, per_model = CachedAnswer.objects.filter(documents__in=document_ids).delete()
+    deleted = per_model.get(CachedAnswer._meta.label, 0)
+    if deleted:
+        logger.info(f"✅ {deleted} réponse(s) en cache invalidée(s).")
+    return deleted
+
+
+@receiver(pre_delete, sender=Document)
+def invalidate_deleted_document(sender, instance, **kwargs):
+    invalidate_documents([instance.pk])
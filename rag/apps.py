@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RagConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "rag"
+
+    def ready(self):
+        # Enregistre les réactions à la suppression d'un document : invalidation du
+        # cache de réponses, nouvel ajustement des projections 3D et retrait du
+        # backend vectoriel
+        from . import answer_cache, projections, vector_store  # noqa: F401
@@ -0,0 +1,143 @@
+"""
+Construction du contexte envoyé au modèle, dans un budget de tokens.
+
+Les chunks consécutifs d'une même page (`chunk_index` qui se suivent) sont
+fusionnés en un passage, en retirant le texte répété par le chevauchement du
+découpage. Les passages sont ensuite ajoutés par ordre de pertinence jusqu'à
+`CONTEXT_TOKEN_BUDGET` ; le dernier est coupé à la fin d'une phrase.
+
+Le nombre de tokens est estimé à partir du nombre de caractères
+(`CONTEXT_CHARS_PER_TOKEN`), le tokenizer du modèle Ollama n'étant pas
+disponible côté Django.
+"""
+
+import math
+import re
+
+from django.conf import settings
+
+SEPARATOR = "\n\n---\n\n"
+
+# Fin de phrase : ponctuation finale suivie d'un blanc
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text: str):
+    """
+    :return: Nombre de tokens estimé du texte.
+    """
+    return math.ceil(len(text) / settings.CONTEXT_CHARS_PER_TOKEN)
+
+
+def merge_overlap(previous: str, following: str, max_overlap=None, min_overlap=None):
+    """
+    Concatène deux chunks consécutifs sans répéter leur chevauchement : le plus
+    long suffixe de `previous` qui est aussi un préfixe de `following`. Le
+    chevauchement doit compter au moins `min_overlap` caractères et commencer
+    au début d'un mot de `previous`, comme ceux du découpage ; sinon les deux
+    textes sont simplement séparés par un retour à la ligne.
+
+    :param max_overlap: Chevauchement maximal recherché, en caractères.
+    :param min_overlap: Chevauchement minimal retenu, en caractères.
+    :return: Texte fusionné.
+    """
+    max_overlap = min(
+        max_overlap or settings.CONTEXT_MAX_OVERLAP, len(previous), len(following)
+    )
+    if min_overlap is None:
+        min_overlap = settings.CONTEXT_MIN_OVERLAP
+    for size in range(max_overlap, max(min_overlap, 1) - 1, -1):
+        start = len(previous) - size
+        if (start == 0 or previous[start - 1].isspace()) and previous.endswith(
+            following[:size]
+        ):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def merge_adjacent(chunks):
+    """
+    Regroupe les chunks consécutifs d'une même page en passages.
+
+    :param chunks: Chunks, du plus pertinent au moins pertinent.
+    :return: Liste de passages `{"text", "chunks", "rank"}`, triés par rang
+        (meilleur rang de leurs chunks).
+    """
+    ranked = {chunk.id: rank for rank, chunk in enumerate(chunks)}
+    ordered = sorted(
+        chunks, key=lambda chunk: (chunk.document_id, chunk.page, chunk.chunk_index)
+    )
+
+    passages = []
+    for chunk in ordered:
+        last = passages[-1]["chunks"][-1] if passages else None
+        if (
+            last is not None
+            and last.document_id == chunk.document_id
+            and last.page == chunk.page
+            and last.chunk_index + 1 == chunk.chunk_index
+        ):
+            passage = passages[-1]
+            passage["text"] = merge_overlap(passage["text"], chunk.content)
+            passage["chunks"].append(chunk)
+            passage["rank"] = min(passage["rank"], ranked[chunk.id])
+        else:
+            passages.append(
+                {"text": chunk.content, "chunks": [chunk], "rank": ranked[chunk.id]}
+            )
+
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+def truncate_sentences(text: str, max_tokens: int):
+    """
+    Garde le plus long début du texte formé de phrases entières tenant dans
+    `max_tokens`.
+
+    :return: Texte tronqué (vide si aucune phrase ne tient).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * settings.CONTEXT_CHARS_PER_TOKEN
+    kept = ""
+    for match in SENTENCE_END.finditer(text):
+        if match.start() > max_chars:
+            break
+        kept = text[: match.start()]
+    return kept
+
+
+def build_context(chunks, token_budget=None):
+    """
+    Construit le contexte à partir des chunks récupérés.
+
+    :param chunks: Chunks, du plus pertinent au moins pertinent.
+    :param token_budget: Budget de tokens (par défaut `CONTEXT_TOKEN_BUDGET`).
+    :return: Dictionnaire avec `text` (contexte), `tokens` (estimation) et
+        `chunks` (chunks effectivement utilisés, passage par passage).
+    """
+    token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+    separator_tokens = estimate_tokens(SEPARATOR)
+
+    parts = []
+    used = []
+    tokens = 0
+    for passage in merge_adjacent(chunks):
+        remaining = token_budget - tokens - (separator_tokens if parts else 0)
+        if remaining <= 0:
+            break
+        text = truncate_sentences(passage["text"], remaining)
+        if not text and not parts:
+            # Aucune phrase entière ne tient : couper au dernier mot qui tient
+            max_chars = remaining * settings.CONTEXT_CHARS_PER_TOKEN
+            text = passage["text"][:max_chars].rsplit(" ", 1)[0]
+        if not text:
+            break
+        parts.append(text)
+        used.extend(passage["chunks"])
+        tokens += estimate_tokens(text) + (separator_tokens if len(parts) > 1 else 0)
+        if text != passage["text"]:
+            # Budget atteint
+            break
+
+    return {"text": SEPARATOR.join(parts), "tokens": tokens, "chunks": used}
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def normalize_text(text: str):
+    """
+    Normalise une requête pour que les variantes triviales (casse, espaces,
+    formes Unicode) partagent la même entrée de cache.
+
+    :param text: Texte brut.
+    :return: Texte normalisé.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    Cache des embeddings de requêtes : LRU en mémoire borné en taille et en durée,
+    éventuellement doublé d'un cache Django partagé entre les workers.
+    Les clés incluent le nom du modèle d'embedding.
+    """
+
+    def __init__(self, max_size, ttl, alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._model_name = None
+        self._lock = threading.Lock()
+
+    def make_key(self, model_name: str, text: str):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"rag:embedding:{model_name}:{digest}"
+
+    def _shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def _check_model(self, model_name: str):
+        # Invalider le cache local si le modèle d'embedding a changé
+        if model_name != self._model_name:
+            self._entries.clear()
+            self._model_name = model_name
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        embedding, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return embedding
+
+    def _set_local(self, key, embedding):
+        self._entries[key] = (embedding, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _record(self, embedding):
+        if embedding is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def get(self, model_name: str, text: str):
+        """
+        Retourne l'embedding en cache, ou None.
+        """
+        key = self.make_key(model_name, text)
+        with self._lock:
+            self._check_model(model_name)
+            embedding = self._get_local(key)
+
+        shared = self._shared()
+        if embedding is None and shared is not None:
+            embedding = shared.get(key)
+            if embedding is not None:
+                with self._lock:
+                    self._set_local(key, embedding)
+
+        with self._lock:
+            self._record(embedding)
+        return embedding
+
+    def set(self, model_name: str, text: str, embedding):
+        """
+        Enregistre un embedding dans le cache local et le cache partagé.
+        """
+        key = self.make_key(model_name, text)
+        with self._lock:
+            self._check_model(model_name)
+            self._set_local(key, embedding)
+
+        shared = self._shared()
+        if shared is not None:
+            shared.set(key, embedding, timeout=self.ttl)
+
+    async def aget(self, model_name: str, text: str):
+        """
+        Variante asyncio de `get`.
+        """
+        key = self.make_key(model_name, text)
+        with self._lock:
+            self._check_model(model_name)
+            embedding = self._get_local(key)
+
+        shared = self._shared()
+        if embedding is None and shared is not None:
+            embedding = await shared.aget(key)
+            if embedding is not None:
+                with self._lock:
+                    self._set_local(key, embedding)
+
+        with self._lock:
+            self._record(embedding)
+        return embedding
+
+    async def aset(self, model_name: str, text: str, embedding):
+        """
+        Variante asyncio de `set`.
+        """
+        key = self.make_key(model_name, text)
+        with self._lock:
+            self._check_model(model_name)
+            self._set_local(key, embedding)
+
+        shared = self._shared()
+        if shared is not None:
+            await shared.aset(key, embedding, timeout=self.ttl)
+
+    def clear(self):
+        """
+        Vide le cache local et remet les compteurs à zéro.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        :return: Compteurs de hits/misses et taille courante du cache local.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+query_embedding_cache = EmbeddingCache(
+    max_size=settings.EMBEDDING_CACHE_SIZE,
+    ttl=settings.EMBEDDING_CACHE_TTL,
+    alias=settings.EMBEDDING_CACHE_ALIAS,
+)
@@ -1,26 +1,77 @@
 from django.conf import settings
 from httpx import ConnectError
-from langchain_ollama import OllamaEmbeddings
+
+from .embedding_cache import query_embedding_cache
+from .ollama_client import get_embeddings
+from .scheduler import INGESTION, QUERY, get_scheduler
 
 
 def embed_query(text: str):
     """
     Génère un embedding pour le texte donné.
+    Les requêtes déjà vues sont servies par le cache d'embeddings.
+
+    :param text: Texte à encoder.
+    :return: Embedding du texte.
+    """
+    model_name = settings.EMBEDDING_MODEL_NAME
+    embedding = query_embedding_cache.get(model_name, text)
+    if embedding is not None:
+        return embedding
+
+    # Fonction d'embedding partagée (connexions keep-alive réutilisées)
+    embeddings = get_embeddings()
+
+    try:
+        # Priorité aux questions sur l'ingestion
+        with get_scheduler().slot(QUERY):
+            embedding = embeddings.embed_query(text)
+    except ConnectError:
+        raise ConnectError("❌ Erreur de connexion impossible d'accéder à Ollama.")
+
+    query_embedding_cache.set(model_name, text, embedding)
+    return embedding
+
+
+def embed_documents(texts: list[str]):
+    """
+    Génère les embeddings d'une liste de textes en un seul appel à Ollama,
+    dans la classe de priorité de l'ingestion.
+
+    :param texts: Textes à encoder.
+    :return: Liste des embeddings, dans le même ordre que les textes.
+    """
+    if not texts:
+        return []
+
+    embeddings = get_embeddings()
+
+    try:
+        with get_scheduler().slot(INGESTION):
+            return embeddings.embed_documents(texts)
+    except ConnectError:
+        raise ConnectError("❌ Erreur de connexion impossible d'accéder à Ollama.")
+
+
+async def aembed_query(text: str):
+    """
+    Variante asyncio d'`embed_query`.
 
     :param text: Texte à encoder.
     :return: Embedding du texte.
     """
     model_name = settings.EMBEDDING_MODEL_NAME
+    embedding = await query_embedding_cache.aget(model_name, text)
+    if embedding is not None:
+        return embedding
 
-    # Initialiser la fonction d'embedding avec le modèle donné
-    embeddings = OllamaEmbeddings(
-        model=model_name,
-        base_url=settings.OLLAMA_API_URL,
-    )
+    embeddings = get_embeddings()
 
     try:
-        embedding = embeddings.embed_query(text)
+        async with get_scheduler().aslot(QUERY):
+            embedding = await embeddings.aembed_query(text)
     except ConnectError:
         raise ConnectError("❌ Erreur de connexion impossible d'accéder à Ollama.")
 
+    await query_embedding_cache.aset(model_name, text, embedding)
     return embedding
@@ -1,12 +1,11 @@
 import numpy as np
 import plotly.graph_objects as go
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-from umap import UMAP
+from django.conf import settings
 
 from .embedding_function import embed_query
 from .models import Chunk
-from .query_data import get_similar_chunks
+from .projections import get_projections, project_query
+from .vector_store import get_vector_store
 
 
 def generate_3d_figure(
@@ -52,8 +51,8 @@ def generate_3d_figure(
                 size=4,
                 color=similarities,
                 colorscale="Viridis",
-                cmin=min(similarities),
-                cmax=max(similarities),
+                cmin=min(similarities, default=0),
+                cmax=max(similarities, default=1),
                 colorbar=dict(title="Sim cosinus - Higher is better"),
             ),
             name="Chunks similaires",
@@ -69,21 +68,91 @@ def generate_3d_figure(
     return fig
 
 
+def fetch_embedding_matrix():
+    """
+    Récupère les identifiants et embeddings de tous les chunks depuis le backend
+    vectoriel (une requête avec pgvector, le fichier mappé avec NumPy).
+
+    :return: Tableau des identifiants (triés) et matrice (n, dim) des embeddings.
+    """
+    return get_vector_store().all_vectors()
+
+
+def cosine_scores(matrix, query_embedding):
+    """
+    Similarités cosinus entre la requête et chaque ligne de la matrice.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1.0
+    return matrix @ query / norms
+
+
+def level_of_detail(scores, keep_count, max_points, strata=10, seed=42):
+    """
+    Sélectionne les points à afficher : les `keep_count` meilleurs scores sont
+    tous conservés, les autres sont échantillonnés par strates de score pour ne
+    pas dépasser `max_points` (0 : pas de limite).
+
+    :param scores: Similarités cosinus de tous les chunks.
+    :param keep_count: Nombre de meilleurs chunks toujours affichés.
+    :param max_points: Nombre maximal de points affichés.
+    :param strata: Nombre de strates (quantiles de score) pour l'échantillonnage.
+    :param seed: Graine, pour un rendu stable d'une requête à l'autre.
+    :return: Positions des chunks conservés (triées par score) et échantillonnés.
+    """
+    order = np.argsort(-scores)
+    kept = order[:keep_count]
+    rest = order[keep_count:]
+
+    budget = max_points - len(kept) if max_points else len(rest)
+    if budget >= len(rest):
+        return kept, rest
+    if budget <= 0:
+        return kept, rest[:0]
+
+    # `rest` étant trié par score, des tranches contiguës sont des quantiles
+    rng = np.random.default_rng(seed)
+    sampled = []
+    for stratum in np.array_split(rest, strata):
+        size = min(len(stratum), round(budget * len(stratum) / len(rest)))
+        if size:
+            sampled.append(rng.choice(stratum, size=size, replace=False))
+    return kept, np.concatenate(sampled) if sampled else rest[:0]
+
+
+def projected_rows(bundle, ids):
+    """
+    Positions dans les projections des chunks donnés ; les chunks plus récents
+    que les projections sont ignorés.
+
+    :return: Positions dans les projections et masque des chunks projetés.
+    """
+    bundle_ids = bundle["ids"]
+    positions = np.searchsorted(bundle_ids, ids)
+    clipped = np.minimum(positions, len(bundle_ids) - 1)
+    found = (positions < len(bundle_ids)) & (bundle_ids[clipped] == ids)
+    return positions[found], found
+
+
 def display_cos_sim_in_3D(query_text: str, k: int = 5):
     """
-    Calcule les projections PCA, t-SNE, UMAP 3D des embeddings, met en avant la requête,
+    Affiche les projections PCA, t-SNE, UMAP 3D des embeddings, met en avant la requête,
     les chunks similaires et non similaires. Retourne les HTML des 3 graphiques interactifs Plotly,
     ainsi que la liste des meilleurs chunks.
 
+    Les projections du corpus sont ajustées une fois par version du corpus
+    (voir rag/projections.py) : seule la requête est projetée ici. Les scores
+    sont calculés en NumPy sur une seule lecture des embeddings, et le nombre
+    de points affichés est borné par `VIEW_3D_MAX_POINTS`.
+
     :param query_text: Texte de la requête utilisateur.
     :param k: Nombre de chunks similaires à récupérer.
     """
-    # Récupérer tous les chunks et leurs embeddings
-    chunks = list(Chunk.objects.all())
-    all_embeddings = [chunk.embedding for chunk in chunks]
-    len_all_embeddings = len(all_embeddings)
+    # Récupérer en une fois les identifiants et embeddings de tous les chunks
+    ids, matrix = fetch_embedding_matrix()
 
-    if len_all_embeddings == 0:
+    if len(ids) == 0:
         return (
             "<h1 style='color:red'>Pas de fichier ajouté à l'app pour le moment</h1>",
             "<h1 style='color:red'>Pas de fichier</h1>",
@@ -91,88 +160,67 @@ def display_cos_sim_in_3D(query_text: str, k: int = 5):
             [],
         )
 
-    # Embedding de la requête
+    # Embedding de la requête et similarités
     query_embedding = embed_query(query_text)
-
-    # Conversion en np.array
-    all_embeddings_array = np.array(all_embeddings)
-    query_embedding_array = np.array([query_embedding])
-    all_embeddings_with_query = np.concatenate(
-        [all_embeddings_array, query_embedding_array], axis=0
+    scores = cosine_scores(matrix, query_embedding)
+    del matrix
+
+    # Meilleurs chunks et voisins affichés en dégradé, autres chunks échantillonnés
+    kept, sampled = level_of_detail(
+        scores,
+        max(k, settings.VIEW_3D_NEIGHBORS),
+        settings.VIEW_3D_MAX_POINTS,
+        settings.VIEW_3D_STRATA,
     )
 
-    # Récupérer les chunks similaires
-    similar_chunks = get_similar_chunks(query_embedding, len_all_embeddings - 1)
-    similar_chunk_ids = {chunk.id for chunk in similar_chunks}
-    best_chunks = similar_chunks[:k]
-
-    # Séparer les chunks non similaires
-    non_similar_chunks = [c for c in chunks if c.id not in similar_chunk_ids]
-
-    # Embeddings similaires et non similaires en np.array
-    embeddings_similar = np.array([c.embedding for c in similar_chunks])
-    embeddings_non_similar = np.array([c.embedding for c in non_similar_chunks])
-    similarities = [c.similarity for c in similar_chunks]
-
-    # ---- PROJECTION PCA ----
-    pca = PCA(n_components=3)
-    pca.fit(all_embeddings_with_query)
-    reduced_similar_pca = pca.transform(embeddings_similar)
-    reduced_non_similar_pca = pca.transform(embeddings_non_similar)
-    reduced_query_pca = pca.transform(query_embedding_array)
-
-    fig_pca = generate_3d_figure(
-        reduced_query_pca,
-        reduced_similar_pca,
-        reduced_non_similar_pca,
-        similarities,
-        "Projection PCA 3D",
-    )
-    graph_html_pca = fig_pca.to_html(full_html=False)
-
-    # ---- PROJECTION t-SNE ----
-    # On reconstruit l'ensemble dans l'ordre: similaires, non similaires, requête
-    all_data_tsne = np.concatenate(
-        [embeddings_similar, embeddings_non_similar, query_embedding_array], axis=0
-    )
-    tsne = TSNE(n_components=3, perplexity=30, random_state=42)
-    all_data_tsne = tsne.fit_transform(all_data_tsne)
-
-    reduced_similar_tsne = all_data_tsne[: len(similar_chunks)]
-    reduced_non_similar_tsne = all_data_tsne[
-        len(similar_chunks) : len(similar_chunks) + len(non_similar_chunks)
-    ]
-    reduced_query_tsne = all_data_tsne[-1:].reshape(1, 3)
-
-    fig_tsne = generate_3d_figure(
-        reduced_query_tsne,
-        reduced_similar_tsne,
-        reduced_non_similar_tsne,
-        similarities,
-        "Projection t-SNE 3D",
+    # Meilleurs chunks, pour la liste affichée sous les graphiques
+    top = kept[:k]
+    chunks_by_id = Chunk.objects.select_related("document").in_bulk(ids[top].tolist())
+    best_chunks = []
+    for position in top:
+        chunk = chunks_by_id[int(ids[position])]
+        chunk.similarity = float(scores[position])
+        best_chunks.append(chunk)
+
+    # Projections du corpus (éventuellement d'une version précédente)
+    bundle = get_projections()
+    if bundle is None:
+        return (
+            "<h1 style='color:orange'>Projections 3D en cours de calcul, "
+            "réessayez dans quelques instants</h1>",
+            "<h1 style='color:orange'>Projections en cours de calcul</h1>",
+            "<h1 style='color:orange'>Projections en cours de calcul</h1>",
+            best_chunks,
+        )
+    rows_similar, found_similar = projected_rows(bundle, ids[kept])
+    rows_non_similar, _ = projected_rows(bundle, ids[sampled])
+    similarities = scores[kept][found_similar].tolist()
+
+    # Projection de la requête
+    reduced_query_pca, reduced_query_tsne, reduced_query_umap = project_query(
+        bundle,
+        query_embedding,
+        ids[top].tolist(),
+        scores[top].tolist(),
     )
-    graph_html_tsne = fig_tsne.to_html(full_html=False)
 
-    # ---- PROJECTION UMAP ----
-    all_data_umap = np.concatenate(
-        [embeddings_similar, embeddings_non_similar, query_embedding_array], axis=0
-    )
-    umap_model = UMAP(n_components=3, random_state=42)
-    all_data_umap = umap_model.fit_transform(all_data_umap)
-
-    reduced_similar_umap = all_data_umap[: len(similar_chunks)]
-    reduced_non_similar_umap = all_data_umap[
-        len(similar_chunks) : len(similar_chunks) + len(non_similar_chunks)
-    ]
-    reduced_query_umap = all_data_umap[-1:].reshape(1, 3)
-
-    fig_umap = generate_3d_figure(
-        reduced_query_umap,
-        reduced_similar_umap,
-        reduced_non_similar_umap,
-        similarities,
-        "Projection UMAP 3D",
-    )
-    graph_html_umap = fig_umap.to_html(full_html=False)
+    graphs_html = []
+    for title, coords, reduced_query in (
+        ("Projection PCA 3D", bundle["pca_coords"], reduced_query_pca),
+        ("Projection t-SNE 3D", bundle["tsne_coords"], reduced_query_tsne),
+        ("Projection UMAP 3D", bundle["umap_coords"], reduced_query_umap),
+    ):
+        fig = generate_3d_figure(
+            reduced_query,
+            coords[rows_similar].reshape(-1, 3),
+            coords[rows_non_similar].reshape(-1, 3),
+            similarities,
+            title,
+        )
+        # plotly.js n'est inclus qu'une fois dans la page
+        graphs_html.append(
+            fig.to_html(full_html=False, include_plotlyjs=not graphs_html)
+        )
 
+    graph_html_pca, graph_html_tsne, graph_html_umap = graphs_html
     return graph_html_pca, graph_html_tsne, graph_html_umap, best_chunks
@@ -0,0 +1,325 @@
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django_eventstream import send_event
+
+from .answer_cache import invalidate_documents
+from .metrics import (
+    INGESTION_STAGE_SECONDS,
+    log_timings,
+    record,
+    start_tracking,
+    stop_tracking,
+)
+from .models import Chunk, Document, IngestionJob
+from .parsing import page_windows, parse_window
+from .populate_database import ingest_chunks
+from .projections import schedule_refit
+from .vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Espace des verrous consultatifs PostgreSQL des jobs (clé : identifiant du job)
+JOB_LOCK_NAMESPACE = 7301
+
+_executor = None
+_parse_pool = None
+_executor_lock = threading.Lock()
+
+
+def get_parse_pool():
+    global _parse_pool
+    with _executor_lock:
+        if _parse_pool is None:
+            # "spawn" : le processus web est multi-thread, fork n'est pas sûr
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=settings.INGESTION_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _parse_pool
+
+
+def iter_parsed_chunks(document: Document):
+    """
+    Lit et découpe un document dans le pool de processus, par plages de pages
+    (`INGESTION_PARSE_WINDOW`). Les plages d'un même fichier, comme celles de
+    fichiers différents, sont traitées en parallèle ; le nombre de plages en
+    cours par fichier est borné pour garder une mémoire constante.
+
+    :param document: Document à découper.
+    :return: Générateur de chunks, dans l'ordre des pages.
+    """
+    file_path = document.file.path
+    windows = page_windows(file_path, settings.INGESTION_PARSE_WINDOW)
+    pool = get_parse_pool()
+    in_flight = deque()
+
+    def window_chunks(future):
+        chunks, timings = future.result()
+        if settings.METRICS_ENABLED:
+            for stage, seconds in timings.items():
+                record(INGESTION_STAGE_SECONDS, stage, seconds)
+        return chunks
+
+    for start, stop in windows:
+        in_flight.append(pool.submit(parse_window, file_path, start, stop))
+        if len(in_flight) >= settings.INGESTION_QUEUE_SIZE:
+            yield from window_chunks(in_flight.popleft())
+    while in_flight:
+        yield from window_chunks(in_flight.popleft())
+
+
+def job_payload(job: IngestionJob):
+    return {
+        "id": job.pk,
+        "document": job.document_id,
+        "file_name": job.file_name,
+        "status": job.status,
+        "chunks_processed": job.chunks_processed,
+        "chunks_total": job.chunks_total,
+        "error": job.error,
+    }
+
+
+def publish_progress(job: IngestionJob):
+    """
+    Publie l'état d'un job sur son canal SSE et, le cas échéant, sur le canal du client.
+    """
+    payload = job_payload(job)
+    send_event(job.event_channel, "ingestion", payload)
+    if job.channel:
+        send_event(job.channel, "ingestion", payload)
+
+
+def enqueue_document(document: Document, channel: str = ""):
+    """
+    Crée un job d'ingestion pour un document sauvegardé et le confie aux workers.
+
+    :param document: Document à ingérer.
+    :param channel: Canal SSE optionnel où publier la progression.
+    :return: Le job créé, à l'état `queued`.
+    """
+    job = IngestionJob.objects.create(
+        document=document,
+        file_name=str(document),
+        channel=channel,
+    )
+    logger.info(f"✅ Job d'ingestion {job.pk} créé pour '{job.file_name}'.")
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def lock_job(job_id):
+    """
+    Prend le verrou consultatif du job sur la connexion du thread. Il est tenu
+    pendant tout le traitement et libéré par PostgreSQL si le processus meurt :
+    un job `running` dont le verrou est libre a perdu son worker.
+
+    :return: True si le verrou a été obtenu.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)", [JOB_LOCK_NAMESPACE, job_id]
+        )
+        return cursor.fetchone()[0]
+
+
+def unlock_job(job_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_unlock(%s, %s)", [JOB_LOCK_NAMESPACE, job_id]
+        )
+
+
+def claim_next_job():
+    """
+    Réserve le plus ancien job en attente. `skip_locked` permet à plusieurs
+    workers (threads ou processus) de se partager la file sans conflit. Le
+    verrou du job (`lock_job`) est pris avant que l'état `running` ne soit
+    visible, et doit être rendu avec `unlock_job`.
+
+    :return: Le job passé à l'état `running`, ou None si la file est vide.
+    """
+    with transaction.atomic():
+        job = (
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status=IngestionJob.Status.QUEUED)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        if not lock_job(job.pk):
+            # Verrou encore tenu par la reprise de ce job
+            return None
+        job.status = IngestionJob.Status.RUNNING
+        job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def run_job(job: IngestionJob):
+    """
+    Charge, segmente et indexe le document d'un job en publiant sa progression.
+    En cas d'erreur le document est supprimé et le job passe à l'état `failed`.
+    """
+    publish_progress(job)
+    document = job.document
+
+    try:
+        if document is None:
+            raise ValueError("Document supprimé avant son ingestion")
+
+        def on_progress(processed, total):
+            job.chunks_processed = processed
+            job.chunks_total = total
+            job.save(update_fields=["chunks_processed", "chunks_total", "updated_at"])
+            publish_progress(job)
+
+        # Lecture, découpage, embeddings et insertion se chevauchent
+        total = ingest_chunks(
+            iter_parsed_chunks(document), document, progress=on_progress
+        )
+        job.chunks_processed = job.chunks_total = total
+    except Exception as e:
+        logger.error(f"❌ Erreur d'ingestion du fichier '{job.file_name}': {str(e)}")
+        if document is not None:
+            document.delete()
+        job.status = IngestionJob.Status.FAILED
+        job.error = str(e)
+        job.save(update_fields=["status", "error", "updated_at"])
+        publish_progress(job)
+        return
+
+    job.status = IngestionJob.Status.DONE
+    job.save(
+        update_fields=["status", "chunks_processed", "chunks_total", "updated_at"]
+    )
+    publish_progress(job)
+    logger.info(f"✅ Job d'ingestion {job.pk} terminé ({job.chunks_total} chunks).")
+
+    # Le corpus a changé : réajuster les projections 3D en arrière-plan
+    schedule_refit()
+
+
+def run_pending_jobs():
+    """
+    Traite les jobs en attente jusqu'à épuisement de la file.
+
+    :return: Nombre de jobs traités.
+    """
+    processed = 0
+    try:
+        while True:
+            job = claim_next_job()
+            if job is None:
+                return processed
+            # Journaux et durées d'étapes rattachés au job
+            tokens = start_tracking(f"job-{job.pk}")
+            try:
+                run_job(job)
+                log_timings(f"Job d'ingestion {job.pk}")
+            finally:
+                stop_tracking(tokens)
+                unlock_job(job.pk)
+            processed += 1
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.INGESTION_WORKERS,
+                thread_name_prefix="ingestion",
+            )
+    return _executor
+
+
+def wake_workers():
+    """
+    Réveille le pool de workers du processus. Sans workers en processus
+    (`INGESTION_WORKERS = 0`), les jobs sont traités par la commande
+    `run_ingestion_workers`.
+    """
+    if settings.INGESTION_WORKERS > 0:
+        get_executor().submit(run_pending_jobs)
+
+
+def recover_stale_jobs():
+    """
+    Remet en file les jobs restés `running` dont le worker a disparu (processus
+    arrêté pendant l'ingestion) : leur verrou consultatif est libre. Un job
+    encore traité, même lentement, garde son verrou et n'est pas touché. Les
+    chunks déjà insérés pour leur document sont supprimés : le document est
+    ingéré de nouveau depuis le début, et les réponses en cache qui les citent
+    sont invalidées.
+
+    :return: Nombre de jobs remis en file.
+    """
+    recovered = 0
+    with transaction.atomic():
+        running = IngestionJob.objects.select_for_update(skip_locked=True).filter(
+            status=IngestionJob.Status.RUNNING
+        )
+        for job in running:
+            if not lock_job(job.pk):
+                continue
+            try:
+                if job.document_id is not None:
+                    chunks = Chunk.objects.filter(document_id=job.document_id)
+                    get_vector_store().delete(
+                        list(chunks.values_list("id", flat=True))
+                    )
+                    chunks.delete()
+                    # Réponses déjà construites sur les chunks supprimés
+                    invalidate_documents([job.document_id])
+                job.status = IngestionJob.Status.QUEUED
+                job.chunks_processed = 0
+                job.chunks_total = None
+                job.save(
+                    update_fields=[
+                        "status",
+                        "chunks_processed",
+                        "chunks_total",
+                        "updated_at",
+                    ]
+                )
+            finally:
+                unlock_job(job.pk)
+            recovered += 1
+
+    if recovered:
+        logger.warning(
+            f"⚠️ {recovered} job(s) d'ingestion interrompu(s) remis en file."
+        )
+    return recovered
+
+
+def start_recovery():
+    """
+    Au démarrage du serveur : remet en file les jobs interrompus puis réveille
+    les workers du processus pour traiter les jobs en attente. Appelée au
+    chargement de l'application ASGI/WSGI, dans un thread pour ne pas retarder
+    le démarrage. Sans workers en processus, la commande `run_ingestion_workers`
+    s'en charge.
+    """
+    if settings.INGESTION_WORKERS <= 0:
+        return
+
+    def recover():
+        try:
+            recover_stale_jobs()
+        except Exception as e:
+            logger.error(f"❌ Reprise des jobs d'ingestion impossible: {str(e)}")
+        finally:
+            close_old_connections()
+        wake_workers()
+
+    threading.Thread(target=recover, name="ingestion-recovery", daemon=True).start()
@@ -0,0 +1,136 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.ann import evaluate_index, parse_index_spec, sample_queries
+from rag.vector_index import rebuild_index
+from rag.vector_store import PgVectorStore, get_vector_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le rappel@k et la latence de l'index ANN pour plusieurs réglages "
+        "(probes / ef_search, lists / m), par rapport à une recherche exacte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=100,
+            help="Nombre de chunks tirés au hasard comme requêtes.",
+        )
+        parser.add_argument(
+            "--questions",
+            help="Fichier de questions (une par ligne) à utiliser comme requêtes.",
+        )
+        parser.add_argument("--top-k", type=int, default=5, help="k du rappel@k.")
+        parser.add_argument(
+            "--probes",
+            type=int,
+            nargs="+",
+            default=[1, 5, 10, 20, 50],
+            help="Valeurs de ivfflat.probes testées.",
+        )
+        parser.add_argument(
+            "--ef-search",
+            type=int,
+            nargs="+",
+            default=[10, 20, 40, 80, 160],
+            help=(
+                "Valeurs de hnsw.ef_search testées, relevées au nombre de "
+                "candidats de la recherche (k, ou k × VECTOR_RERANK_OVERSAMPLING "
+                "avec compression)."
+            ),
+        )
+        parser.add_argument(
+            "--index",
+            action="append",
+            default=[],
+            help=(
+                "Index à construire puis évaluer, ex. 'ivfflat:lists=100' ou "
+                "'hnsw:m=16,ef_construction=64' (répétable). Par défaut, "
+                "l'index en place est évalué sans être reconstruit."
+            ),
+        )
+        parser.add_argument(
+            "--keep-index",
+            action="store_true",
+            help="Garder le dernier index évalué au lieu de reconstruire celui "
+            "des settings.",
+        )
+        parser.add_argument("--output", help="Fichier JSON où écrire les résultats.")
+
+    def handle(self, *args, **options):
+        if not isinstance(get_vector_store(), PgVectorStore):
+            raise CommandError("L'évaluation de l'index ANN requiert pgvector.")
+        try:
+            index_configs = [parse_index_spec(spec) for spec in options["index"]]
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        questions = None
+        if options["questions"]:
+            lines = Path(options["questions"]).read_text(encoding="utf-8")
+            questions = [line.strip() for line in lines.splitlines() if line.strip()]
+        queries = sample_queries(options["sample"], questions)
+        if not queries:
+            raise CommandError("Aucune requête : la base ne contient aucun chunk.")
+
+        top_k = options["top_k"]
+        self.stdout.write(
+            f"{len(queries)} requête(s), vérité terrain par parcours exact..."
+        )
+        self.stdout.write(
+            f"{'index':<34} {'recherche':<16} {f'rappel@{top_k}':>10} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'moy. ms':>9}"
+        )
+
+        try:
+            results = evaluate_index(
+                queries,
+                top_k=top_k,
+                index_configs=index_configs,
+                probes=options["probes"],
+                ef_search=options["ef_search"],
+                progress=lambda result: self.write_row(result, top_k),
+            )
+        finally:
+            if index_configs and not options["keep_index"]:
+                # Revenir à l'index défini par les settings
+                rebuild_index()
+                self.stdout.write(
+                    f"Index {settings.VECTOR_INDEX_TYPE} des settings reconstruit."
+                )
+
+        if options["output"]:
+            report = {
+                "queries": len(queries),
+                "source": "questions" if questions else "chunks",
+                "top_k": top_k,
+                "compression": settings.VECTOR_COMPRESSION,
+                "results": results,
+            }
+            Path(options["output"]).write_text(
+                json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8"
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Résultats écrits dans {options['output']}.")
+            )
+
+    def write_row(self, result, top_k):
+        index = result["index"]
+        if index["type"] == "ivfflat" and "lists" in index:
+            label = f"ivfflat lists={index['lists']}"
+        elif index["type"] == "hnsw" and "m" in index:
+            label = f"hnsw m={index['m']} ef_c={index['ef_construction']}"
+        else:
+            label = f"{index['type'] or 'aucun'} (en place)"
+        search = " ".join(f"{name}={value}" for name, value in result["search"].items())
+        latency = result["latency_ms"]
+        self.stdout.write(
+            f"{label:<34} {search or '-':<16} {result[f'recall@{top_k}']:>10.4f} "
+            f"{latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['mean']:>9.2f}"
+        )
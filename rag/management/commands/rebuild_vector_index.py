@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.vector_index import (
+    COMPRESSIONS,
+    INDEX_TYPES,
+    current_index_type,
+    rebuild_index,
+)
+from rag.vector_store import PgVectorStore, get_vector_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit l'index ANN des embeddings. À lancer après un chargement "
+        "massif : pour IVFFlat, le nombre de listes est adapté au nombre de chunks. "
+        "Avec un autre backend que pgvector, reconstruit son index depuis la base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            choices=INDEX_TYPES,
+            default=settings.VECTOR_INDEX_TYPE,
+            help="Type d'index (par défaut VECTOR_INDEX_TYPE).",
+        )
+        parser.add_argument(
+            "--compression",
+            choices=COMPRESSIONS,
+            default=settings.VECTOR_COMPRESSION,
+            help=(
+                "Compression des vecteurs indexés. Doit être celle de "
+                "VECTOR_COMPRESSION, dont dépendent les requêtes."
+            ),
+        )
+        parser.add_argument(
+            "--lists",
+            type=int,
+            help="Nombre de listes IVFFlat (par défaut calculé selon le nombre de chunks).",
+        )
+        parser.add_argument("--m", type=int, help="Paramètre HNSW m.")
+        parser.add_argument(
+            "--ef-construction", type=int, help="Paramètre HNSW ef_construction."
+        )
+        parser.add_argument(
+            "--concurrently",
+            action="store_true",
+            help="Construire l'index sans bloquer les écritures.",
+        )
+
+    def handle(self, *args, **options):
+        store = get_vector_store()
+        if not isinstance(store, PgVectorStore):
+            # Les options d'index ANN ne concernent que pgvector
+            index = store.rebuild()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"✅ Index {index['type']} reconstruit sur {index['rows']} chunks."
+                )
+            )
+            return
+
+        if options["compression"] != settings.VECTOR_COMPRESSION:
+            # Les requêtes utilisent l'expression de VECTOR_COMPRESSION : un
+            # autre index ne serait jamais utilisé (parcours séquentiel)
+            raise CommandError(
+                f"--compression {options['compression']} différent de "
+                f"VECTOR_COMPRESSION ({settings.VECTOR_COMPRESSION}) : changez "
+                f"le setting puis relancez la commande."
+            )
+
+        previous = current_index_type()
+        index = rebuild_index(
+            index_type=options["type"],
+            lists=options["lists"],
+            m=options["m"],
+            ef_construction=options["ef_construction"],
+            concurrently=options["concurrently"],
+            compression=options["compression"],
+        )
+
+        if index["type"] == "hnsw":
+            details = f"m={index['m']}, ef_construction={index['ef_construction']}"
+        else:
+            details = f"lists={index['lists']}"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Index {index['type']} ({index['compression']}) reconstruit "
+                f"sur {index['rows']} chunks "
+                f"({details}, précédent : {previous or 'aucun'})."
+            )
+        )
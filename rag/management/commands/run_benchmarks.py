@@ -0,0 +1,121 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+
+from benchmarks.fake_ollama import FakeOllamaConfig
+from benchmarks.suite import SCENARIOS, run_suite
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit et la latence de l'ingestion et du chat de bout en bout, "
+        "contre un serveur Ollama factice et une base de test."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=SCENARIOS,
+            help="Scénario à lancer (répétable, par défaut tous).",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=20, help="Questions par scénario de chat."
+        )
+        parser.add_argument(
+            "--documents",
+            type=int,
+            default=10,
+            help="Documents à ingérer (corpus des scénarios de questions).",
+        )
+        parser.add_argument(
+            "--paragraphs",
+            type=int,
+            default=20,
+            help="Paragraphes par document synthétique.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Requêtes simultanées."
+        )
+        parser.add_argument(
+            "--embed-latency",
+            type=float,
+            default=0.02,
+            help="Latence simulée d'un appel d'embedding, en secondes.",
+        )
+        parser.add_argument(
+            "--first-token-latency",
+            type=float,
+            default=0.2,
+            help="Latence simulée avant le premier token, en secondes.",
+        )
+        parser.add_argument(
+            "--token-latency",
+            type=float,
+            default=0.02,
+            help="Latence simulée entre deux tokens, en secondes.",
+        )
+        parser.add_argument(
+            "--tokens", type=int, default=64, help="Tokens par réponse simulée."
+        )
+        parser.add_argument(
+            "--dimensions",
+            type=int,
+            default=768,
+            help="Dimension des embeddings simulés (celle de la colonne vectorielle).",
+        )
+        parser.add_argument(
+            "--output", help="Fichier JSON où écrire le rapport (sinon la sortie)."
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Réutiliser la base de test existante et la conserver.",
+        )
+
+    def handle(self, *args, **options):
+        config = FakeOllamaConfig(
+            dimensions=options["dimensions"],
+            embed_latency=options["embed_latency"],
+            first_token_latency=options["first_token_latency"],
+            token_latency=options["token_latency"],
+            tokens=options["tokens"],
+        )
+
+        # Base de test et fichiers temporaires : les données réelles restent intactes
+        old_config = setup_databases(
+            verbosity=options["verbosity"], interactive=False, keepdb=options["keepdb"]
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root,
+                VECTOR_STORE_PATH=Path(media_root) / "vector_store",
+                PROJECTIONS_PATH=Path(media_root) / "projections" / "model.joblib",
+            ):
+                report = run_suite(
+                    scenarios=options["scenario"] or SCENARIOS,
+                    requests=options["requests"],
+                    concurrency=options["concurrency"],
+                    documents=options["documents"],
+                    paragraphs=options["paragraphs"],
+                    config=config,
+                )
+        finally:
+            teardown_databases(
+                old_config,
+                verbosity=options["verbosity"],
+                keepdb=options["keepdb"],
+            )
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            Path(options["output"]).write_text(output, encoding="utf-8")
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Rapport écrit dans {options['output']}.")
+            )
+        else:
+            self.stdout.write(output)
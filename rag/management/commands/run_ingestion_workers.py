@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rag.ingestion import recover_stale_jobs, run_pending_jobs
+from rag.metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Lance des workers qui traitent les jobs d'ingestion en attente."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=2, help="Nombre de workers (threads)."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Délai en secondes entre deux consultations de la file vide.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Traiter les jobs en attente puis s'arrêter.",
+        )
+        parser.add_argument(
+            "--metrics-port",
+            type=int,
+            default=settings.METRICS_WORKER_PORT,
+            help="Port où exposer les métriques de ce processus sur /metrics "
+            "(par défaut METRICS_WORKER_PORT, 0 : désactivé).",
+        )
+
+    def handle(self, *args, **options):
+        if settings.METRICS_ENABLED and options["metrics_port"]:
+            # Durées d'ingestion mesurées ici, absentes du /metrics du serveur web
+            start_metrics_server(options["metrics_port"])
+
+        # Jobs interrompus par l'arrêt d'un worker : à reprendre depuis le début
+        recovered = recover_stale_jobs()
+        if recovered:
+            self.stdout.write(f"{recovered} job(s) interrompu(s) remis en file.")
+
+        if options["once"]:
+            processed = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"✅ {processed} job(s) traité(s)."))
+            return
+
+        self.stdout.write(f"Démarrage de {options['workers']} worker(s) d'ingestion...")
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(options["poll_interval"],),
+                name=f"ingestion-{i}",
+                daemon=True,
+            )
+            for i in range(options["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt des workers d'ingestion.")
+
+    def work(self, poll_interval):
+        while True:
+            try:
+                processed = run_pending_jobs()
+            except Exception as e:
+                logger.error(f"❌ Erreur du worker d'ingestion: {str(e)}")
+                processed = 0
+            if not processed:
+                time.sleep(poll_interval)
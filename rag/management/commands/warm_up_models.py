@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.warmup import warm_up_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Précharge le modèle de langage et le modèle d'embedding dans Ollama, "
+        "avec leur durée de maintien en mémoire (*_KEEP_ALIVE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Échouer si un modèle n'a pas pu être chargé.",
+        )
+
+    def handle(self, *args, **options):
+        results = warm_up_models()
+        for result in results:
+            if result["warm"]:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"✅ {result['model']} chargé en {result['seconds']:.1f}s."
+                    )
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"❌ {result['model']} : {result['error']}")
+                )
+
+        if options["strict"] and not all(result["warm"] for result in results):
+            raise CommandError("Tous les modèles n'ont pas pu être chargés.")
@@ -0,0 +1,485 @@
+"""
+Mesure de la durée de chaque étape des questions et de l'ingestion, exportée
+au format texte de Prometheus sur `/metrics`.
+
+- questions (`rag_query_stage_seconds`) : "embed", "answer_cache", "retrieve",
+  "prompt", "first_token" (attente d'une place et du premier token) et
+  "generation" (génération complète) ;
+- ingestion (`rag_ingestion_stage_seconds`) : "load", "split", "embed", "insert".
+
+Chaque requête HTTP reçoit un identifiant de corrélation (en-tête `X-Request-ID`
+repris s'il est valide, sinon généré), ajouté à toutes les lignes de journal ;
+la durée des étapes exécutées pendant la requête est journalisée à sa fin. Les
+jobs d'ingestion utilisent `job-<id>`.
+
+Avec `METRICS_ENABLED` à faux, les chronomètres sont un contexte vide partagé :
+aucune mesure, aucune allocation.
+
+Les métriques sont tenues en mémoire, par processus : chaque worker du serveur
+web expose les siennes sur `/metrics`, et la commande `run_ingestion_workers`
+les siennes sur un port dédié (`start_metrics_server`). Chaque processus doit
+donc être collecté séparément.
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .embedding_cache import query_embedding_cache
+from .scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Identifiant de corrélation de la requête ou du job en cours
+correlation_id = contextvars.ContextVar("correlation_id", default="-")
+# Durées cumulées par étape pour la requête ou le job en cours
+_timings = contextvars.ContextVar("timings", default=None)
+_timings_lock = threading.Lock()
+
+_NOOP = nullcontext()
+
+# Identifiant de corrélation accepté dans l'en-tête `X-Request-ID` (il est
+# recopié dans les journaux et la réponse) : sinon un nouvel identifiant est généré
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Compteur cumulatif, par combinaison d'étiquettes.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, self.labelnames, key, value
+
+
+class Histogram:
+    """
+    Histogramme à seaux cumulatifs, par combinaison d'étiquettes.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(c), s) for key, (c, s) in self._values.items()}
+        labelnames = self.labelnames + ("le",)
+        for key, (counts, total) in values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_key = key + (_format_value(bound),)
+                yield f"{self.name}_bucket", labelnames, bucket_key, bucket_count
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, counts[-1]
+
+
+class GaugeCallback:
+    """
+    Jauge lue au moment de l'export : `callback` retourne une liste de couples
+    (valeurs des étiquettes, valeur).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        REGISTRY.append(self)
+
+    def samples(self):
+        for key, value in self.callback():
+            yield self.name, self.labelnames, tuple(key), value
+
+
+class CounterCallback(GaugeCallback):
+    """
+    Compteur cumulatif tenu ailleurs (cache, ordonnanceur), lu au moment de
+    l'export.
+    """
+
+    kind = "counter"
+
+
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Durée de chaque étape du traitement d'une question.",
+    ("stage",),
+)
+INGESTION_STAGE_SECONDS = Histogram(
+    "rag_ingestion_stage_seconds",
+    "Durée de chaque étape de l'ingestion (par plage de pages ou par lot).",
+    ("stage",),
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Taille estimée du contexte envoyé au modèle, en tokens.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 8000),
+)
+QUERIES_TOTAL = Counter(
+    "rag_queries_total",
+    "Questions traitées, par issue (generated, cached, no_document).",
+    ("result",),
+)
+INGESTED_CHUNKS_TOTAL = Counter(
+    "rag_ingested_chunks_total", "Chunks insérés par l'ingestion."
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_seconds",
+    "Durée des requêtes HTTP, par vue et code de réponse.",
+    ("view", "status"),
+)
+
+
+def _embedding_cache_counts():
+    stats = query_embedding_cache.stats()
+    return [(("hit",), stats["hits"]), (("miss",), stats["misses"])]
+
+
+def _embedding_cache_size():
+    return [((), query_embedding_cache.stats()["size"])]
+
+
+def _scheduler_samples():
+    return [
+        ((name, state), stats[state])
+        for name, stats in get_scheduler().stats().items()
+        for state in ("queued", "running")
+    ]
+
+
+def _scheduler_rejections():
+    return [
+        ((name,), stats["rejected"]) for name, stats in get_scheduler().stats().items()
+    ]
+
+
+CounterCallback(
+    "rag_embedding_cache_lookups_total",
+    "Recherches dans le cache des embeddings de questions, par issue.",
+    ("result",),
+    _embedding_cache_counts,
+)
+GaugeCallback(
+    "rag_embedding_cache_size",
+    "Nombre d'embeddings de questions en cache.",
+    (),
+    _embedding_cache_size,
+)
+GaugeCallback(
+    "rag_ollama_scheduler",
+    "Appels Ollama en file et en cours, par classe de priorité.",
+    ("class", "state"),
+    _scheduler_samples,
+)
+CounterCallback(
+    "rag_ollama_scheduler_rejected_total",
+    "Appels Ollama refusés (file pleine), par classe de priorité.",
+    ("class",),
+    _scheduler_rejections,
+)
+
+
+def render():
+    """
+    :return: Toutes les métriques au format texte de Prometheus (version 0.0.4).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labelnames, key, value in metric.samples():
+            lines.append(
+                f"{name}{_format_labels(labelnames, key)} {_format_value(value)}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        # Pas de journal par collecte
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, address: str = ""):
+    """
+    Expose les métriques du processus sur `http://<address>:<port>/metrics`,
+    pour les processus sans serveur web (workers d'ingestion).
+
+    :return: Le serveur HTTP, servi dans un thread démon.
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"✅ Métriques exposées sur le port {server.server_port}.")
+    return server
+
+
+def record(histogram, stage, seconds):
+    """
+    Enregistre la durée d'une étape, et l'ajoute à celles de la requête en cours.
+    """
+    histogram.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class _Timer:
+    __slots__ = ("histogram", "stage", "start")
+
+    def __init__(self, histogram, stage):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.histogram, self.stage, time.perf_counter() - self.start)
+
+
+def timer(histogram, stage):
+    """
+    Chronomètre une étape :
+
+        with timer(QUERY_STAGE_SECONDS, "retrieve"):
+            ...
+
+    :return: Contexte qui enregistre la durée du bloc (vide si désactivé).
+    """
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _Timer(histogram, stage)
+
+
+def timed_stream(iterator):
+    """
+    Relaie le flux de génération en mesurant le délai avant le premier token et
+    la durée totale de la génération.
+
+    :return: Générateur des éléments du flux.
+    """
+    if not settings.METRICS_ENABLED:
+        yield from iterator
+        return
+    start = time.perf_counter()
+    first = True
+    for item in iterator:
+        if first:
+            record(QUERY_STAGE_SECONDS, "first_token", time.perf_counter() - start)
+            first = False
+        yield item
+    record(QUERY_STAGE_SECONDS, "generation", time.perf_counter() - start)
+
+
+async def atimed_stream(aiterator):
+    """
+    Variante asyncio de `timed_stream`. Le flux relayé est fermé avec celui-ci.
+
+    :return: Générateur asynchrone des éléments du flux.
+    """
+    try:
+        if not settings.METRICS_ENABLED:
+            async for item in aiterator:
+                yield item
+            return
+        start = time.perf_counter()
+        first = True
+        async for item in aiterator:
+            if first:
+                record(QUERY_STAGE_SECONDS, "first_token", time.perf_counter() - start)
+                first = False
+            yield item
+        record(QUERY_STAGE_SECONDS, "generation", time.perf_counter() - start)
+    finally:
+        await aiterator.aclose()
+
+
+def count(counter, amount=1, **labels):
+    if settings.METRICS_ENABLED:
+        counter.inc(amount, **labels)
+
+
+def observe(histogram, value, **labels):
+    if settings.METRICS_ENABLED:
+        histogram.observe(value, **labels)
+
+
+def request_id(request):
+    """
+    :return: L'identifiant de l'en-tête `X-Request-ID` s'il est valide
+        (`REQUEST_ID_PATTERN`), sinon None.
+    """
+    value = request.headers.get("X-Request-ID", "")
+    return value if REQUEST_ID_PATTERN.fullmatch(value) else None
+
+
+def start_tracking(identifier=None):
+    """
+    Associe au contexte courant un identifiant de corrélation et, si les
+    métriques sont activées, un relevé des durées d'étapes.
+
+    :return: Jetons à passer à `stop_tracking`.
+    """
+    return (
+        correlation_id.set(identifier or uuid.uuid4().hex),
+        _timings.set({} if settings.METRICS_ENABLED else None),
+    )
+
+
+def stop_tracking(tokens):
+    correlation_token, timings_token = tokens
+    _timings.reset(timings_token)
+    correlation_id.reset(correlation_token)
+
+
+def log_timings(label: str):
+    """
+    Journalise les durées des étapes relevées depuis `start_tracking`.
+    """
+    timings = _timings.get()
+    if timings:
+        steps = " ".join(
+            f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in timings.items()
+        )
+        logger.info(f"⏱️ {label} : {steps}")
+
+
+class CorrelationIdFilter(logging.Filter):
+    """
+    Ajoute `correlation_id` aux lignes de journal (voir `LOGGING`).
+    """
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class RequestMetricsMiddleware:
+    """
+    Identifiant de corrélation et durée des étapes de chaque requête HTTP.
+    L'identifiant est renvoyé dans l'en-tête `X-Request-ID`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        tokens = start_tracking(request_id(request))
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.finish(request, response, time.perf_counter() - start)
+        finally:
+            stop_tracking(tokens)
+        return response
+
+    async def __acall__(self, request):
+        tokens = start_tracking(request_id(request))
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.finish(request, response, time.perf_counter() - start)
+        finally:
+            stop_tracking(tokens)
+        return response
+
+    def finish(self, request, response, elapsed):
+        response["X-Request-ID"] = correlation_id.get()
+        if not settings.METRICS_ENABLED:
+            return
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        HTTP_REQUEST_SECONDS.observe(elapsed, view=view, status=response.status_code)
+        log_timings(
+            f"{request.method} {request.path} {response.status_code} "
+            f"en {elapsed * 1000:.0f}ms"
+        )
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-17 09:00
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    Chunk = apps.get_model("rag", "Chunk")
+    batch = []
+    for chunk in Chunk.objects.only("id", "content").iterator(chunk_size=1000):
+        chunk.content_hash = hashlib.sha256(chunk.content.encode("utf-8")).hexdigest()
+        chunk.embedding_model = settings.EMBEDDING_MODEL_NAME
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            Chunk.objects.bulk_update(batch, ["content_hash", "embedding_model"])
+            batch = []
+    if batch:
+        Chunk.objects.bulk_update(batch, ["content_hash", "embedding_model"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='chunk',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chunk',
+            index=models.Index(fields=['content_hash', 'embedding_model'], name='chunk_content_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-17 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0003_chunk_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('failed', 'Échoué')], default='queued', max_length=16)),
+                ('chunks_processed', models.IntegerField(default=0)),
+                ('chunks_total', models.IntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('channel', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_jobs', to='rag.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='ingestion_job_queue_idx')],
+            },
+        ),
+    ]
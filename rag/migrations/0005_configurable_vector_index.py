@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-17 10:00
+
+from django.db import migrations
+
+# DDL figé à la date de la migration (HNSW par défaut, vecteurs complets) : les
+# réglages VECTOR_* des settings s'appliquent ensuite avec la commande
+# `rebuild_vector_index`, jamais pendant `migrate`
+CREATE_HNSW_INDEX = (
+    "CREATE INDEX embedding_cosine_idx ON rag_chunk "
+    "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+)
+CREATE_IVFFLAT_INDEX = (
+    "CREATE INDEX embedding_cosine_idx ON rag_chunk "
+    "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0004_ingestionjob'),
+    ]
+
+    operations = [
+        # L'index ANN sort de l'état du modèle : il est ensuite reconstruit
+        # selon les settings par rag/vector_index.py
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='chunk',
+                    name='embedding_cosine_idx',
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        "DROP INDEX IF EXISTS embedding_cosine_idx",
+                        CREATE_HNSW_INDEX,
+                    ],
+                    reverse_sql=[
+                        "DROP INDEX IF EXISTS embedding_cosine_idx",
+                        CREATE_IVFFLAT_INDEX,
+                    ],
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 10:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0005_configurable_vector_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('content', config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='chunk',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='chunk_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-17 11:00
+
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0006_chunk_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField()),
+                ('question_embedding', pgvector.django.vector.VectorField(dimensions=768)),
+                ('answer', models.TextField()),
+                ('sources', models.JSONField(default=list)),
+                ('chunk_ids', models.JSONField(default=list)),
+                ('embedding_model', models.CharField(max_length=255)),
+                ('language_model', models.CharField(max_length=255)),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('documents', models.ManyToManyField(related_name='cached_answers', to='rag.document')),
+            ],
+            options={
+                'indexes': [pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['question_embedding'], m=16, name='cached_answer_embedding_idx', opclasses=['vector_cosine_ops'])],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 11:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0007_cachedanswer'),
+    ]
+
+    operations = [
+        # Compression des vecteurs indexés (VECTOR_COMPRESSION) : aucun
+        # changement de schéma, l'index par défaut reste celui de la migration
+        # 0005 (vecteurs complets). Un index halfvec ou binaire est construit
+        # par la commande `rebuild_vector_index`, jamais pendant `migrate`
+        migrations.RunSQL(migrations.RunSQL.noop, migrations.RunSQL.noop),
+    ]
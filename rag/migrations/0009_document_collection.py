@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0008_compressed_vector_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='collection',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+    ]
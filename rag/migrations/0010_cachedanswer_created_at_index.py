@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag', '0009_document_collection'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cachedanswer',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
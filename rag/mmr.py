@@ -0,0 +1,79 @@
+"""
+Diversification des chunks récupérés par Maximal Marginal Relevance (MMR).
+
+Les chunks se chevauchant (`chunk_overlap`), les meilleurs résultats sont
+souvent des portions voisines d'un même passage. MMR choisit les chunks un à
+un en maximisant `lambda * sim(requête, chunk) - (1 - lambda) * max sim(chunk,
+chunks déjà choisis)`, parmi un ensemble de candidats suréchantillonné.
+"""
+
+import numpy as np
+from django.conf import settings
+
+from .models import Chunk
+
+
+def mmr_select(query_embedding, embeddings, top_k, lambda_mult=0.5):
+    """
+    Sélection MMR gloutonne, vectorisée : les similarités sont calculées en
+    une multiplication matricielle, puis la similarité maximale de chaque
+    candidat aux chunks choisis est mise à jour à chaque sélection.
+
+    :param query_embedding: Embedding de la requête.
+    :param embeddings: Matrice (n, dim) des embeddings des candidats.
+    :param top_k: Nombre de candidats à choisir.
+    :param lambda_mult: 1 : pertinence seule, 0 : diversité seule.
+    :return: Positions des candidats choisis, dans l'ordre de sélection.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if len(matrix) == 0:
+        return []
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / max(np.linalg.norm(query), 1e-12)
+
+    relevance = matrix @ query
+    pairwise = matrix @ matrix.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(len(matrix), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(top_k, len(matrix)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+
+    return selected
+
+
+def diversify(chunks, query_embedding, top_k, lambda_mult=None):
+    """
+    Réduit une liste de chunks candidats à `top_k` chunks par MMR. Les
+    embeddings des candidats sont lus en une requête.
+
+    :param chunks: Chunks candidats (sans embedding).
+    :param query_embedding: Embedding de la requête.
+    :param top_k: Nombre de chunks à garder.
+    :param lambda_mult: Compromis pertinence/diversité (par défaut `MMR_LAMBDA`).
+    :return: Liste des chunks choisis, dans l'ordre de sélection.
+    """
+    if len(chunks) <= top_k:
+        return chunks
+    if lambda_mult is None:
+        lambda_mult = settings.MMR_LAMBDA
+
+    embeddings = dict(
+        Chunk.objects.filter(id__in=[chunk.id for chunk in chunks]).values_list(
+            "id", "embedding"
+        )
+    )
+    # Chunks supprimés entre-temps : ignorés
+    chunks = [chunk for chunk in chunks if chunk.id in embeddings]
+    matrix = [embeddings[chunk.id] for chunk in chunks]
+
+    return [chunks[i] for i in mmr_select(query_embedding, matrix, top_k, lambda_mult)]
@@ -1,9 +1,15 @@
+import hashlib
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
-from pgvector.django import IvfflatIndex, VectorField
+from pgvector.django import HnswIndex, VectorField
 
 
 class Document(models.Model):
     file = models.FileField(upload_to="documents/")
+    # Regroupement libre des documents, utilisable pour restreindre la recherche
+    collection = models.CharField(max_length=100, blank=True, default="", db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -18,6 +24,45 @@ class Document(models.Model):
         super().delete(*args, **kwargs)
 
 
+class IngestionJob(models.Model):
+    class Status(models.TextChoices):
+        QUEUED = "queued", "En attente"
+        RUNNING = "running", "En cours"
+        DONE = "done", "Terminé"
+        FAILED = "failed", "Échoué"
+
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ingestion_jobs",
+    )
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED
+    )
+    chunks_processed = models.IntegerField(default=0)
+    chunks_total = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    # Canal SSE supplémentaire (ex. celui de la page de chat) pour la progression
+    channel = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="ingestion_job_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} - {self.status}"
+
+    @property
+    def event_channel(self):
+        return f"ingestion_{self.pk}"
+
+
 class Chunk(models.Model):
     document = models.ForeignKey(
         Document, on_delete=models.CASCADE, related_name="chunks"
@@ -26,16 +71,69 @@ class Chunk(models.Model):
     chunk_index = models.IntegerField()
     content = models.TextField()
     embedding = VectorField(dimensions=768)
+    # Empreinte du contenu et modèle d'embedding, pour réutiliser les embeddings
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    embedding_model = models.CharField(max_length=255, blank=True, default="")
+    # Vecteur plein texte calculé par PostgreSQL, pour la recherche hybride.
+    # Configuration "simple" : pas de racinisation, les codes produits, numéros
+    # d'erreur et noms propres restent trouvables tels quels
+    search_vector = models.GeneratedField(
+        expression=SearchVector("content", config="simple"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
+        # L'index ANN sur `embedding` (IVFFlat ou HNSW selon les settings) est
+        # géré hors du modèle, par rag/vector_index.py
         indexes = [
-            IvfflatIndex(
-                name="embedding_cosine_idx",
-                fields=["embedding"],
-                lists=100,
-                opclasses=["vector_cosine_ops"],
+            models.Index(
+                fields=["content_hash", "embedding_model"],
+                name="chunk_content_hash_idx",
             ),
+            GinIndex(fields=["search_vector"], name="chunk_search_vector_idx"),
         ]
 
     def __str__(self):
         return f"{self.document.file.name} - Page {self.page}, Chunk {self.chunk_index}"
+
+    @staticmethod
+    def hash_content(content: str):
+        """
+        Calcule l'empreinte SHA-256 du contenu d'un chunk.
+        """
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class CachedAnswer(models.Model):
+    """
+    Réponse déjà générée, réutilisée pour les questions quasi identiques.
+    """
+
+    question = models.TextField()
+    question_embedding = VectorField(dimensions=768)
+    answer = models.TextField()
+    sources = models.JSONField(default=list)
+    chunk_ids = models.JSONField(default=list)
+    # Documents sources : l'entrée est invalidée si l'un d'eux est supprimé ou
+    # ré-ingéré
+    documents = models.ManyToManyField(Document, related_name="cached_answers")
+    embedding_model = models.CharField(max_length=255)
+    language_model = models.CharField(max_length=255)
+    hits = models.IntegerField(default=0)
+    # Indexé pour la suppression des entrées expirées
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="cached_answer_embedding_idx",
+                fields=["question_embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
+
+    def __str__(self):
+        return self.question[:80]
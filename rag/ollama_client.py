@@ -0,0 +1,150 @@
+import threading
+from typing import Optional, Union
+
+import httpx
+from django.conf import settings
+from langchain_ollama import OllamaEmbeddings, OllamaLLM
+from ollama import Client
+
+# Registre des clients Ollama partagés par le processus, indexés par (type, url, modèle)
+_clients = {}
+_lock = threading.Lock()
+
+
+def client_kwargs():
+    """
+    Construit les options des clients HTTP (timeouts, taille du pool, keep-alive)
+    à partir des settings.
+
+    :return: Dictionnaire d'options transmis à httpx via le client Ollama.
+    """
+    return {
+        "timeout": httpx.Timeout(
+            settings.OLLAMA_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT
+        ),
+        "limits": httpx.Limits(
+            max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def parse_keep_alive(value):
+    """
+    Durée de maintien en mémoire d'un modèle par Ollama : nombre de secondes
+    (-1 : indéfiniment, 0 : déchargement immédiat) ou durée ("30m", "2h").
+
+    :return: Entier ou chaîne transmis tel quel à Ollama, None si vide.
+    """
+    if value in (None, ""):
+        return None
+    value = str(value).strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+class KeepAliveOllamaEmbeddings(OllamaEmbeddings):
+    """
+    OllamaEmbeddings transmettant `keep_alive` à chaque appel, ce que
+    langchain-ollama 0.2.0 ne fait pas : sans lui, chaque embedding ramène
+    la durée de maintien du modèle à la valeur par défaut d'Ollama.
+    """
+
+    keep_alive: Optional[Union[int, str]] = None
+
+    def embed_documents(self, texts):
+        return self._client.embed(self.model, texts, keep_alive=self.keep_alive)[
+            "embeddings"
+        ]
+
+    async def aembed_documents(self, texts):
+        response = await self._async_client.embed(
+            self.model, texts, keep_alive=self.keep_alive
+        )
+        return response["embeddings"]
+
+
+def _get_or_create(kind, model_class, model, base_url, **options):
+    key = (kind, base_url, model)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        # Un autre thread a pu créer le client entre-temps
+        client = _clients.get(key)
+        if client is None:
+            client = model_class(
+                model=model,
+                base_url=base_url,
+                client_kwargs=client_kwargs(),
+                **options,
+            )
+            _clients[key] = client
+    return client
+
+
+def get_embeddings(model=None, base_url=None):
+    """
+    Retourne la fonction d'embedding partagée pour (base_url, modèle).
+    Elle porte un client synchrone et un client asyncio, chacun avec son pool
+    de connexions keep-alive (`embed_query` / `aembed_query`).
+
+    :param model: Nom du modèle (par défaut `EMBEDDING_MODEL_NAME`).
+    :param base_url: URL d'Ollama (par défaut `OLLAMA_API_URL`).
+    :return: Instance partagée d'OllamaEmbeddings.
+    """
+    return _get_or_create(
+        "embeddings",
+        KeepAliveOllamaEmbeddings,
+        model or settings.EMBEDDING_MODEL_NAME,
+        base_url or settings.OLLAMA_API_URL,
+        keep_alive=parse_keep_alive(settings.EMBEDDING_MODEL_KEEP_ALIVE),
+    )
+
+
+def get_llm(model=None, base_url=None):
+    """
+    Retourne le modèle de langage partagé pour (base_url, modèle).
+    Il porte un client synchrone et un client asyncio (`stream` / `astream`).
+
+    :param model: Nom du modèle (par défaut `LANGUAGE_MODEL_NAME`).
+    :param base_url: URL d'Ollama (par défaut `OLLAMA_API_URL`).
+    :return: Instance partagée d'OllamaLLM.
+    """
+    return _get_or_create(
+        "llm",
+        OllamaLLM,
+        model or settings.LANGUAGE_MODEL_NAME,
+        base_url or settings.OLLAMA_API_URL,
+        keep_alive=parse_keep_alive(settings.LANGUAGE_MODEL_KEEP_ALIVE),
+    )
+
+
+def get_ollama_client(base_url=None):
+    """
+    Retourne le client Ollama bas niveau partagé, pour les opérations hors
+    langchain (préchargement des modèles, modèles chargés).
+
+    :param base_url: URL d'Ollama (par défaut `OLLAMA_API_URL`).
+    :return: Instance partagée d'ollama.Client.
+    """
+    base_url = base_url or settings.OLLAMA_API_URL
+    key = ("ollama", base_url, None)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Client(host=base_url, **client_kwargs())
+            _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """
+    Vide le registre, par exemple après un changement de configuration.
+    Les connexions des anciens clients sont fermées par le ramasse-miettes.
+    """
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,147 @@
+"""
+Lecture et découpage des fichiers. Ce module ne dépend pas de Django afin de
+pouvoir être exécuté dans les processus du pool de parsing.
+"""
+
+import mimetypes
+import time
+
+from langchain.schema.document import Document
+from langchain_community.document_loaders import (
+    PyPDFLoader,
+    TextLoader,
+    UnstructuredWordDocumentLoader,
+)
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+mimetypes.add_type("text/markdown", ".md")
+mimetypes.add_type(
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx"
+)
+
+# Types de fichiers pris en charge
+SUPPORTED_TYPES = {
+    "application/pdf": PyPDFLoader,  # Pour les PDF
+    "text/plain": TextLoader,  # Pour les fichiers .txt
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": UnstructuredWordDocumentLoader,  # Pour les .docx
+    "text/markdown": TextLoader,  # Pour les .md
+    "text/x-markdown": TextLoader,  # Cas alternatif pour .md
+    "text/x-wiki": TextLoader,  # Pour les fichiers Wikitext
+}
+
+
+def guess_file_type(file_name: str):
+    """
+    Détecte le type MIME d'un fichier à partir de son extension.
+
+    :param file_name: Nom du fichier.
+    :return: Type MIME, ou None s'il n'est pas pris en charge.
+    """
+    file_type, encoding = mimetypes.guess_type(file_name)
+    return file_type if file_type in SUPPORTED_TYPES else None
+
+
+def get_loader(file_path: str):
+    loader_class = SUPPORTED_TYPES[guess_file_type(file_path)]
+    return loader_class(file_path)
+
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,  # Taille maximale d'un morceau (en caractères).
+        chunk_overlap=200,  # Chevauchement entre les morceaux pour la continuité.
+        length_function=len,  # Fonction pour mesurer la longueur des morceaux.
+        is_separator_regex=False,  # Indique que le séparateur n'est pas une expression régulière.
+    )
+
+
+def assign_chunk_ids(chunks: list[Document]):
+    """
+    Attribue à chaque chunk un identifiant `source:page:index`, l'index étant
+    la position du chunk dans sa page.
+
+    :param chunks: Chunks issus d'une même page, dans l'ordre.
+    :return: Les mêmes chunks.
+    """
+    for index, chunk in enumerate(chunks):
+        source = chunk.metadata.get("source")
+        page = chunk.metadata.get("page", 0)
+        chunk.metadata.setdefault("id", f"{source}:{page}:{index}")
+    return chunks
+
+
+def split_documents(documents: list[Document]):
+    """
+    Divise les documents en morceaux de taille contrôlée pour l'indexation.
+
+    :param documents: Liste de documents à segmenter.
+    :return: Liste de morceaux de texte segmentés.
+    """
+    return list(iter_split_documents(documents))
+
+
+def iter_split_documents(documents):
+    """
+    Variante paresseuse de `split_documents` : chaque page est découpée
+    au moment où elle est lue, sans matérialiser le document entier.
+
+    :param documents: Itérable de documents (pages).
+    :return: Générateur de chunks.
+    """
+    text_splitter = get_text_splitter()
+    for document in documents:
+        yield from assign_chunk_ids(text_splitter.split_documents([document]))
+
+
+def page_windows(file_path: str, window_size: int):
+    """
+    Découpe un fichier en plages de pages traitables indépendamment.
+    Seuls les PDF sont découpés, les autres formats forment une seule plage.
+
+    :param file_path: Chemin du fichier.
+    :param window_size: Nombre de pages par plage.
+    :return: Liste de couples (début, fin), fin exclue, ou [(0, None)].
+    """
+    if guess_file_type(file_path) != "application/pdf":
+        return [(0, None)]
+    page_count = len(PdfReader(file_path).pages)
+    window_size = max(1, window_size)
+    return [
+        (start, min(start + window_size, page_count))
+        for start in range(0, page_count, window_size)
+    ]
+
+
+def parse_window(file_path: str, start: int, stop):
+    """
+    Lit et découpe une plage de pages. Exécutée dans le pool de processus,
+    le parsing des PDF étant limité par le CPU.
+
+    :param file_path: Chemin du fichier.
+    :param start: Première page de la plage.
+    :param stop: Page de fin (exclue), None pour tout le fichier.
+    :return: Liste des chunks de la plage et durées en secondes de la lecture
+        et du découpage (`{"load", "split"}`), mesurées dans le processus.
+    """
+    load_start = time.perf_counter()
+    if stop is None:
+        pages = list(get_loader(file_path).lazy_load())
+    else:
+        # Même extraction que PyPDFLoader, limitée aux pages demandées
+        reader = PdfReader(file_path)
+        pages = [
+            Document(
+                page_content=reader.pages[page].extract_text(),
+                metadata={"source": file_path, "page": page},
+            )
+            for page in range(start, stop)
+        ]
+
+    split_start = time.perf_counter()
+    chunks = split_documents(pages)
+    timings = {
+        "load": split_start - load_start,
+        "split": time.perf_counter() - split_start,
+    }
+    return chunks, timings
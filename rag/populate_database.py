@@ -1,46 +1,300 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections
 from langchain.schema.document import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from .embedding_function import embed_query
+from .embedding_function import embed_documents
+from .metrics import INGESTED_CHUNKS_TOTAL, INGESTION_STAGE_SECONDS, count, timer
 from .models import Chunk
+from .parsing import iter_split_documents
+from .vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Marqueur de fin de flux entre les étapes du pipeline d'ingestion
+_END = object()
+
+
+def insert_chunks(objects, batch_size: int):
+    """
+    Insère un lot de chunks en une seule requête puis les ajoute au backend
+    vectoriel (sans effet avec pgvector, les embeddings étant déjà en base).
+
+    :param objects: Instances `Chunk` non enregistrées.
+    :param batch_size: Taille des requêtes d'insertion.
+    """
+    with timer(INGESTION_STAGE_SECONDS, "insert"):
+        Chunk.objects.bulk_create(objects, batch_size=batch_size)
+        get_vector_store().add(
+            [chunk.id for chunk in objects], [chunk.embedding for chunk in objects]
+        )
+    count(INGESTED_CHUNKS_TOTAL, len(objects))
+
+
+def batched(items, batch_size: int):
+    """
+    Découpe un itérable en lots successifs de taille au plus `batch_size`.
+
+    :param items: Itérable à découper.
+    :param batch_size: Taille maximale d'un lot.
+    :return: Générateur de lots.
+    """
+    iterator = iter(items)
+    batch_size = max(1, batch_size)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
 
 
-def split_documents(documents: list[Document]):
+def find_known_embeddings(content_hashes, model_name: str):
     """
-    Divise les documents en morceaux de taille contrôlée pour l'indexation.
+    Recherche en base les embeddings déjà calculés pour ces empreintes de contenu.
 
-    :param documents: Liste de documents à segmenter.
-    :return: Liste de morceaux de texte segmentés.
+    :param content_hashes: Empreintes recherchées.
+    :param model_name: Modèle d'embedding dont les vecteurs sont réutilisables.
+    :return: Dictionnaire empreinte -> embedding.
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Taille maximale d'un morceau (en caractères).
-        chunk_overlap=200,  # Chevauchement entre les morceaux pour la continuité.
-        length_function=len,  # Fonction pour mesurer la longueur des morceaux.
-        is_separator_regex=False,  # Indique que le séparateur n'est pas une expression régulière.
+    if not content_hashes:
+        return {}
+
+    rows = (
+        Chunk.objects.filter(
+            content_hash__in=set(content_hashes), embedding_model=model_name
+        )
+        .order_by("content_hash")
+        .distinct("content_hash")
+        .values_list("content_hash", "embedding")
     )
-    return text_splitter.split_documents(documents)
+    return dict(rows)
 
 
-def add_to_django(chunks: list[Document], document: Document):
+def embed_batch(batch: list[Document], document, known: dict, model_name: str):
     """
-    Ajoute les chunks à la base de données en les associant au document fourni.
+    Construit les objets Chunk d'un lot. Les contenus déjà connus (même empreinte,
+    même modèle) réutilisent leur embedding, les autres sont calculés en un seul appel.
 
-    :param chunks: Liste des chunks à ajouter.
+    :param batch: Chunks langchain du lot.
     :param document: Instance du Document auquel les chunks sont associés.
+    :param known: Embeddings déjà connus (empreinte -> embedding), complété en place.
+    :param model_name: Modèle d'embedding.
+    :return: Liste des objets Chunk non sauvegardés et nombre d'embeddings réutilisés.
     """
-    for chunk in chunks:
-        # Calculer l'embedding pour le contenu du chunk
-        embedding = embed_query(chunk.page_content)
+    hashes = [Chunk.hash_content(chunk.page_content) for chunk in batch]
+    missing = [h for h in set(hashes) if h not in known]
+    known.update(find_known_embeddings(missing, model_name))
 
+    # Calculer en un seul appel les embeddings des contenus jamais vus, dans la
+    # limite des appels simultanés autorisés pour l'ingestion
+    to_embed = {}
+    for chunk, content_hash in zip(batch, hashes):
+        if content_hash not in known:
+            to_embed.setdefault(content_hash, chunk.page_content)
+    if to_embed:
+        # Concurrence limitée par l'ordonnanceur (classe "ingestion")
+        with timer(INGESTION_STAGE_SECONDS, "embed"):
+            embeddings = embed_documents(list(to_embed.values()))
+        known.update(zip(to_embed.keys(), embeddings))
+
+    objects = []
+    for chunk, content_hash in zip(batch, hashes):
         # Extraire les métadonnées
         page = int(chunk.metadata.get("page", 0))
         chunk_index = int(chunk.metadata.get("id", "0").split(":")[-1])
 
-        # Créer et sauvegarder l'objet dans la base
-        Chunk.objects.create(
-            document=document,
-            page=page,
-            chunk_index=chunk_index,
-            content=chunk.page_content,
-            embedding=embedding,
+        objects.append(
+            Chunk(
+                document=document,
+                page=page,
+                chunk_index=chunk_index,
+                content=chunk.page_content,
+                embedding=known[content_hash],
+                content_hash=content_hash,
+                embedding_model=model_name,
+            )
         )
+
+    return objects, len(batch) - len(to_embed)
+
+
+def log_throughput(document, total, reused, elapsed, batch_size):
+    throughput = total / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        f"✅ {total} chunks ajoutés pour '{document}' en {elapsed:.2f}s "
+        f"({throughput:.1f} chunks/s, lots de {batch_size}, "
+        f"{reused} embeddings réutilisés)."
+    )
+
+
+def add_to_django(
+    chunks: list[Document], document: Document, batch_size=None, progress=None
+):
+    """
+    Ajoute les chunks à la base de données en les associant au document fourni.
+    Les embeddings sont calculés par lots et les chunks insérés avec `bulk_create`.
+    Un contenu déjà présent en base (même empreinte, même modèle) réutilise
+    son embedding au lieu d'appeler Ollama.
+
+    :param chunks: Liste des chunks à ajouter.
+    :param document: Instance du Document auquel les chunks sont associés.
+    :param batch_size: Taille des lots (par défaut `EMBEDDING_BATCH_SIZE`).
+    :param progress: Fonction optionnelle appelée après chaque lot avec le nombre
+        de chunks déjà insérés et le nombre total de chunks.
+    :return: Nombre de chunks ajoutés.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    model_name = settings.EMBEDDING_MODEL_NAME
+    start = time.perf_counter()
+    total = 0
+    reused = 0
+    # Embeddings connus pendant cette ingestion (base + lots précédents)
+    known = {}
+
+    for batch in batched(chunks, batch_size):
+        objects, batch_reused = embed_batch(batch, document, known, model_name)
+
+        # Insérer le lot en une seule requête
+        insert_chunks(objects, batch_size)
+        total += len(objects)
+        reused += batch_reused
+        if progress is not None:
+            progress(total, len(chunks))
+
+    log_throughput(document, total, reused, time.perf_counter() - start, batch_size)
+    return total
+
+
+class _Stage(threading.Thread):
+    """
+    Étape du pipeline d'ingestion : consomme `source`, produit dans `output`
+    (file bornée) et transmet l'exception éventuelle à l'étape suivante.
+    S'exécute dans le contexte du thread qui la crée (identifiant de
+    corrélation et relevé des durées du job).
+    """
+
+    def __init__(self, name, source, output, stop):
+        super().__init__(name=name, daemon=True)
+        self.source = source
+        self.output = output
+        self.stop = stop
+        self.context = contextvars.copy_context()
+
+    def put(self, item):
+        # Attente par intervalles pour pouvoir abandonner si l'aval a échoué
+        while not self.stop.is_set():
+            try:
+                self.output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        self.context.run(self.consume)
+
+    def consume(self):
+        try:
+            for item in self.source:
+                if self.stop.is_set():
+                    break
+                self.put(item)
+        except Exception as e:
+            self.put(e)
+        finally:
+            self.put(_END)
+            close_old_connections()
+
+
+def drain(output: queue.Queue, stop: threading.Event):
+    """
+    Itère sur une file alimentée par une étape jusqu'au marqueur de fin,
+    en relevant l'exception éventuelle de l'étape.
+    """
+    while not stop.is_set():
+        try:
+            item = output.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def ingest_pages(pages, document, batch_size=None, progress=None):
+    """
+    Pipeline d'ingestion en flux à partir de pages lues paresseusement
+    (ex. `loader.lazy_load()`), découpées au fil de l'eau.
+    Voir `ingest_chunks` pour les paramètres.
+    """
+    return ingest_chunks(iter_split_documents(pages), document, batch_size, progress)
+
+
+def ingest_chunks(chunks, document, batch_size=None, progress=None):
+    """
+    Pipeline d'ingestion en flux : lecture et découpage, embeddings par lots
+    puis insertion en base. Les étapes tournent en parallèle, reliées par des
+    files bornées (`INGESTION_QUEUE_SIZE` lots), si bien que la mémoire
+    utilisée ne dépend pas de la taille du fichier.
+
+    :param chunks: Itérable paresseux de chunks langchain.
+    :param document: Instance du Document auquel les chunks sont associés.
+    :param batch_size: Taille des lots (par défaut `EMBEDDING_BATCH_SIZE`).
+    :param progress: Fonction optionnelle appelée après chaque lot avec le nombre
+        de chunks déjà insérés et le nombre total (None tant que le découpage
+        n'est pas terminé).
+    :return: Nombre de chunks ajoutés.
+    """
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    model_name = settings.EMBEDDING_MODEL_NAME
+    start = time.perf_counter()
+    stop = threading.Event()
+    split_total = {"count": 0, "done": False}
+
+    def split_batches():
+        # Lecture + découpage : produit des lots de chunks langchain
+        for batch in batched(chunks, batch_size):
+            split_total["count"] += len(batch)
+            yield batch
+        split_total["done"] = True
+
+    def embedded_batches():
+        # Embeddings : produit des lots d'objets Chunk prêts à insérer. Les
+        # embeddings connus sont partagés par tous les lots du document : un
+        # contenu répété dans un lot pas encore inséré n'est pas recalculé.
+        known = {}
+        for batch in drain(split_queue, stop):
+            yield embed_batch(batch, document, known, model_name)
+
+    split_queue = queue.Queue(maxsize=settings.INGESTION_QUEUE_SIZE)
+    embed_queue = queue.Queue(maxsize=settings.INGESTION_QUEUE_SIZE)
+    stages = [
+        _Stage("ingestion-split", split_batches(), split_queue, stop),
+        _Stage("ingestion-embed", embedded_batches(), embed_queue, stop),
+    ]
+    for stage in stages:
+        stage.start()
+
+    total = 0
+    reused = 0
+    try:
+        # Insertion en base dans le thread appelant
+        for objects, batch_reused in drain(embed_queue, stop):
+            insert_chunks(objects, batch_size)
+            total += len(objects)
+            reused += batch_reused
+            if progress is not None:
+                expected = split_total["count"] if split_total["done"] else None
+                progress(total, expected)
+    finally:
+        # Interrompre les étapes amont en cas d'erreur
+        stop.set()
+        for stage in stages:
+            stage.join()
+
+    log_throughput(document, total, reused, time.perf_counter() - start, batch_size)
+    return total
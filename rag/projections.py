@@ -0,0 +1,222 @@
+"""
+Projections 3D (PCA, t-SNE, UMAP) des embeddings pour la vue `/3d_view/`.
+
+Les modèles sont ajustés une fois par version du corpus puis enregistrés sur
+disque (`PROJECTIONS_PATH`). À chaque requête, seul le point de la question est
+projeté : `transform` pour PCA et UMAP. t-SNE n'ayant pas de `transform`, la
+question est placée à la moyenne des coordonnées t-SNE de ses plus proches
+voisins, pondérée par leur similarité cosinus : c'est une approximation, la
+position exacte dépendrait d'un nouvel ajustement complet.
+
+Quand des documents sont ajoutés ou supprimés, un nouvel ajustement est lancé
+en arrière-plan ; la version précédente reste servie en attendant. Le fichier
+est partagé par les processus : avant d'ajuster, chacun relit celui écrit par
+un autre (par exemple le worker d'ingestion) pour la version courante.
+"""
+
+import fcntl
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from umap import UMAP
+
+from .models import Chunk, Document
+
+logger = logging.getLogger(__name__)
+
+_bundle = None
+_lock = threading.Lock()
+_refit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="projections")
+_refit_pending = threading.Event()
+
+
+def corpus_version():
+    """
+    Version du corpus : nombre de chunks et plus grand identifiant, ce qui change
+    à chaque ajout ou suppression de document.
+    """
+    stats = Chunk.objects.aggregate(count=Count("id"), last=Max("id"))
+    return f"{stats['count']}:{stats['last']}"
+
+
+def fit_projections():
+    """
+    Ajuste PCA, t-SNE et UMAP sur l'ensemble des embeddings et enregistre le résultat.
+
+    :return: Dictionnaire des modèles et coordonnées, ou None si le corpus est vide.
+    """
+    version = corpus_version()
+    rows = list(Chunk.objects.order_by("id").values_list("id", "embedding"))
+    if not rows:
+        return None
+
+    ids = np.array([row[0] for row in rows])
+    embeddings = np.array([row[1] for row in rows], dtype=np.float32)
+    del rows
+
+    pca = PCA(n_components=3)
+    pca_coords = pca.fit_transform(embeddings)
+
+    tsne = TSNE(
+        n_components=3,
+        perplexity=min(30, len(ids) - 1),
+        random_state=42,
+    )
+    tsne_coords = tsne.fit_transform(embeddings)
+
+    umap_model = UMAP(n_components=3, random_state=42)
+    umap_coords = umap_model.fit_transform(embeddings)
+
+    bundle = {
+        "version": version,
+        "ids": ids,
+        "index": {chunk_id: i for i, chunk_id in enumerate(ids.tolist())},
+        "pca": pca,
+        "pca_coords": pca_coords,
+        "tsne_coords": tsne_coords,
+        "umap": umap_model,
+        "umap_coords": umap_coords,
+    }
+
+    # Écriture dans un fichier temporaire puis remplacement atomique : un autre
+    # processus ne lit jamais un fichier à moitié écrit
+    path = settings.PROJECTIONS_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    joblib.dump(bundle, temporary)
+    os.replace(temporary, path)
+    logger.info(f"✅ Projections 3D ajustées sur {len(ids)} chunks ({version}).")
+    return bundle
+
+
+def _load_from_disk():
+    try:
+        return joblib.load(settings.PROJECTIONS_PATH)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"❌ Projections 3D illisibles, nouvel ajustement: {str(e)}")
+        return None
+
+
+def get_projections():
+    """
+    Retourne les projections du corpus. Si elles datent d'une version
+    précédente, elles sont servies telles quelles et une mise à jour est
+    planifiée (relecture du fichier s'il est à jour, sinon nouvel ajustement) ;
+    si aucune n'existe, le premier ajustement est lancé en
+    arrière-plan, sans bloquer la requête.
+
+    :return: Dictionnaire des projections, ou None si elles sont en cours de
+        calcul (ou si le corpus est vide).
+    """
+    global _bundle
+    with _lock:
+        if _bundle is None:
+            _bundle = _load_from_disk()
+        bundle = _bundle
+    if bundle is None:
+        schedule_refit()
+        return None
+
+    if bundle["version"] != corpus_version():
+        schedule_refit()
+    return bundle
+
+
+@contextmanager
+def _fit_lock():
+    """
+    Verrou `fcntl` partagé par les processus (serveurs web, workers
+    d'ingestion) : un seul ajustement à la fois pour un même fichier.
+    """
+    path = settings.PROJECTIONS_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _refit():
+    global _bundle
+    try:
+        with _fit_lock():
+            # Projections peut-être déjà ajustées par un autre processus
+            bundle = _load_from_disk()
+            if bundle is None or bundle["version"] != corpus_version():
+                bundle = fit_projections()
+        with _lock:
+            _bundle = bundle
+    except Exception as e:
+        logger.error(f"❌ Erreur d'ajustement des projections 3D: {str(e)}")
+    finally:
+        # Après l'ajustement : les requêtes reçues pendant celui-ci n'en
+        # planifient pas un second pour la même version
+        _refit_pending.clear()
+        close_old_connections()
+
+
+def schedule_refit():
+    """
+    Planifie un nouvel ajustement en arrière-plan. Les demandes reçues pendant
+    qu'un ajustement est déjà en attente sont regroupées.
+    """
+    if _refit_pending.is_set():
+        return
+    _refit_pending.set()
+    _refit_executor.submit(_refit)
+
+
+def project_query(bundle, query_embedding, neighbor_ids, neighbor_similarities):
+    """
+    Projette la question dans les trois espaces.
+
+    :param bundle: Projections du corpus.
+    :param query_embedding: Embedding de la question.
+    :param neighbor_ids: Identifiants des chunks les plus proches de la question.
+    :param neighbor_similarities: Similarités cosinus correspondantes.
+    :return: Coordonnées (1, 3) de la question pour PCA, t-SNE et UMAP.
+    """
+    query = np.array([query_embedding], dtype=np.float32)
+    reduced_pca = bundle["pca"].transform(query)
+    reduced_umap = bundle["umap"].transform(query)
+
+    # Approximation t-SNE : barycentre des voisins pondéré par la similarité
+    positions = [bundle["index"].get(chunk_id) for chunk_id in neighbor_ids]
+    pairs = [
+        (position, max(similarity, 0.0))
+        for position, similarity in zip(positions, neighbor_similarities)
+        if position is not None
+    ]
+    if pairs:
+        rows = [position for position, _ in pairs]
+        weights = np.array([weight for _, weight in pairs])
+        if weights.sum() == 0:
+            weights = np.ones_like(weights)
+        reduced_tsne = np.average(
+            bundle["tsne_coords"][rows], axis=0, weights=weights
+        ).reshape(1, 3)
+    else:
+        reduced_tsne = bundle["tsne_coords"].mean(axis=0).reshape(1, 3)
+
+    return reduced_pca, reduced_tsne, reduced_umap
+
+
+@receiver(post_delete, sender=Document)
+def refit_after_delete(sender, instance, **kwargs):
+    schedule_refit()
@@ -1,65 +1,366 @@
+import logging
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import close_old_connections
 from langchain.prompts import ChatPromptTemplate
-from langchain_ollama import OllamaLLM
-from pgvector.django import CosineDistance
 
-from .embedding_function import embed_query
-from .models import Chunk
+from .answer_cache import acaching_stream, caching_stream, find_cached_answer
+from .context import build_context
+from .embedding_function import aembed_query, embed_query
+from .metrics import (
+    CONTEXT_TOKENS,
+    QUERIES_TOTAL,
+    QUERY_STAGE_SECONDS,
+    atimed_stream,
+    count,
+    observe,
+    timed_stream,
+    timer,
+)
+from .mmr import diversify
+from .models import Chunk, Document
+from .ollama_client import get_llm
+from .scheduler import CHAT, ascheduled_stream, scheduled_stream
+from .vector_index import distance_sql, search_params_sql, to_vector_literal
+from .vector_store import RESULT_COLUMNS_SQL, PgVectorStore, get_vector_store
+
+logger = logging.getLogger(__name__)
 
+NO_DOCUMENT_MESSAGE = "Désolé, aucun document pertinent trouvé."
 
-def get_similar_chunks(query_embedding, top_k=5):
+
+def get_similar_chunks(
+    query_embedding, top_k=5, probes=None, ef_search=None, document_ids=None
+):
     """
-    Trouve les chunks les plus similaires à un embedding donné en utilisant la distance cosinus.
+    Trouve les chunks les plus similaires à un embedding donné en utilisant la distance cosinus,
+    via le backend configuré par `VECTOR_STORE_BACKEND` (voir rag/vector_store.py).
 
     :param query_embedding: Embedding de la requête utilisateur (liste de flottants).
     :param top_k: Nombre de résultats les plus proches à retourner.
+    :param probes: Listes IVFFlat visitées (par défaut `VECTOR_SEARCH_PROBES`).
+    :param ef_search: Candidats HNSW explorés (par défaut `VECTOR_SEARCH_EF_SEARCH`).
+    :param document_ids: Documents auxquels restreindre la recherche (None : tous).
     :return: Liste des chunks et leurs distances.
     """
-    # Effectuer la recherche avec CosineDistance
-    similar_chunks = Chunk.objects.annotate(
-        similarity=1 - CosineDistance("embedding", query_embedding)
-    ).order_by(
-        "-similarity"
-    )[  # Distance cosinus croissante (plus proche = meilleur)
-        :top_k
-    ]  # Limite à top_k résultats
+    params = {"document_ids": document_ids}
+    if probes is not None:
+        params["probes"] = probes
+    if ef_search is not None:
+        params["ef_search"] = ef_search
+    return get_vector_store().search(query_embedding, top_k, **params)
+
+
+def get_hybrid_chunks(
+    query_text: str, query_embedding, top_k=5, document_ids=None
+):
+    """
+    Recherche hybride : fusionne par Reciprocal Rank Fusion le classement vectoriel
+    (distance cosinus) et le classement plein texte (`search_vector`, index GIN).
+    Les deux recherches et la fusion sont faites en une seule requête SQL,
+    envoyée avec les paramètres de l'index en un seul aller-retour.
+
+    Score RRF d'un chunk : somme sur chaque classement de poids / (k + rang).
+
+    :param query_text: Question utilisateur, pour la recherche plein texte.
+    :param query_embedding: Embedding de la question.
+    :param top_k: Nombre de résultats à retourner.
+    :param document_ids: Documents auxquels restreindre la recherche (None : tous).
+    :return: Liste des chunks (sans embedding, avec `document_name`), annotés de
+        `similarity` (cosinus) et `score` (RRF).
+    """
+    table = Chunk._meta.db_table
+    # Distance servie par l'index en place (complet, halfvec ou binaire)
+    distance = distance_sql("embedding")
+    # Filtre appliqué dans chacune des deux recherches
+    scope = "document_id = ANY(%(document_ids)s)" if document_ids is not None else ""
+    sql = f"""
+        WITH vector_leg AS (
+            SELECT id, row_number() OVER (ORDER BY {distance}) AS rank
+            FROM {table}
+            {"WHERE " + scope if scope else ""}
+            ORDER BY {distance}
+            LIMIT %(vector_candidates)s
+        ),
+        lexical_leg AS (
+            SELECT id, row_number() OVER (ORDER BY ts_rank_cd(search_vector, query) DESC) AS rank
+            FROM {table}, websearch_to_tsquery('simple', %(query)s) AS query
+            WHERE search_vector @@ query
+            {"AND " + scope if scope else ""}
+            ORDER BY ts_rank_cd(search_vector, query) DESC
+            LIMIT %(lexical_candidates)s
+        ),
+        fused AS (
+            SELECT
+                COALESCE(v.id, l.id) AS id,
+                COALESCE(%(vector_weight)s / (%(rrf_k)s + v.rank), 0)
+                + COALESCE(%(lexical_weight)s / (%(rrf_k)s + l.rank), 0) AS score
+            FROM vector_leg v
+            FULL OUTER JOIN lexical_leg l ON v.id = l.id
+        )
+        SELECT {RESULT_COLUMNS_SQL}, fused.score,
+            1 - (c.embedding <=> %(embedding)s::vector) AS similarity
+        FROM fused
+        JOIN {table} c ON c.id = fused.id
+        JOIN {Document._meta.db_table} d ON d.id = c.document_id
+        ORDER BY fused.score DESC
+        LIMIT %(top_k)s
+    """
+    params = {
+        "embedding": to_vector_literal(query_embedding),
+        "query": query_text,
+        "document_ids": list(document_ids or []),
+        "vector_candidates": settings.HYBRID_VECTOR_CANDIDATES,
+        "lexical_candidates": settings.HYBRID_LEXICAL_CANDIDATES,
+        "vector_weight": float(settings.HYBRID_VECTOR_WEIGHT),
+        "lexical_weight": float(settings.HYBRID_LEXICAL_WEIGHT),
+        "rrf_k": float(settings.HYBRID_RRF_K),
+        "top_k": top_k,
+    }
+
+    ef_search = max(
+        settings.VECTOR_SEARCH_EF_SEARCH, settings.HYBRID_VECTOR_CANDIDATES
+    )
+    search_params = search_params_sql(
+        ef_search=ef_search,
+        iterative_scan=(
+            settings.VECTOR_ITERATIVE_SCAN if document_ids is not None else None
+        ),
+    )
+    # Paramètres de l'index et recherche envoyés en un seul message : les
+    # instructions d'un même message forment un bloc de transaction implicite,
+    # où SET LOCAL s'applique à la recherche puis expire avec elle
+    return list(Chunk.objects.raw("; ".join(search_params + [sql]), params))
+
+
+def retrieve_chunks(query_text: str, query_embedding, top_k=5, document_ids=None):
+    """
+    Récupère les chunks de contexte selon `RETRIEVAL_MODE` ("vector" ou "hybrid").
+    Avec `MMR_ENABLED`, `top_k * MMR_OVERSAMPLING` candidats sont récupérés puis
+    réduits à `top_k` par MMR (voir rag/mmr.py) pour éviter les chunks redondants.
+
+    :param query_text: Question utilisateur.
+    :param query_embedding: Embedding de la question.
+    :param top_k: Nombre de résultats à retourner.
+    :param document_ids: Documents auxquels restreindre la recherche (None : tous).
+    :return: Liste des chunks.
+    """
+    candidates = top_k * settings.MMR_OVERSAMPLING if settings.MMR_ENABLED else top_k
+
+    if settings.RETRIEVAL_MODE == "hybrid" and isinstance(
+        get_vector_store(), PgVectorStore
+    ):
+        chunks = get_hybrid_chunks(
+            query_text, query_embedding, candidates, document_ids
+        )
+    else:
+        if settings.RETRIEVAL_MODE == "hybrid":
+            # La fusion est faite en SQL : elle requiert les embeddings dans PostgreSQL
+            logger.warning(
+                "⚠️ Recherche hybride indisponible avec ce backend vectoriel, "
+                "recherche vectorielle seule."
+            )
+        chunks = get_similar_chunks(
+            query_embedding, candidates, document_ids=document_ids
+        )
+
+    if settings.MMR_ENABLED:
+        chunks = diversify(chunks, query_embedding, top_k)
+    return chunks
+
+
+def resolve_scope(document_ids=None, collection=None):
+    """
+    Documents sur lesquels porte la question.
+
+    :param document_ids: Identifiants de documents demandés.
+    :param collection: Collection demandée (combinée aux identifiants s'il y en a).
+    :return: Liste d'identifiants, ou None pour tout le corpus.
+    """
+    if not document_ids and not collection:
+        return None
+    documents = Document.objects.all()
+    if document_ids:
+        documents = documents.filter(pk__in=document_ids)
+    if collection:
+        documents = documents.filter(collection=collection)
+    return list(documents.values_list("id", flat=True))
+
+
+def prepare_rag(
+    query_text: str, query_embedding, document_ids=None, collection=None
+):
+    """
+    Partie base de données du pipeline RAG : cache de réponses, récupération des
+    chunks, construction du prompt et des sources.
+
+    :param query_text: Question utilisateur.
+    :param query_embedding: Embedding de la question.
+    :param document_ids: Documents auxquels restreindre la question.
+    :param collection: Collection à laquelle restreindre la question.
+    :return: Dictionnaire avec `cached` (réponse en cache ou None), `chunks`,
+        `prompt` (None si aucun chunk), `sources`, `scoped` (question restreinte)
+        et `context_tokens` (taille estimée du contexte).
+    """
+    document_ids = resolve_scope(document_ids, collection)
+    scoped = document_ids is not None
+    empty = {
+        "cached": None,
+        "chunks": [],
+        "prompt": None,
+        "sources": [],
+        "scoped": scoped,
+        "context_tokens": 0,
+    }
+    if scoped and not document_ids:
+        return empty
+
+    # Rejouer la réponse d'une question quasi identique déjà traitée ; le cache
+    # est global, il n'est pas utilisé pour une question restreinte
+    cached = None
+    if not scoped:
+        with timer(QUERY_STAGE_SECONDS, "answer_cache"):
+            cached = find_cached_answer(query_embedding)
+    if cached is not None:
+        return {
+            "cached": cached,
+            "chunks": [],
+            "prompt": None,
+            "sources": cached.sources,
+            "scoped": scoped,
+            "context_tokens": 0,
+        }
+
+    # Rechercher les chunks similaires
+    with timer(QUERY_STAGE_SECONDS, "retrieve"):
+        similar_chunks = retrieve_chunks(
+            query_text, query_embedding, document_ids=document_ids
+        )
 
-    return similar_chunks
+    if not similar_chunks:
+        return empty
+
+    # Générer le contexte à partir des chunks : chunks voisins fusionnés, dans
+    # la limite du budget de tokens
+    with timer(QUERY_STAGE_SECONDS, "prompt"):
+        context = build_context(similar_chunks)
+        prompt_template = ChatPromptTemplate.from_template(settings.PROMPT_TEMPLATE)
+        prompt = prompt_template.format(context=context["text"], question=query_text)
+
+        # Collecter les sources (nom du document joint par la recherche)
+        sources = [
+            f"{chunk.document_name}: Page {chunk.page}, Chunk {chunk.chunk_index}"
+            for chunk in context["chunks"]
+        ]
+    logger.info(
+        f"Contexte de {context['tokens']} tokens (estimés) à partir de "
+        f"{len(context['chunks'])}/{len(similar_chunks)} chunks."
+    )
+    observe(CONTEXT_TOKENS, context["tokens"])
 
+    return {
+        "cached": None,
+        "chunks": context["chunks"],
+        "prompt": prompt,
+        "sources": sources,
+        "scoped": scoped,
+        "context_tokens": context["tokens"],
+    }
 
-def query_rag(query_text: str):
+
+def query_rag(query_text: str, document_ids=None, collection=None):
     """
     Interroge une base PostgreSQL pour récupérer des chunks similaires,
     puis utilise un modèle de langage pour répondre.
 
     :param query_text: Question utilisateur.
+    :param document_ids: Documents auxquels restreindre la question.
+    :param collection: Collection à laquelle restreindre la question.
     :return: Générateur de réponse et liste des sources.
     """
     # Générer l'embedding pour la requête
-    query_embedding = embed_query(query_text)
+    with timer(QUERY_STAGE_SECONDS, "embed"):
+        query_embedding = embed_query(query_text)
 
-    # Rechercher les chunks similaires
-    similar_chunks = get_similar_chunks(query_embedding)
+    rag = prepare_rag(query_text, query_embedding, document_ids, collection)
+    if rag["cached"] is not None:
+        count(QUERIES_TOTAL, result="cached")
+        return iter([rag["cached"].answer]), rag["sources"]
+    if rag["prompt"] is None:
+        count(QUERIES_TOTAL, result="no_document")
+        return iter([NO_DOCUMENT_MESSAGE]), []
+
+    # Charger le modèle de langage et streamer la réponse
+    count(QUERIES_TOTAL, result="generated")
+    model = get_llm()
+    stream = timed_stream(scheduled_stream(CHAT, model.stream(rag["prompt"])))
+    if rag["scoped"]:
+        return stream, rag["sources"]
+    response_generator = caching_stream(
+        stream,
+        query_text,
+        query_embedding,
+        rag["sources"],
+        rag["chunks"],
+    )
+
+    return response_generator, rag["sources"]
+
+
+def _prepare_rag_in_thread(*args):
+    """
+    `prepare_rag` dans un thread du pool : la connexion à la base propre à ce
+    thread est fermée ensuite selon `CONN_MAX_AGE`, comme en fin de requête.
+    """
+    try:
+        return prepare_rag(*args)
+    finally:
+        close_old_connections()
 
-    if not similar_chunks:
-        return iter(["Désolé, aucun document pertinent trouvé."]), []
 
-    # Générer le contexte à partir des chunks
-    context_text = "\n\n---\n\n".join([chunk.content for chunk in similar_chunks])
+async def _replay(text: str):
+    yield text
 
-    # Charger le modèle de langage
-    prompt_template = ChatPromptTemplate.from_template(settings.PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, question=query_text)
-    model = OllamaLLM(
-        model=settings.LANGUAGE_MODEL_NAME,
-        base_url=settings.OLLAMA_API_URL,
+
+async def aquery_rag(query_text: str, document_ids=None, collection=None):
+    """
+    Variante asyncio de `query_rag` : l'embedding et la génération sont attendus
+    sans bloquer de thread. La partie base de données (qui règle les paramètres
+    de l'index dans une transaction) passe par `sync_to_async`, dans un thread
+    du pool.
+
+    :param query_text: Question utilisateur.
+    :param document_ids: Documents auxquels restreindre la question.
+    :param collection: Collection à laquelle restreindre la question.
+    :return: Générateur asynchrone de réponse et liste des sources.
+    """
+    with timer(QUERY_STAGE_SECONDS, "embed"):
+        query_embedding = await aembed_query(query_text)
+
+    # Hors du thread unique des appels `thread_sensitive` : les recherches des
+    # questions simultanées ne s'attendent pas les unes les autres
+    rag = await sync_to_async(_prepare_rag_in_thread, thread_sensitive=False)(
+        query_text, query_embedding, document_ids, collection
     )
+    if rag["cached"] is not None:
+        count(QUERIES_TOTAL, result="cached")
+        return _replay(rag["cached"].answer), rag["sources"]
+    if rag["prompt"] is None:
+        count(QUERIES_TOTAL, result="no_document")
+        return _replay(NO_DOCUMENT_MESSAGE), []
 
-    # Streamer la réponse et collecter les sources
-    response_generator = model.stream(prompt)
-    sources = [
-        f"{chunk.document.file.name}: Page {chunk.page}, Chunk {chunk.chunk_index}"
-        for chunk in similar_chunks
-    ]
+    count(QUERIES_TOTAL, result="generated")
+    model = get_llm()
+    stream = atimed_stream(ascheduled_stream(CHAT, model.astream(rag["prompt"])))
+    if rag["scoped"]:
+        return stream, rag["sources"]
+    response_generator = acaching_stream(
+        stream,
+        query_text,
+        query_embedding,
+        rag["sources"],
+        rag["chunks"],
+    )
 
-    return response_generator, sources
+    return response_generator, rag["sources"]
@@ -0,0 +1,283 @@
+"""
+Ordonnanceur des appels à Ollama, par classe de priorité.
+
+Tous les appels du processus passent par un nombre limité de places
+(`OLLAMA_SCHEDULER_MAX_CONCURRENCY`). Chaque classe a sa propre limite de
+concurrence et sa file d'attente bornée (`OLLAMA_SCHEDULER_CLASSES`) :
+
+- "chat" : génération des réponses, la plus prioritaire ;
+- "query" : embedding des questions ;
+- "ingestion" : embeddings des documents, en masse.
+
+Quand une place se libère, elle revient à la classe la plus prioritaire qui
+a des appels en attente et n'a pas atteint sa limite : une question passe
+toujours devant l'ingestion en attente. La limite de l'ingestion, inférieure
+au total, garde des places pour les questions même pendant un gros envoi.
+
+File pleine : l'appel est refusé (`OllamaBusy`) pour les classes interactives,
+ou réessayé avec un délai croissant ("backoff") pour l'ingestion.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHAT = "chat"
+QUERY = "query"
+INGESTION = "ingestion"
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class OllamaBusy(Exception):
+    """
+    Levée quand la file d'attente d'une classe est pleine, ou que l'attente
+    dépasse le délai demandé.
+    """
+
+
+class _Waiter:
+    def __init__(self, name, grant):
+        self.name = name
+        self.grant = grant
+        self.granted = False
+        self.enqueued_at = time.perf_counter()
+
+
+class OllamaScheduler:
+    """
+    Attribution des places d'appel à Ollama, utilisable depuis des threads
+    (`slot`) comme depuis une boucle asyncio (`aslot`).
+    """
+
+    def __init__(self, max_concurrency=None, classes=None):
+        self.max_concurrency = (
+            max_concurrency or settings.OLLAMA_SCHEDULER_MAX_CONCURRENCY
+        )
+        self.classes = classes or settings.OLLAMA_SCHEDULER_CLASSES
+        # Classes de la plus prioritaire à la moins prioritaire
+        self.order = sorted(
+            self.classes, key=lambda name: self.classes[name]["priority"]
+        )
+        self._lock = threading.Lock()
+        self._waiting = {name: deque() for name in self.classes}
+        self._running = {name: 0 for name in self.classes}
+        self._total = 0
+        self._stats = {
+            name: {
+                "submitted": 0,
+                "granted": 0,
+                "rejected": 0,
+                "completed": 0,
+                "max_queued": 0,
+                "wait_seconds": 0.0,
+            }
+            for name in self.classes
+        }
+
+    def _can_run(self, name):
+        return (
+            self._total < self.max_concurrency
+            and self._running[name] < self.classes[name]["concurrency"]
+        )
+
+    def _dispatch(self):
+        # Appelée avec le verrou : attribue les places libres par priorité
+        for name in self.order:
+            waiting = self._waiting[name]
+            while waiting and self._can_run(name):
+                waiter = waiting.popleft()
+                waiter.granted = True
+                self._running[name] += 1
+                self._total += 1
+                self._stats[name]["granted"] += 1
+                self._stats[name]["wait_seconds"] += (
+                    time.perf_counter() - waiter.enqueued_at
+                )
+                waiter.grant()
+
+    def _enqueue(self, name, grant):
+        """
+        :return: Le waiter mis en file, ou None si la file est pleine.
+        """
+        if name not in self.classes:
+            raise ValueError(f"Classe de priorité inconnue : '{name}'")
+        with self._lock:
+            waiting = self._waiting[name]
+            if len(waiting) >= self.classes[name]["queue_size"]:
+                self._stats[name]["rejected"] += 1
+                return None
+            waiter = _Waiter(name, grant)
+            waiting.append(waiter)
+            self._stats[name]["submitted"] += 1
+            self._stats[name]["max_queued"] = max(
+                self._stats[name]["max_queued"], len(waiting)
+            )
+            self._dispatch()
+            return waiter
+
+    def _cancel(self, waiter):
+        """
+        Retire un waiter de la file.
+
+        :return: False s'il a obtenu une place entre-temps (à rendre par l'appelant).
+        """
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiting[waiter.name].remove(waiter)
+            return True
+
+    def _backoff_delays(self):
+        delay = settings.OLLAMA_SCHEDULER_BACKOFF_INITIAL
+        while True:
+            yield delay
+            delay = min(delay * 2, settings.OLLAMA_SCHEDULER_BACKOFF_MAX)
+
+    def _full(self, name):
+        message = f"File d'attente Ollama '{name}' pleine."
+        logger.warning(f"⚠️ {message}")
+        return OllamaBusy(message)
+
+    def acquire(self, name, timeout=None):
+        """
+        Attend une place pour un appel de la classe `name` (thread bloqué).
+
+        :param timeout: Attente maximale en secondes (par défaut celle de la
+            classe, None : sans limite).
+        :raises OllamaBusy: File pleine (classe sans backoff) ou délai dépassé.
+        """
+        if timeout is None:
+            timeout = self.classes[name].get("timeout")
+        delays = self._backoff_delays()
+        while True:
+            event = threading.Event()
+            waiter = self._enqueue(name, event.set)
+            if waiter is not None:
+                break
+            if self.classes[name].get("on_full") != "backoff":
+                raise self._full(name)
+            time.sleep(next(delays))
+
+        if not event.wait(timeout) and self._cancel(waiter):
+            raise OllamaBusy(f"Attente d'Ollama trop longue ('{name}').")
+
+    async def aacquire(self, name, timeout=None):
+        """
+        Variante asyncio d'`acquire` : la coroutine attend sans bloquer de thread.
+        """
+        if timeout is None:
+            timeout = self.classes[name].get("timeout")
+        loop = asyncio.get_running_loop()
+        delays = self._backoff_delays()
+        while True:
+            future = loop.create_future()
+
+            def grant(future=future):
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None)
+                )
+
+            waiter = self._enqueue(name, grant)
+            if waiter is not None:
+                break
+            if self.classes[name].get("on_full") != "backoff":
+                raise self._full(name)
+            await asyncio.sleep(next(delays))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if self._cancel(waiter):
+                raise OllamaBusy(f"Attente d'Ollama trop longue ('{name}').")
+        except asyncio.CancelledError:
+            # Client déconnecté : ne pas garder la place
+            if not self._cancel(waiter):
+                self.release(name)
+            raise
+
+    def release(self, name):
+        with self._lock:
+            self._running[name] -= 1
+            self._total -= 1
+            self._stats[name]["completed"] += 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, name, timeout=None):
+        self.acquire(name, timeout)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    @asynccontextmanager
+    async def aslot(self, name, timeout=None):
+        await self.aacquire(name, timeout)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def stats(self):
+        """
+        :return: Par classe : appels en file (`queued`) et en cours (`running`),
+            compteurs cumulés et attente moyenne en secondes.
+        """
+        with self._lock:
+            return {
+                name: {
+                    "queued": len(self._waiting[name]),
+                    "running": self._running[name],
+                    **self._stats[name],
+                    "avg_wait_seconds": self._stats[name]["wait_seconds"]
+                    / max(self._stats[name]["granted"], 1),
+                }
+                for name in self.classes
+            }
+
+
+def get_scheduler():
+    """
+    Retourne l'ordonnanceur du processus.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OllamaScheduler()
+    return _scheduler
+
+
+def scheduled_stream(name, iterator):
+    """
+    Relaie un flux (génération du modèle) en occupant une place pendant toute
+    sa durée. La place est demandée à la lecture du premier élément.
+
+    :return: Générateur des éléments du flux.
+    """
+    with get_scheduler().slot(name):
+        yield from iterator
+
+
+async def ascheduled_stream(name, aiterator):
+    """
+    Variante asyncio de `scheduled_stream`. Le flux relayé est fermé avec
+    celui-ci, ce qui interrompt la génération si le client se déconnecte.
+
+    :return: Générateur asynchrone des éléments du flux.
+    """
+    try:
+        async with get_scheduler().aslot(name):
+            async for item in aiterator:
+                yield item
+    finally:
+        await aiterator.aclose()
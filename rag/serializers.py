@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Chunk, Document
+from .models import Chunk, Document, IngestionJob
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -8,10 +8,39 @@ class DocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ["id", "file", "uploaded_at"]
+        fields = ["id", "file", "collection", "uploaded_at"]
 
 
 class ChunkSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chunk
-        fields = "__all__"
+        fields = [
+            "id",
+            "document",
+            "content",
+            "page",
+            "chunk_index",
+            "content_hash",
+            "embedding_model",
+        ]
+
+
+class ChunkEmbeddingSerializer(ChunkSerializer):
+    class Meta(ChunkSerializer.Meta):
+        fields = ChunkSerializer.Meta.fields + ["embedding"]
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionJob
+        fields = [
+            "id",
+            "document",
+            "file_name",
+            "status",
+            "chunks_processed",
+            "chunks_total",
+            "error",
+            "created_at",
+            "updated_at",
+        ]
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_eventstream import send_event
+
+END_EVENT = "end"
+
+
+class BufferedEmitter:
+    """
+    Regroupe les tokens du modèle avant de les publier par SSE : le tampon est
+    envoyé dès qu'il atteint `SSE_FLUSH_CHARS` caractères ou que son plus ancien
+    token a attendu `SSE_FLUSH_INTERVAL` secondes. Ce délai est tenu par un
+    minuteur, même si le token suivant tarde (génération lente). `close`
+    envoie le reste puis un événement de fin de flux.
+    """
+
+    def __init__(
+        self, channel, event_type="message", max_chars=None, max_delay=None
+    ):
+        self.channel = channel
+        self.event_type = event_type
+        self.max_chars = max_chars or settings.SSE_FLUSH_CHARS
+        self.max_delay = (
+            settings.SSE_FLUSH_INTERVAL if max_delay is None else max_delay
+        )
+        self.events_sent = 0
+        self._parts = []
+        self._size = 0
+        self._first_at = None
+        self._timer = None
+        # Le minuteur publie depuis son propre thread
+        self._lock = threading.Lock()
+
+    def _buffer(self, text):
+        if not self._parts:
+            self._first_at = time.monotonic()
+        self._parts.append(text)
+        self._size += len(text)
+
+    def _should_flush(self):
+        return (
+            self._size >= self.max_chars
+            or time.monotonic() - self._first_at >= self.max_delay
+        )
+
+    def _take(self):
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._first_at = None
+        return text
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def add(self, text):
+        with self._lock:
+            first = not self._parts
+            self._buffer(text)
+            if self._should_flush():
+                self._send()
+            elif first:
+                # Échéance du plus ancien token du tampon
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _send(self):
+        # Appelée avec le verrou
+        self._cancel_timer()
+        if self._parts:
+            send_event(self.channel, self.event_type, {"text": self._take()})
+            self.events_sent += 1
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def close(self):
+        self.flush()
+        send_event(self.channel, END_EVENT, {})
+
+
+class AsyncBufferedEmitter(BufferedEmitter):
+    """
+    Variante asyncio de `BufferedEmitter`. L'échéance est une tâche de la
+    boucle, annulée si le tampon est envoyé avant.
+    """
+
+    def _cancel_timer(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        await self.flush()
+
+    async def add(self, text):
+        first = not self._parts
+        self._buffer(text)
+        if self._should_flush():
+            await self.flush()
+        elif first:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        self._cancel_timer()
+        if self._parts:
+            # Le tampon est vidé avant l'envoi : les envois gardent l'ordre
+            await sync_to_async(send_event)(
+                self.channel, self.event_type, {"text": self._take()}
+            )
+            self.events_sent += 1
+
+    async def close(self):
+        await self.flush()
+        await sync_to_async(send_event)(self.channel, END_EVENT, {})
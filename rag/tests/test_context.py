@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from rag.context import SEPARATOR, build_context, merge_overlap, truncate_sentences
+
+
+def make_chunk(chunk_id, content, chunk_index, document_id=1, page=1):
+    return SimpleNamespace(
+        id=chunk_id,
+        content=content,
+        chunk_index=chunk_index,
+        document_id=document_id,
+        page=page,
+    )
+
+
+@override_settings(
+    CONTEXT_CHARS_PER_TOKEN=4, CONTEXT_MAX_OVERLAP=200, CONTEXT_MIN_OVERLAP=20
+)
+class MergeOverlapTests(SimpleTestCase):
+    def test_removes_repeated_overlap(self):
+        previous = "Premier paragraphe. Le réseau utilise des serveurs distants."
+        following = "Le réseau utilise des serveurs distants. Suite du texte."
+        self.assertEqual(
+            merge_overlap(previous, following),
+            "Premier paragraphe. Le réseau utilise des serveurs distants. "
+            "Suite du texte.",
+        )
+
+    def test_short_match_is_not_an_overlap(self):
+        self.assertEqual(
+            merge_overlap("Le réseau utilise des", "serveurs distants."),
+            "Le réseau utilise des\nserveurs distants.",
+        )
+
+    def test_overlap_starts_on_a_whole_word(self):
+        previous = "Ils étudient des serveurs distants pour le calcul."
+        following = "udient des serveurs distants pour le calcul. Fin."
+        self.assertEqual(
+            merge_overlap(previous, following), previous + "\n" + following
+        )
+
+    def test_max_overlap_bounds_the_search(self):
+        previous = "Début. Le réseau utilise des serveurs distants."
+        following = "Le réseau utilise des serveurs distants. Fin."
+        self.assertEqual(
+            merge_overlap(previous, following, max_overlap=10),
+            previous + "\n" + following,
+        )
+
+
+@override_settings(CONTEXT_CHARS_PER_TOKEN=4)
+class TruncateSentencesTests(SimpleTestCase):
+    def test_text_within_budget_is_unchanged(self):
+        text = "Une phrase. Deux phrases. Trois."
+        self.assertEqual(truncate_sentences(text, 8), text)
+
+    def test_keeps_whole_sentences(self):
+        text = "Une phrase. Deux phrases. Trois."
+        self.assertEqual(truncate_sentences(text, 5), "Une phrase.")
+
+    def test_empty_when_no_sentence_fits(self):
+        self.assertEqual(truncate_sentences("Une phrase. Deux phrases.", 2), "")
+
+
+@override_settings(
+    CONTEXT_CHARS_PER_TOKEN=4,
+    CONTEXT_MAX_OVERLAP=200,
+    CONTEXT_MIN_OVERLAP=20,
+    CONTEXT_TOKEN_BUDGET=1000,
+)
+class BuildContextTests(SimpleTestCase):
+    def test_merges_adjacent_chunks_of_a_page(self):
+        first = make_chunk(1, "Début du texte. La suite est partagée ici.", 0)
+        second = make_chunk(2, "La suite est partagée ici. Et la fin.", 1)
+        context = build_context([second, first])
+        self.assertEqual(
+            context["text"], "Début du texte. La suite est partagée ici. Et la fin."
+        )
+        self.assertEqual(context["chunks"], [first, second])
+
+    def test_passages_follow_relevance(self):
+        best = make_chunk(1, "Passage le plus pertinent.", 0, document_id=2)
+        other = make_chunk(2, "Passage moins pertinent.", 0, document_id=1)
+        context = build_context([best, other])
+        self.assertEqual(
+            context["text"],
+            "Passage le plus pertinent." + SEPARATOR + "Passage moins pertinent.",
+        )
+        self.assertEqual(context["chunks"], [best, other])
+
+    def test_last_passage_is_cut_at_a_sentence(self):
+        best = make_chunk(1, "Premier passage complet.", 0, page=1)
+        other = make_chunk(2, "Phrase gardée. " + "Phrase coupée. " * 20, 0, page=2)
+        context = build_context([best, other], token_budget=15)
+        self.assertEqual(
+            context["text"], "Premier passage complet." + SEPARATOR + "Phrase gardée."
+        )
+        self.assertEqual(context["chunks"], [best, other])
+        self.assertLessEqual(context["tokens"], 15)
+
+    def test_first_passage_is_cut_at_a_word(self):
+        chunk = make_chunk(1, "Une très longue phrase sans aucune fin", 0)
+        context = build_context([chunk], token_budget=4)
+        self.assertEqual(context["text"], "Une très longue")
+        self.assertEqual(context["chunks"], [chunk])
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from rag.scheduler import CHAT, INGESTION, QUERY, OllamaBusy, OllamaScheduler
+
+
+def make_scheduler(max_concurrency=1, queue_size=4):
+    return OllamaScheduler(
+        max_concurrency,
+        {
+            CHAT: {
+                "priority": 0,
+                "concurrency": 1,
+                "queue_size": queue_size,
+                "on_full": "reject",
+                "timeout": None,
+            },
+            QUERY: {
+                "priority": 1,
+                "concurrency": 1,
+                "queue_size": queue_size,
+                "on_full": "reject",
+                "timeout": None,
+            },
+            INGESTION: {
+                "priority": 2,
+                "concurrency": 1,
+                "queue_size": queue_size,
+                "on_full": "backoff",
+                "timeout": None,
+            },
+        },
+    )
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition non atteinte à temps.")
+        time.sleep(0.001)
+
+
+def start_call(scheduler, name, granted):
+    """
+    Appel dans un thread : note la classe quand la place est obtenue, puis la rend.
+    """
+
+    def call():
+        with scheduler.slot(name):
+            granted.append(name)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    return thread
+
+
+class PriorityTests(SimpleTestCase):
+    def test_freed_slot_goes_to_the_most_urgent_class(self):
+        scheduler = make_scheduler()
+        scheduler.acquire(QUERY)
+        granted = []
+        threads = []
+        for name in (INGESTION, QUERY, CHAT):
+            threads.append(start_call(scheduler, name, granted))
+            wait_until(lambda name=name: scheduler.stats()[name]["queued"] == 1)
+
+        scheduler.release(QUERY)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(granted, [CHAT, QUERY, INGESTION])
+
+    def test_class_limit_keeps_slots_for_other_classes(self):
+        scheduler = make_scheduler(max_concurrency=2)
+        scheduler.acquire(INGESTION)
+        granted = []
+        ingestion = start_call(scheduler, INGESTION, granted)
+        wait_until(lambda: scheduler.stats()[INGESTION]["queued"] == 1)
+
+        # La seconde place reste libre pour une question
+        scheduler.acquire(CHAT, timeout=1)
+        self.assertEqual(scheduler.stats()[INGESTION]["queued"], 1)
+
+        scheduler.release(CHAT)
+        scheduler.release(INGESTION)
+        ingestion.join()
+        self.assertEqual(granted, [INGESTION])
+
+
+class QueueTests(SimpleTestCase):
+    def test_full_queue_is_rejected(self):
+        scheduler = make_scheduler(queue_size=1)
+        scheduler.acquire(CHAT)
+        granted = []
+        waiting = start_call(scheduler, CHAT, granted)
+        wait_until(lambda: scheduler.stats()[CHAT]["queued"] == 1)
+
+        with self.assertRaises(OllamaBusy):
+            scheduler.acquire(CHAT)
+        self.assertEqual(scheduler.stats()[CHAT]["rejected"], 1)
+
+        scheduler.release(CHAT)
+        waiting.join()
+        self.assertEqual(granted, [CHAT])
+
+    def test_wait_timeout_raises_and_leaves_the_queue(self):
+        scheduler = make_scheduler()
+        scheduler.acquire(CHAT)
+
+        with self.assertRaises(OllamaBusy):
+            scheduler.acquire(CHAT, timeout=0.01)
+        stats = scheduler.stats()[CHAT]
+        self.assertEqual((stats["queued"], stats["running"]), (0, 1))
+
+    @override_settings(
+        OLLAMA_SCHEDULER_BACKOFF_INITIAL=0.001, OLLAMA_SCHEDULER_BACKOFF_MAX=0.005
+    )
+    def test_full_ingestion_queue_backs_off_then_runs(self):
+        scheduler = make_scheduler(queue_size=1)
+        scheduler.acquire(INGESTION)
+        granted = []
+        first = start_call(scheduler, INGESTION, granted)
+        wait_until(lambda: scheduler.stats()[INGESTION]["queued"] == 1)
+        second = start_call(scheduler, INGESTION, granted)
+        wait_until(lambda: scheduler.stats()[INGESTION]["rejected"] >= 1)
+
+        scheduler.release(INGESTION)
+        first.join()
+        second.join()
+        self.assertEqual(granted, [INGESTION, INGESTION])
+        self.assertEqual(scheduler.stats()[INGESTION]["running"], 0)
+
+
+class CancellationTests(SimpleTestCase):
+    async def wait_queued(self, scheduler, name):
+        while scheduler.stats()[name]["queued"] == 0:
+            await asyncio.sleep(0.001)
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        scheduler = make_scheduler()
+        scheduler.acquire(CHAT)
+        entered = []
+
+        async def call():
+            async with scheduler.aslot(CHAT):
+                entered.append(CHAT)
+
+        task = asyncio.create_task(call())
+        await asyncio.wait_for(self.wait_queued(scheduler, CHAT), 2)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        scheduler.release(CHAT)
+        stats = scheduler.stats()[CHAT]
+        self.assertEqual((stats["queued"], stats["running"], entered), (0, 0, []))
+
+    async def test_slot_granted_before_cancellation_is_released(self):
+        scheduler = make_scheduler()
+        scheduler.acquire(CHAT)
+
+        async def call():
+            async with scheduler.aslot(CHAT):
+                pass
+
+        task = asyncio.create_task(call())
+        await asyncio.wait_for(self.wait_queued(scheduler, CHAT), 2)
+        # Place attribuée, puis annulation avant la reprise de la tâche
+        scheduler.release(CHAT)
+        self.assertEqual(scheduler.stats()[CHAT]["running"], 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(scheduler.stats()[CHAT]["running"], 0)
+
+    async def test_cancelled_call_releases_its_slot(self):
+        scheduler = make_scheduler()
+        inside = asyncio.Event()
+
+        async def call():
+            async with scheduler.aslot(CHAT):
+                inside.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(call())
+        await asyncio.wait_for(inside.wait(), 2)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(scheduler.stats()[CHAT]["running"], 0)
@@ -10,12 +10,12 @@ from . import views, viewsets
 router = HybridRouter()
 router.register(r"document", viewsets.DocumentViewSet)
 router.register(r"chunk", viewsets.ChunkViewSet)
+router.register(r"ingestion_job", viewsets.IngestionJobViewSet)
 router.register(
     "event",
     EventsViewSet,
     basename="events1",
 )
-router.register(r"chat", views.ChatAPIView, basename="chat")
 router.register(r"schema/swagger-ui", SpectacularSwaggerView, basename="swagger-ui")
 router.register(r"schema", SpectacularAPIView, basename="schema")
 
@@ -38,5 +38,9 @@ urlpatterns = [
     ),  # URL pour les événements, chat en temps réel
     path("chunks/", views.ChunkListView.as_view(), name="chunk_list"),
     path("3d_view/", views.view_request_in_3d, name="test"),
+    path("health/", views.health, name="health"),  # État de préparation
+    path("metrics/", views.metrics_view, name="metrics"),  # Métriques Prometheus
+    # API de chat : vue asynchrone hors du routeur DRF
+    path("api/chat/", views.chat_api, name="chat_api"),
     path("api/", include(router.urls)),
 ]
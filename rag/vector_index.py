@@ -0,0 +1,321 @@
+"""
+Gestion de l'index ANN (IVFFlat ou HNSW) sur `Chunk.embedding`.
+
+L'index n'est pas déclaré dans `Chunk.Meta` : son type et ses paramètres
+dépendent des settings et, pour IVFFlat, du nombre de lignes au moment de la
+construction. La migration 0005 crée un index HNSW par défaut (DDL figé) ;
+la commande `python manage.py rebuild_vector_index` le reconstruit selon les
+settings, après un changement de réglage ou un chargement massif.
+"""
+
+import logging
+import math
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "embedding_cosine_idx"
+# Index construit en parallèle de l'ancien par une reconstruction CONCURRENTLY
+TEMPORARY_INDEX_NAME = f"{INDEX_NAME}_new"
+PREVIOUS_INDEX_NAME = f"{INDEX_NAME}_old"
+TABLE_NAME = "rag_chunk"
+INDEX_TYPES = ("ivfflat", "hnsw")
+COMPRESSIONS = ("none", "halfvec", "binary")
+ITERATIVE_SCANS = ("off", "relaxed_order", "strict_order")
+DIMENSIONS = 768
+# Première version de pgvector avec le parcours itératif (hnsw.iterative_scan…)
+ITERATIVE_SCAN_VERSION = (0, 8)
+
+# Version de l'extension par alias de connexion, lue une fois par processus
+_extension_versions = {}
+
+
+def indexed_expression(compression=None):
+    """
+    Expression indexée et classe d'opérateurs selon le mode de compression :
+    le vecteur complet, sa copie en demi-précision (halfvec, 2 octets par
+    dimension) ou sa quantification binaire (1 bit par dimension).
+
+    :param compression: "none", "halfvec" ou "binary" (par défaut `VECTOR_COMPRESSION`).
+    :return: Couple (expression SQL, classe d'opérateurs).
+    """
+    compression = compression or settings.VECTOR_COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Mode de compression inconnu : '{compression}'")
+    if compression == "halfvec":
+        return f"(embedding::halfvec({DIMENSIONS}))", "halfvec_cosine_ops"
+    if compression == "binary":
+        return f"(binary_quantize(embedding)::bit({DIMENSIONS}))", "bit_hamming_ops"
+    return "embedding", "vector_cosine_ops"
+
+
+def distance_sql(param="embedding", compression=None):
+    """
+    Expression de distance utilisable par l'index en place, pour une requête
+    dont le vecteur est passé dans le paramètre nommé `param`.
+
+    :return: Expression SQL à utiliser dans un ORDER BY.
+    """
+    compression = compression or settings.VECTOR_COMPRESSION
+    expression, _ = indexed_expression(compression)
+    if compression == "halfvec":
+        return f"{expression} <=> %({param})s::halfvec({DIMENSIONS})"
+    if compression == "binary":
+        return f"{expression} <~> binary_quantize(%({param})s::vector)"
+    return f"embedding <=> %({param})s::vector"
+
+
+def to_vector_literal(embedding):
+    return "[" + ",".join(str(float(x)) for x in embedding) + "]"
+
+
+def recommended_lists(rows: int):
+    """
+    Nombre de listes IVFFlat recommandé par pgvector : lignes / 1000 jusqu'à
+    un million de lignes, racine carrée du nombre de lignes au-delà.
+
+    :param rows: Nombre de lignes indexées.
+    :return: Nombre de listes (au moins 1).
+    """
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def index_sql(
+    index_type,
+    lists=None,
+    m=None,
+    ef_construction=None,
+    concurrently=False,
+    compression=None,
+    name=INDEX_NAME,
+):
+    """
+    Construit la requête de création de l'index.
+
+    :param name: Nom de l'index créé.
+    :return: Requête SQL CREATE INDEX.
+    """
+    expression, opclass = indexed_expression(compression)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : '{index_type}'")
+
+    if index_type == "hnsw":
+        options = (
+            f"m = {int(m or settings.VECTOR_INDEX_M)}, "
+            f"ef_construction = {int(ef_construction or settings.VECTOR_INDEX_EF_CONSTRUCTION)}"
+        )
+    else:
+        options = f"lists = {int(lists)}"
+
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} "
+        f"ON {TABLE_NAME} USING {index_type} ({expression} {opclass}) "
+        f"WITH ({options})"
+    )
+
+
+def rebuild_index(
+    index_type=None,
+    lists=None,
+    m=None,
+    ef_construction=None,
+    concurrently=False,
+    connection=None,
+    compression=None,
+):
+    """
+    Remplace l'index ANN. Sans `concurrently`, la suppression et la création
+    sont faites dans une même transaction : en cas d'échec l'ancien index reste
+    en place. Avec `concurrently`, le nouvel index est construit sous un nom
+    temporaire à côté de l'ancien, qui n'est remplacé qu'une fois le nouveau
+    prêt. La copie compressée des vecteurs (halfvec
+    ou binaire) est calculée pour toutes les lignes existantes lors de la
+    construction de l'index. Pour IVFFlat, le nombre de listes est par
+    défaut calculé à partir du nombre de lignes courant, afin que les centroïdes
+    reflètent les données réellement présentes.
+
+    :param index_type: "ivfflat" ou "hnsw" (par défaut `VECTOR_INDEX_TYPE`).
+    :param lists: Nombre de listes IVFFlat (par défaut `VECTOR_INDEX_LISTS`, ou
+        selon le nombre de lignes s'il vaut 0).
+    :param m: Paramètre HNSW `m` (par défaut `VECTOR_INDEX_M`).
+    :param ef_construction: Paramètre HNSW (par défaut `VECTOR_INDEX_EF_CONSTRUCTION`).
+    :param concurrently: Construire sans bloquer les écritures (hors transaction).
+    :param connection: Connexion à utiliser (par défaut la connexion Django).
+    :param compression: "none", "halfvec" ou "binary" (par défaut `VECTOR_COMPRESSION`).
+    :return: Dictionnaire décrivant l'index construit.
+    """
+    connection = connection or default_connection
+    index_type = index_type or settings.VECTOR_INDEX_TYPE
+    compression = compression or settings.VECTOR_COMPRESSION
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {TABLE_NAME}")
+        rows = cursor.fetchone()[0]
+    if index_type == "ivfflat":
+        lists = lists or settings.VECTOR_INDEX_LISTS or recommended_lists(rows)
+
+    if concurrently:
+        # CONCURRENTLY est interdit dans une transaction : construire à côté,
+        # puis remplacer l'ancien index
+        with connection.cursor() as cursor:
+            for name in (TEMPORARY_INDEX_NAME, PREVIOUS_INDEX_NAME):
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            try:
+                cursor.execute(
+                    index_sql(
+                        index_type,
+                        lists,
+                        m,
+                        ef_construction,
+                        concurrently=True,
+                        compression=compression,
+                        name=TEMPORARY_INDEX_NAME,
+                    )
+                )
+            except Exception:
+                # Un échec laisse un index invalide : le retirer
+                cursor.execute(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS {TEMPORARY_INDEX_NAME}"
+                )
+                raise
+        # Échange des noms en une transaction : la table garde toujours un index
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER INDEX IF EXISTS {INDEX_NAME} RENAME TO {PREVIOUS_INDEX_NAME}"
+            )
+            cursor.execute(
+                f"ALTER INDEX {TEMPORARY_INDEX_NAME} RENAME TO {INDEX_NAME}"
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {PREVIOUS_INDEX_NAME}")
+    else:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+            cursor.execute(
+                index_sql(index_type, lists, m, ef_construction, False, compression)
+            )
+
+    logger.info(
+        f"✅ Index {index_type} ({compression}) '{INDEX_NAME}' reconstruit "
+        f"sur {rows} chunks."
+    )
+    return {
+        "type": index_type,
+        "compression": compression,
+        "rows": rows,
+        "lists": lists,
+        "m": m or settings.VECTOR_INDEX_M,
+        "ef_construction": ef_construction or settings.VECTOR_INDEX_EF_CONSTRUCTION,
+    }
+
+
+def current_index_type(connection=None):
+    """
+    :return: Méthode d'accès de l'index ANN existant ("ivfflat", "hnsw") ou None.
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT am.amname FROM pg_class c JOIN pg_am am ON am.oid = c.relam "
+            "WHERE c.relname = %s",
+            [INDEX_NAME],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def extension_version(connection=None):
+    """
+    Version de l'extension pgvector installée, lue une fois par processus et
+    par base (redémarrer après `ALTER EXTENSION vector UPDATE`).
+
+    :return: Tuple d'entiers, ex. (0, 8, 0), ou () si l'extension est absente.
+    """
+    connection = connection or default_connection
+    if connection.alias not in _extension_versions:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+            )
+            row = cursor.fetchone()
+        version = ()
+        if row:
+            version = tuple(
+                int(part) for part in row[0].split(".") if part.isdigit()
+            )
+            if version < ITERATIVE_SCAN_VERSION:
+                logger.warning(
+                    f"⚠️ pgvector {row[0]} : parcours itératif indisponible "
+                    f"(0.8 requis), les recherches filtrées peuvent renvoyer "
+                    f"moins de résultats."
+                )
+        _extension_versions[connection.alias] = version
+    return _extension_versions[connection.alias]
+
+
+def search_params_sql(
+    probes=None, ef_search=None, iterative_scan=None, connection=None
+):
+    """
+    Requêtes SET LOCAL réglant le compromis rappel/latence de la recherche.
+    Les paramètres des deux types d'index sont positionnés : seuls ceux de
+    l'index en place sont pris en compte par PostgreSQL.
+
+    Avec un filtre (WHERE), l'index ne renvoie que ef_search candidats (HNSW)
+    ou le contenu de `probes` listes (IVFFlat), dont beaucoup peuvent être
+    écartés par le filtre. Le parcours itératif (pgvector >= 0.8) poursuit
+    alors la lecture de l'index jusqu'à obtenir assez de lignes, dans la
+    limite de `VECTOR_ITERATIVE_MAX_SCAN_TUPLES` tuples (HNSW). Avant pgvector
+    0.8, ces paramètres n'existent pas (préfixes réservés par l'extension) :
+    ils sont omis et le filtre s'applique aux seuls candidats de l'index.
+
+    :param probes: Nombre de listes IVFFlat visitées (par défaut `VECTOR_SEARCH_PROBES`).
+    :param ef_search: Taille de la liste candidate HNSW (par défaut `VECTOR_SEARCH_EF_SEARCH`).
+    :param iterative_scan: "off", "relaxed_order" ou "strict_order" (par défaut
+        pas de parcours itératif).
+    :param connection: Connexion dont la version de pgvector est vérifiée.
+    :return: Liste de requêtes SQL.
+    """
+    probes = int(probes or settings.VECTOR_SEARCH_PROBES)
+    ef_search = int(ef_search or settings.VECTOR_SEARCH_EF_SEARCH)
+    queries = [
+        f"SET LOCAL ivfflat.probes = {probes}",
+        f"SET LOCAL hnsw.ef_search = {ef_search}",
+    ]
+    if (
+        iterative_scan
+        and iterative_scan != "off"
+        and extension_version(connection) >= ITERATIVE_SCAN_VERSION
+    ):
+        if iterative_scan not in ITERATIVE_SCANS:
+            raise ValueError(f"Mode de parcours itératif inconnu : '{iterative_scan}'")
+        max_scan_tuples = int(settings.VECTOR_ITERATIVE_MAX_SCAN_TUPLES)
+        queries += [
+            f"SET LOCAL hnsw.iterative_scan = {iterative_scan}",
+            f"SET LOCAL hnsw.max_scan_tuples = {max_scan_tuples}",
+            # IVFFlat ne propose que l'ordre approché
+            "SET LOCAL ivfflat.iterative_scan = relaxed_order",
+        ]
+    return queries
+
+
+def apply_search_params(
+    probes=None, ef_search=None, connection=None, iterative_scan=None
+):
+    """
+    Applique les paramètres de recherche à la transaction courante.
+    Doit être appelée dans un bloc `transaction.atomic()`.
+    """
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        # Une seule requête pour tous les paramètres
+        cursor.execute(
+            "; ".join(
+                search_params_sql(probes, ef_search, iterative_scan, connection)
+            )
+        )
@@ -0,0 +1,508 @@
+"""
+Backends de recherche vectorielle, sélectionnés par `VECTOR_STORE_BACKEND` :
+
+- `PgVectorStore` (par défaut) : recherche dans PostgreSQL avec pgvector ;
+- `NumpyVectorStore` : index en processus, vecteurs float32 dans un fichier
+  mappé en mémoire, recherche exacte par blocs en NumPy. Adapté aux petits
+  corpus.
+
+Dans tous les cas, le contenu des chunks reste dans la table `Chunk`, et
+l'extension pgvector reste requise : `Chunk.embedding` est une colonne
+`vector` (source des reconstructions), les migrations créent son index et le
+cache de réponses cherche par distance cosinus dans PostgreSQL.
+"""
+
+import fcntl
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from pgvector.django import CosineDistance
+
+from .models import Chunk, Document
+from .vector_index import (
+    apply_search_params,
+    distance_sql,
+    rebuild_index,
+    to_vector_literal,
+)
+
+logger = logging.getLogger(__name__)
+
+_store = None
+_store_lock = threading.Lock()
+
+# Colonnes renvoyées par la recherche : ni embedding ni vecteur plein texte,
+# le nom du document étant joint dans la même requête
+RESULT_COLUMNS_SQL = (
+    "c.id, c.content, c.page, c.chunk_index, c.document_id, d.file AS document_name"
+)
+
+
+def lean_chunks():
+    """
+    Chunks limités aux champs utiles à la génération et aux sources, annotés
+    de `document_name` (chemin du fichier du document).
+
+    :return: QuerySet de chunks.
+    """
+    return Chunk.objects.only(
+        "id", "content", "page", "chunk_index", "document"
+    ).annotate(document_name=F("document__file"))
+
+
+class VectorStore:
+    """
+    Interface commune des backends de recherche vectorielle.
+    """
+
+    def search(self, query_embedding, top_k=5, document_ids=None, **params):
+        """
+        :param query_embedding: Embedding de la requête.
+        :param top_k: Nombre de résultats.
+        :param document_ids: Documents auxquels restreindre la recherche (None : tous).
+        :return: Liste de chunks (voir `lean_chunks`) annotés de `similarity`,
+            du plus proche au plus éloigné.
+        """
+        raise NotImplementedError
+
+    def add(self, ids, embeddings):
+        """
+        Indexe des chunks qui viennent d'être insérés en base.
+        """
+
+    def delete(self, ids):
+        """
+        Retire des chunks de l'index.
+        """
+
+    def all_vectors(self):
+        """
+        :return: Identifiants triés et matrice (n, dim) des embeddings indexés.
+        """
+        ids = []
+        vectors = []
+        rows = Chunk.objects.order_by("id").values_list("id", "embedding")
+        for chunk_id, embedding in rows.iterator(chunk_size=2000):
+            ids.append(chunk_id)
+            vectors.append(embedding)
+        return np.array(ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32)
+
+    def rebuild(self, **options):
+        """
+        Reconstruit l'index à partir de la table `Chunk`.
+
+        :return: Dictionnaire décrivant l'index construit.
+        """
+        raise NotImplementedError
+
+
+class PgVectorStore(VectorStore):
+    """
+    Recherche dans PostgreSQL via l'index ANN pgvector (voir rag/vector_index.py).
+    Les chunks étant déjà en base, `add` et `delete` n'ont rien à faire.
+    """
+
+    @staticmethod
+    def candidate_count(top_k):
+        """
+        :return: Nombre de candidats demandés à l'index pour `top_k` résultats.
+        """
+        if settings.VECTOR_COMPRESSION == "none":
+            return top_k
+        return top_k * settings.VECTOR_RERANK_OVERSAMPLING
+
+    @classmethod
+    def effective_ef_search(cls, ef_search, top_k):
+        """
+        HNSW ne renvoie pas plus de ef_search résultats : la valeur est relevée
+        au nombre de candidats.
+
+        :return: `hnsw.ef_search` réellement appliqué.
+        """
+        return max(
+            ef_search or settings.VECTOR_SEARCH_EF_SEARCH, cls.candidate_count(top_k)
+        )
+
+    def search(
+        self, query_embedding, top_k=5, document_ids=None, probes=None, ef_search=None
+    ):
+        """
+        Avec un index compressé (`VECTOR_COMPRESSION` "halfvec" ou "binary"),
+        l'index fournit `top_k * VECTOR_RERANK_OVERSAMPLING` candidats, reclassés
+        ensuite par la distance cosinus exacte sur les vecteurs complets.
+
+        Un filtre sur les documents est appliqué pendant le parcours de l'index,
+        avec le parcours itératif (`VECTOR_ITERATIVE_SCAN`) pour obtenir assez
+        de candidats même quand le filtre en écarte la plupart.
+        """
+        candidates = self.candidate_count(top_k)
+        if settings.VECTOR_COMPRESSION == "none":
+            similar_chunks = lean_chunks()
+            if document_ids is not None:
+                similar_chunks = similar_chunks.filter(document_id__in=document_ids)
+            # Trier sur la distance elle-même pour que l'index ANN soit utilisé
+            similar_chunks = similar_chunks.annotate(
+                similarity=1 - CosineDistance("embedding", query_embedding)
+            ).order_by(CosineDistance("embedding", query_embedding))[
+                :top_k
+            ]  # Limite à top_k résultats
+        else:
+            table = Chunk._meta.db_table
+            scope = (
+                "WHERE document_id = ANY(%(document_ids)s)"
+                if document_ids is not None
+                else ""
+            )
+            similar_chunks = Chunk.objects.raw(
+                f"""
+                SELECT {RESULT_COLUMNS_SQL},
+                    1 - (c.embedding <=> %(embedding)s::vector) AS similarity
+                FROM (
+                    SELECT id FROM {table}
+                    {scope}
+                    ORDER BY {distance_sql("embedding")}
+                    LIMIT %(candidates)s
+                ) AS candidates
+                JOIN {table} c ON c.id = candidates.id
+                JOIN {Document._meta.db_table} d ON d.id = c.document_id
+                ORDER BY c.embedding <=> %(embedding)s::vector
+                LIMIT %(top_k)s
+                """,
+                {
+                    "embedding": to_vector_literal(query_embedding),
+                    "document_ids": list(document_ids or []),
+                    "candidates": candidates,
+                    "top_k": top_k,
+                },
+            )
+
+        # Les paramètres de rappel de l'index ne valent que pour la transaction
+        ef_search = self.effective_ef_search(ef_search, top_k)
+        iterative_scan = (
+            settings.VECTOR_ITERATIVE_SCAN if document_ids is not None else None
+        )
+        with transaction.atomic():
+            apply_search_params(probes, ef_search, iterative_scan=iterative_scan)
+            results = list(similar_chunks)
+
+        # En ordre approché ("relaxed_order"), l'index peut renvoyer les
+        # résultats légèrement désordonnés
+        results.sort(key=lambda chunk: chunk.similarity, reverse=True)
+        return results
+
+    def rebuild(self, **options):
+        return rebuild_index(**options)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Index en processus. Fichiers dans `VECTOR_STORE_PATH`, tous en ajout seul :
+
+    - `vectors.f32` : vecteurs float32 normalisés, une ligne par chunk, mappés
+      en mémoire ;
+    - `ids.i64` : identifiant du chunk de chaque ligne ;
+    - `tombstones.i64` : identifiants supprimés, ignorés à la recherche jusqu'à
+      la prochaine reconstruction.
+
+    Les fichiers sont partagés entre processus (serveur, workers d'ingestion) :
+    les écritures prennent un verrou `fcntl` sur `.lock`, et chaque recherche
+    relit les fichiers si un autre processus les a modifiés. Les vecteurs écrits
+    sans leur identifiant (arrêt pendant un ajout) sont coupés à la lecture.
+
+    La recherche est exacte (force brute), par blocs de `VECTOR_STORE_BLOCK_SIZE`
+    lignes pour borner la mémoire, et accepte plusieurs requêtes à la fois.
+    """
+
+    def __init__(self, path=None, dimensions=768, block_size=None):
+        self.path = Path(path or settings.VECTOR_STORE_PATH)
+        self.dimensions = dimensions
+        self.block_size = block_size or settings.VECTOR_STORE_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._signature = None
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            self._load()
+
+    @property
+    def vectors_file(self):
+        return self.path / "vectors.f32"
+
+    @property
+    def ids_file(self):
+        return self.path / "ids.i64"
+
+    @property
+    def tombstones_file(self):
+        return self.path / "tombstones.i64"
+
+    @property
+    def lock_file(self):
+        return self.path / ".lock"
+
+    @property
+    def row_bytes(self):
+        return self.dimensions * np.dtype(np.float32).itemsize
+
+    @contextmanager
+    def _locked(self):
+        """
+        Verrou des threads du processus et verrou exclusif `fcntl` des autres
+        processus, pour toute lecture ou écriture des fichiers.
+        """
+        with self._lock, open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _size(file):
+        try:
+            return file.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _files_signature(self):
+        """
+        :return: Inode, taille et date de modification des identifiants et des
+            suppressions, qui changent à chaque écriture.
+        """
+        signature = []
+        for file in (self.ids_file, self.tombstones_file):
+            try:
+                stat = file.stat()
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _truncate(self, file, size):
+        current = self._size(file)
+        if current > size:
+            logger.warning(
+                f"⚠️ {file.name} : {current - size} octets sans correspondance "
+                f"coupés."
+            )
+            os.truncate(file, size)
+
+    def _read(self, file, dtype):
+        if self._size(file) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.fromfile(file, dtype=dtype)
+
+    def _load(self):
+        # Appelée avec le verrou
+        itemsize = np.dtype(np.int64).itemsize
+        rows = min(
+            self._size(self.ids_file) // itemsize,
+            self._size(self.vectors_file) // self.row_bytes,
+        )
+        # Écritures interrompues : vecteurs orphelins ou identifiant incomplet
+        self._truncate(self.vectors_file, rows * self.row_bytes)
+        self._truncate(self.ids_file, rows * itemsize)
+        self._truncate(
+            self.tombstones_file,
+            self._size(self.tombstones_file) // itemsize * itemsize,
+        )
+
+        self._ids = self._read(self.ids_file, np.int64)
+        deleted = self._read(self.tombstones_file, np.int64)
+        self._alive = ~np.isin(self._ids, deleted)
+        self._map()
+        self._signature = self._files_signature()
+
+    def _refresh(self):
+        """
+        Relit les fichiers s'ils ont été modifiés par un autre processus.
+        """
+        if self._files_signature() != self._signature:
+            with self._locked():
+                if self._files_signature() != self._signature:
+                    self._load()
+
+    def _map(self):
+        rows = len(self._ids)
+        if rows == 0:
+            self._vectors = np.empty((0, self.dimensions), dtype=np.float32)
+        else:
+            self._vectors = np.memmap(
+                self.vectors_file,
+                dtype=np.float32,
+                mode="r",
+                shape=(rows, self.dimensions),
+            )
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32).reshape(len(matrix), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _append(self, ids, embeddings):
+        # Appelée avec le verrou, sur un état à jour
+        if len(ids) == 0:
+            return
+        new_ids = np.asarray(ids, dtype=np.int64)
+        # Chunks déjà indexés (ajoutés pendant une reconstruction) ignorés
+        fresh = ~np.isin(new_ids, self._ids)
+        if not fresh.any():
+            return
+        new_ids = new_ids[fresh]
+        vectors = self._normalize(embeddings)[fresh]
+
+        # Vecteurs laissés par un ajout interrompu, puis vecteurs avant les
+        # identifiants : une ligne n'est visible qu'une fois son identifiant écrit
+        self._truncate(self.vectors_file, len(self._ids) * self.row_bytes)
+        with open(self.vectors_file, "ab") as file:
+            vectors.tofile(file)
+        with open(self.ids_file, "ab") as file:
+            new_ids.tofile(file)
+        self._ids = np.concatenate([self._ids, new_ids])
+        self._alive = np.concatenate([self._alive, np.ones(len(new_ids), bool)])
+        self._map()
+        self._signature = self._files_signature()
+
+    def add(self, ids, embeddings):
+        if len(ids) == 0:
+            return
+        with self._locked():
+            if self._files_signature() != self._signature:
+                self._load()
+            self._append(ids, embeddings)
+
+    def delete(self, ids):
+        if len(ids) == 0:
+            return
+        deleted = np.asarray(ids, dtype=np.int64)
+        with self._locked():
+            if self._files_signature() != self._signature:
+                self._load()
+            with open(self.tombstones_file, "ab") as file:
+                deleted.tofile(file)
+            self._alive &= ~np.isin(self._ids, deleted)
+            self._signature = self._files_signature()
+
+    def search_many(self, query_embeddings, top_k=5, allowed_ids=None):
+        """
+        Recherche exacte des `top_k` plus proches voisins de plusieurs requêtes.
+
+        :param query_embeddings: Matrice (q, dim) des requêtes.
+        :param top_k: Nombre de résultats par requête.
+        :param allowed_ids: Identifiants de chunks autorisés (None : tous).
+        :return: Liste, par requête, de couples (identifiants, similarités).
+        """
+        queries = self._normalize(query_embeddings)
+        self._refresh()
+        with self._lock:
+            ids, alive, vectors = self._ids, self._alive, self._vectors
+        if allowed_ids is not None:
+            alive = alive & np.isin(ids, allowed_ids)
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(ids), self.block_size):
+            stop = min(start + self.block_size, len(ids))
+            scores = queries @ vectors[start:stop].T
+            scores[:, ~alive[start:stop]] = -np.inf
+
+            # Fusion avec les meilleurs résultats des blocs précédents
+            scores = np.concatenate([best_scores, scores], axis=1)
+            block_rows = np.tile(np.arange(start, stop), (len(queries), 1))
+            rows = np.concatenate([best_rows, block_rows], axis=1)
+            k = min(top_k, scores.shape[1])
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            found = np.isfinite(scores[order])
+            results.append((ids[rows[order][found]], scores[order][found]))
+        return results
+
+    def search(self, query_embedding, top_k=5, document_ids=None, **params):
+        allowed_ids = None
+        if document_ids is not None:
+            # Recherche exacte : le filtre ne fait perdre aucun résultat
+            allowed_ids = np.fromiter(
+                Chunk.objects.filter(document_id__in=document_ids).values_list(
+                    "id", flat=True
+                ),
+                dtype=np.int64,
+            )
+        chunk_ids, scores = self.search_many([query_embedding], top_k, allowed_ids)[0]
+        chunks = lean_chunks().in_bulk(chunk_ids.tolist())
+        results = []
+        for chunk_id, score in zip(chunk_ids.tolist(), scores.tolist()):
+            chunk = chunks.get(chunk_id)
+            if chunk is not None:
+                chunk.similarity = score
+                results.append(chunk)
+        return results
+
+    def all_vectors(self):
+        self._refresh()
+        with self._lock:
+            ids, alive, vectors = self._ids, self._alive, self._vectors
+        order = np.argsort(ids[alive])
+        return ids[alive][order], np.asarray(vectors[alive])[order]
+
+    def rebuild(self, **options):
+        """
+        Réécrit les fichiers à partir de la table `Chunk`, ce qui élimine
+        aussi les lignes supprimées.
+        """
+        rows = 0
+        ids = []
+        vectors = []
+        queryset = Chunk.objects.order_by("id").values_list("id", "embedding")
+        # Verrou tenu jusqu'à la fin : les ajouts concurrents attendent, puis
+        # ignorent les chunks déjà lus dans la table
+        with self._locked():
+            for file in (self.vectors_file, self.ids_file, self.tombstones_file):
+                file.unlink(missing_ok=True)
+            self._load()
+            for chunk_id, embedding in queryset.iterator(chunk_size=self.block_size):
+                ids.append(chunk_id)
+                vectors.append(embedding)
+                if len(ids) >= self.block_size:
+                    self._append(ids, vectors)
+                    rows += len(ids)
+                    ids, vectors = [], []
+            self._append(ids, vectors)
+            rows += len(ids)
+
+        logger.info(f"✅ Index NumPy reconstruit sur {rows} chunks ({self.path}).")
+        return {"type": "numpy", "rows": rows, "path": str(self.path)}
+
+
+def get_vector_store():
+    """
+    Retourne le backend configuré par `VECTOR_STORE_BACKEND` (chemin pointé
+    vers une classe de ce module ou compatible), instancié une fois par processus.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.VECTOR_STORE_BACKEND)()
+    return _store
+
+
+@receiver(pre_delete, sender=Document)
+def unindex_deleted_document(sender, instance, **kwargs):
+    # Les chunks sont supprimés en cascade : les retirer de l'index d'abord
+    get_vector_store().delete(list(instance.chunks.values_list("id", flat=True)))
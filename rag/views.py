@@ -1,46 +1,85 @@
+import asyncio
+import json
 import logging
-import mimetypes
 import uuid
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import ListView
 from django_eventstream import send_event
 from httpx import ConnectError
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    UnstructuredWordDocumentLoader,
-)
-from rest_framework.exceptions import APIException
-from rest_framework.response import Response
-from rest_framework.views import APIView
 
 from .graph import display_cos_sim_in_3D
+from .ingestion import enqueue_document, job_payload
+from .metrics import render as render_metrics
 from .models import Chunk, Document
-from .populate_database import add_to_django, split_documents
-from .query_data import query_rag
+from .parsing import guess_file_type
+from .query_data import aquery_rag
+from .scheduler import OllamaBusy, get_scheduler
+from .streaming import AsyncBufferedEmitter
+from .warmup import model_status
 
 logger = logging.getLogger(__name__)
 
-mimetypes.add_type("text/markdown", ".md")
-mimetypes.add_type(
-    "application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx"
-)
+BUSY_MESSAGE = "⏳ Serveur occupé, réessayez dans un instant."
+
+# send_event est synchrone (publication dans le stockage des canaux)
+asend_event = sync_to_async(send_event)
+
+
+def parse_scope(data):
+    """
+    Lit le filtre de documents d'une requête de chat : `documents` (identifiants,
+    répétés ou séparés par des virgules) et `collection`.
+
+    :param data: `request.POST` ou `request.data`.
+    :return: Couple (identifiants ou None, collection ou None).
+    :raises ValueError: Si un identifiant n'est pas un entier.
+    """
+    if hasattr(data, "getlist"):
+        values = data.getlist("documents")
+    else:
+        values = data.get("documents") or []
+        if not isinstance(values, list):
+            values = [values]
+
+    document_ids = [
+        int(part) for value in values for part in str(value).split(",") if part.strip()
+    ]
+    return document_ids or None, data.get("collection") or None
 
 
 @csrf_exempt
-def chat(request):
+async def chat(request):
     """
     Vue permettant de gérer le système de chat basé sur un modèle RAG (Retrieval-Augmented Generation).
     Envoie les messages en temps réel via des événements serveur (Server-Sent Events).
+    Vue asynchrone : la génération n'occupe pas de thread et est interrompue
+    (flux Ollama fermé) si le client se déconnecte.
     """
     if request.method == "POST":
         query_text = request.POST.get("query")  # Récupère la requête utilisateur
         chat_uuid = request.POST.get("uuid")  # Récupère l'identifiant de session
-        response_generator, sources = query_rag(query_text)  # Interroge le modèle RAG
+        try:
+            # Documents ou collection auxquels restreindre la question
+            document_ids, collection = parse_scope(request.POST)
+        except ValueError:
+            return JsonResponse(
+                {"error": "Le paramètre 'documents' doit contenir des identifiants."},
+                status=400,
+            )
+        try:
+            response_generator, sources = await aquery_rag(
+                query_text, document_ids, collection
+            )  # Interroge le modèle RAG
+        except OllamaBusy as e:
+            # Trop de questions en attente d'Ollama
+            return JsonResponse({"error": str(e)}, status=503)
 
         formatted_sources_text = clean_ids(
             sources
@@ -49,17 +88,33 @@ def chat(request):
         # Définir un canal d'événements pour la session
         channel_name = f"chat_{chat_uuid}"
 
-        # Envoie les réponses en morceaux via des événements serveur
+        # Envoie les réponses en morceaux via des événements serveur, les tokens
+        # étant regroupés pour limiter le nombre d'événements
+        emitter = AsyncBufferedEmitter(channel_name)
         try:
-            for chunk in response_generator:
-                send_event(channel_name, "message", {"text": chunk})
+            async for chunk in response_generator:
+                await emitter.add(chunk)
+            await emitter.close()
         except ConnectError:
-            send_event(
+            await emitter.flush()
+            await asend_event(
                 channel_name,
                 "message",
                 {"text": "❌ Erreur impossible d'accéder à Ollama."},
             )
             raise ConnectError("❌ Erreur de connexion impossible d'accéder à Ollama.")
+        except OllamaBusy as e:
+            await emitter.flush()
+            await asend_event(channel_name, "message", {"text": BUSY_MESSAGE})
+            return JsonResponse({"error": str(e)}, status=503)
+        except asyncio.CancelledError:
+            # Django annule la vue quand le client se déconnecte
+            logger.info(f"Client déconnecté, génération interrompue ({channel_name}).")
+            # Fermer le flux tout de suite (arrêt de la génération Ollama et
+            # libération de la place de l'ordonnanceur), sans attendre le
+            # finaliseur ; protégé de l'annulation en cours
+            await asyncio.shield(response_generator.aclose())
+            raise
 
         # Retourne les sources en réponse pour terminer
         return JsonResponse({"sources": formatted_sources_text})
@@ -70,71 +125,63 @@ def chat(request):
 
 @csrf_exempt
 def add_file(request):
+    """
+    Sauvegarde les fichiers envoyés et crée un job d'ingestion par fichier.
+    Les jobs sont traités en parallèle en arrière-plan, la progression est publiée
+    par SSE sur le canal de chat de l'utilisateur. Un fichier refusé n'empêche pas
+    le traitement des autres : la réponse indique le résultat de chaque fichier.
+    """
     if request.method == "POST" and request.FILES:
         uploaded_files = request.FILES.getlist("files")
+        chat_uuid = request.POST.get("uuid")
+        channel = f"chat_{chat_uuid}" if chat_uuid else ""
 
-        # Types de fichiers pris en charge
-        supported_types = {
-            "application/pdf": PyPDFLoader,  # Pour les PDF
-            "text/plain": TextLoader,  # Pour les fichiers .txt
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": UnstructuredWordDocumentLoader,  # Pour les .docx
-            "text/markdown": TextLoader,  # Pour les .md
-            "text/x-markdown": TextLoader,  # Cas alternatif pour .md
-            "text/x-wiki": TextLoader,  # Pour les fichiers Wikitext
-        }
-
+        results = []
         for uploaded_file in uploaded_files:
-            # Détecter le type de fichier en fonction de son extension
-            file_type, encoding = mimetypes.guess_type(uploaded_file.name)
-
             # Vérifie si le type MIME est pris en charge
-            if file_type not in supported_types:
-                return JsonResponse(
+            if guess_file_type(uploaded_file.name) is None:
+                results.append(
                     {
-                        "error": f"Type de fichier '{file_type}' non pris en charge pour '{uploaded_file.name}'"
-                    },
-                    status=400,
+                        "file": uploaded_file.name,
+                        "status": "error",
+                        "error": f"Type de fichier non pris en charge pour '{uploaded_file.name}'",
+                    }
                 )
+                continue
 
-            # Créer l'objet Document en base de données
-            document = Document.objects.create(file=uploaded_file)
-            logger.info(f"✅ Fichier '{document.file.name}' sauvegardé.")
-            document.save()
-
-            # Charger et traiter le document en fonction de son type MIME
             try:
-                loader_class = supported_types[file_type]
-                loader = loader_class(document.file.path)
-                pages = loader.load()
-            except Exception as e:
-                document.delete()
-                logger.error(
-                    f"❌ Erreur de chargement du fichier '{document.file.name}': {str(e)}"
-                )
-                return JsonResponse(
-                    {
-                        "error": f"Erreur de traitement du fichier '{uploaded_file.name}'"
-                    },
-                    status=400,
+                # Créer l'objet Document en base de données
+                document = Document.objects.create(
+                    file=uploaded_file,
+                    collection=request.POST.get("collection", ""),
                 )
-
-            # Diviser le document en chunks
-            try:
-                chunks = split_documents(pages)
-                add_to_django(chunks, document)
+                logger.info(f"✅ Fichier '{document.file.name}' sauvegardé.")
+                job = enqueue_document(document, channel=channel)
             except Exception as e:
                 logger.error(
-                    f"❌ Erreur de segmentation du fichier '{document.file.name}': {str(e)}"
+                    f"❌ Erreur de sauvegarde du fichier '{uploaded_file.name}': {str(e)}"
                 )
-                document.delete()
-                return JsonResponse(
+                results.append(
                     {
-                        "error": f"Erreur de segmentation du fichier '{uploaded_file.name}'"
-                    },
-                    status=400,
+                        "file": uploaded_file.name,
+                        "status": "error",
+                        "error": f"Erreur de sauvegarde du fichier '{uploaded_file.name}'",
+                    }
                 )
+                continue
+
+            results.append(
+                {"file": uploaded_file.name, "status": "queued", "job": job_payload(job)}
+            )
 
-        return JsonResponse({"status": "Fichiers ajoutés avec succès"})
+        accepted = sum(1 for result in results if result["status"] == "queued")
+        return JsonResponse(
+            {
+                "status": f"{accepted}/{len(results)} fichier(s) en cours de traitement",
+                "files": results,
+            },
+            status=202 if accepted else 400,
+        )
 
     return JsonResponse({"error": "Aucun fichier envoyé"}, status=400)
 
@@ -199,41 +246,173 @@ def view_request_in_3d(request):
 
 
 class ChunkListView(ListView):
+    """
+    Liste des chunks paginée par curseur (`?after=<id>` : chunks d'identifiant
+    supérieur), sans embeddings sauf avec `?embedding=1`.
+    """
+
     model = Chunk
     template_name = "chunk_list.html"
     context_object_name = "chunks"
 
+    def with_embedding(self):
+        return self.request.GET.get("embedding") in ("1", "true")
+
+    def get_queryset(self):
+        queryset = Chunk.objects.select_related("document").defer("search_vector")
+        if not self.with_embedding():
+            queryset = queryset.defer("embedding")
+        after = self.request.GET.get("after", "")
+        if after.isdigit():
+            queryset = queryset.filter(id__gt=int(after))
+        # Un chunk de plus pour savoir s'il existe une page suivante
+        return list(queryset.order_by("id")[: settings.CHUNK_PAGE_SIZE + 1])
+
+    def get_context_data(self, **kwargs):
+        chunks = self.object_list[: settings.CHUNK_PAGE_SIZE]
+        has_next = len(self.object_list) > settings.CHUNK_PAGE_SIZE
+        context = super().get_context_data(object_list=chunks, **kwargs)
+        context["with_embedding"] = self.with_embedding()
+        context["next_after"] = chunks[-1].id if has_next else None
+        return context
+
+
+def parse_api_payload(request):
+    """
+    Corps d'une requête d'API : JSON (objet) ou formulaire.
+
+    :return: Dictionnaire ou `QueryDict` des paramètres.
+    :raises ValueError: Si le JSON est invalide ou n'est pas un objet.
+    """
+    if request.content_type == "application/json":
+        data = json.loads(request.body or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("Objet JSON attendu")
+        return data
+    return request.POST
+
 
-class ChatAPIView(APIView):
+@csrf_exempt
+@require_POST
+async def chat_api(request):
     """
-    Vue API pour gérer le chat RAG via une requête POST.
+    API de chat RAG (POST `query`, `uuid`) : la réponse est publiée par SSE sur
+    le canal `uuid`, les sources sont renvoyées en JSON. `documents` (liste
+    d'identifiants) et `collection` restreignent la recherche.
+    Vue asynchrone, comme `chat` : la génération n'occupe pas de thread et est
+    interrompue si le client se déconnecte.
     """
+    try:
+        data = parse_api_payload(request)
+    except ValueError:
+        return JsonResponse({"error": "Corps de requête JSON invalide."}, status=400)
+    query_text = data.get("query")
+    uuid = data.get("uuid")
+    if not query_text:
+        return JsonResponse({"error": "Le paramètre 'query' est requis."}, status=400)
+    if not uuid:
+        return JsonResponse({"error": "Le paramètre 'uuid' est requis."}, status=400)
+    try:
+        document_ids, collection = parse_scope(data)
+    except ValueError:
+        return JsonResponse(
+            {"error": "Le paramètre 'documents' doit contenir des identifiants."},
+            status=400,
+        )
 
-    def post(self, request, *args, **kwargs):
-        query_text = request.data.get("query")
-        uuid = request.data.get("uuid")
-        if not query_text:
-            return Response({"error": "Le paramètre 'query' est requis."}, status=400)
-        if not uuid:
-            return Response({"error": "Le paramètre 'uuid' est requis."}, status=400)
+    # Interroge le modèle RAG, éventuellement restreint à certains documents
+    try:
+        response_generator, sources = await aquery_rag(
+            query_text, document_ids, collection
+        )
+    except OllamaBusy as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    formatted_sources_text = clean_ids(sources)
+    channel_name = uuid
+
+    # Envoi des chunks via SSE, regroupés par le tampon d'émission
+    emitter = AsyncBufferedEmitter(channel_name)
+    try:
+        async for chunk in response_generator:
+            await emitter.add(chunk)
+        await emitter.flush()
+        await asend_event(channel_name, "message", {"text": "END OF RESPONS"})
+        await emitter.close()
+    except ConnectError:
+        await emitter.flush()
+        await asend_event(
+            channel_name,
+            "message",
+            {"text": "❌ Erreur impossible d'accéder à Ollama."},
+        )
+        return JsonResponse(
+            {"detail": "❌ Erreur de connexion impossible d'accéder à Ollama."},
+            status=500,
+        )
+    except OllamaBusy as e:
+        await emitter.flush()
+        await asend_event(channel_name, "message", {"text": BUSY_MESSAGE})
+        return JsonResponse({"error": str(e)}, status=503)
+    except asyncio.CancelledError:
+        # Client déconnecté : arrêter la génération et rendre la place
+        logger.info(f"Client déconnecté, génération interrompue ({channel_name}).")
+        await asyncio.shield(response_generator.aclose())
+        raise
 
-        # Interroge le modèle RAG
-        response_generator, sources = query_rag(query_text)
-        formatted_sources_text = clean_ids(sources)
-        channel_name = uuid
+    # Retourne les sources en JSON
+    return JsonResponse({"sources": formatted_sources_text})
 
-        try:
-            # Envoi des chunks via SSE (cette logique dépend de votre implémentation)
-            for chunk in response_generator:
-                send_event(channel_name, "message", {"text": chunk})
-            send_event(channel_name, "message", {"text": "END OF RESPONS"})
-        except ConnectError:
-            send_event(
-                channel_name,
-                "message",
-                {"text": "❌ Erreur impossible d'accéder à Ollama."},
-            )
-            raise APIException("❌ Erreur de connexion impossible d'accéder à Ollama.")
 
-        # Retourne les sources en JSON
-        return Response({"sources": formatted_sources_text})
+@require_GET
+def health(request):
+    """
+    État de préparation : base de données joignable et modèles Ollama chargés
+    en mémoire (une question n'attendra pas leur chargement).
+    Répond 200 si tout est prêt, 503 sinon.
+    """
+    checks = {"database": True, "ollama": True}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except Exception as e:
+        logger.error(f"❌ Base de données injoignable: {str(e)}")
+        checks["database"] = False
+
+    try:
+        models = model_status()
+    except Exception as e:
+        logger.error(f"❌ Ollama injoignable: {str(e)}")
+        checks["ollama"] = False
+        models = []
+
+    # Appels Ollama en file et en cours, par classe de priorité
+    scheduler = get_scheduler().stats()
+
+    ready = (
+        checks["database"]
+        and checks["ollama"]
+        and all(model["loaded"] for model in models)
+    )
+    return JsonResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            **checks,
+            "models": models,
+            "scheduler": scheduler,
+        },
+        status=200 if ready else 503,
+    )
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Métriques au format texte de Prometheus : durées des étapes des questions
+    et de l'ingestion, cache d'embeddings et ordonnanceur Ollama. Valeurs du
+    seul processus qui répond (voir rag/metrics.py).
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404("Métriques désactivées (METRICS_ENABLED).")
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
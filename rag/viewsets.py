@@ -1,19 +1,21 @@
 import logging
-import mimetypes
 
+from django.conf import settings
 from django_filters.rest_framework import DjangoFilterBackend
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    UnstructuredWordDocumentLoader,
-)
 from rest_framework import status, viewsets
+from rest_framework.pagination import CursorPagination
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 
-from .models import Chunk, Document
-from .populate_database import add_to_django, split_documents
-from .serializers import ChunkSerializer, DocumentSerializer
+from .ingestion import enqueue_document
+from .models import Chunk, Document, IngestionJob
+from .parsing import guess_file_type
+from .serializers import (
+    ChunkEmbeddingSerializer,
+    ChunkSerializer,
+    DocumentSerializer,
+    IngestionJobSerializer,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,82 +34,85 @@ class DocumentViewSet(
 
     def create(self, request, *args, **kwargs):
         uploaded_file = request.FILES.get("file")
-        print(uploaded_file)
         if not uploaded_file:
             return Response(
                 {"error": "Aucun fichier envoyé"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Types de fichiers pris en charge
-        supported_types = {
-            "application/pdf": PyPDFLoader,
-            "text/plain": TextLoader,
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": UnstructuredWordDocumentLoader,
-            "text/markdown": TextLoader,
-            "text/x-markdown": TextLoader,
-            "text/x-wiki": TextLoader,
-        }
-
-        # Liste des documents créés, si besoin de retour plus détaillé
-        created_docs = []
-
         # Détecter le type MIME
-        file_type, encoding = mimetypes.guess_type(uploaded_file.name)
-        if file_type not in supported_types:
+        file_type = guess_file_type(uploaded_file.name)
+        if file_type is None:
             return Response(
                 {
-                    "error": f"Type de fichier '{file_type}' non pris en charge pour '{uploaded_file.name}'"
+                    "error": f"Type de fichier non pris en charge pour '{uploaded_file.name}'"
                 },
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
         # Validation via le serializer
-        serializer = self.get_serializer(data={"file": uploaded_file})
+        serializer = self.get_serializer(
+            data={
+                "file": uploaded_file,
+                "collection": request.data.get("collection", ""),
+            }
+        )
         serializer.is_valid(raise_exception=True)
 
-        # Création du Document
+        # Création du Document, l'ingestion est confiée aux workers
         document = serializer.save()
         logger.info(f"✅ Fichier '{document.file.name}' sauvegardé.")
-
-        # Charger et traiter le document
-        try:
-            loader_class = supported_types[file_type]
-            loader = loader_class(document.file.path)
-            pages = loader.load()
-        except Exception as e:
-            document.delete()
-            logger.error(
-                f"❌ Erreur de chargement du fichier '{document.file.name}': {str(e)}"
-            )
-            return Response(
-                {"error": f"Erreur de traitement du fichier '{uploaded_file.name}'"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # Diviser le document en chunks
-        try:
-            chunks = split_documents(pages)
-            add_to_django(chunks, document)
-        except Exception as e:
-            logger.error(
-                f"❌ Erreur de segmentation du fichier '{document.file.name}': {str(e)}"
-            )
-            document.delete()
-            return Response(
-                {"error": f"Erreur de segmentation du fichier '{uploaded_file.name}'"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        created_docs.append(document)
+        job = enqueue_document(document, channel=request.data.get("channel", ""))
 
         return Response(
-            DocumentSerializer(created_docs, many=True).data,
-            status=status.HTTP_201_CREATED,
+            {
+                "document": DocumentSerializer(document).data,
+                "job": IngestionJobSerializer(job).data,
+            },
+            status=status.HTTP_202_ACCEPTED,
         )
 
 
+class ChunkCursorPagination(CursorPagination):
+    page_size = settings.CHUNK_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "id"
+
+
 class ChunkViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Chunks indexés, paginés par curseur. Les embeddings ne sont renvoyés
+    qu'avec `?embedding=true`.
+    """
+
     queryset = Chunk.objects.all()
     serializer_class = ChunkSerializer
+    pagination_class = ChunkCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["document"]
+
+    def with_embedding(self):
+        return self.request.query_params.get("embedding") in ("1", "true")
+
+    def get_queryset(self):
+        queryset = super().get_queryset().defer("search_vector")
+        if not self.with_embedding():
+            queryset = queryset.defer("embedding")
+        return queryset
+
+    def get_serializer_class(self):
+        if self.with_embedding():
+            return ChunkEmbeddingSerializer
+        return ChunkSerializer
+
+
+class IngestionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Suivi des jobs d'ingestion. La progression est aussi publiée en temps réel
+    sur le canal SSE `ingestion_<id>`.
+    """
+
+    queryset = IngestionJob.objects.order_by("-created_at")
+    serializer_class = IngestionJobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["status", "document"]
@@ -0,0 +1,125 @@
+"""
+Préchargement des modèles Ollama et état de chargement.
+
+Sans préchargement, la première question après un déploiement ou une période
+d'inactivité attend qu'Ollama charge le modèle de langage et le modèle
+d'embedding. Ils sont chargés au démarrage du serveur (`OLLAMA_WARMUP_ON_STARTUP`)
+ou par `python manage.py warm_up_models`, avec la durée de maintien en mémoire
+configurée pour chacun (`*_KEEP_ALIVE`), également transmise à chaque appel.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .ollama_client import get_ollama_client, parse_keep_alive
+
+logger = logging.getLogger(__name__)
+
+_warmup_started = threading.Event()
+
+
+def configured_models():
+    """
+    :return: Liste de triplets (type, nom du modèle, keep_alive) des modèles utilisés.
+    """
+    return [
+        (
+            "llm",
+            settings.LANGUAGE_MODEL_NAME,
+            parse_keep_alive(settings.LANGUAGE_MODEL_KEEP_ALIVE),
+        ),
+        (
+            "embeddings",
+            settings.EMBEDDING_MODEL_NAME,
+            parse_keep_alive(settings.EMBEDDING_MODEL_KEEP_ALIVE),
+        ),
+    ]
+
+
+def full_model_name(model: str):
+    """
+    Nom du modèle tel que listé par Ollama (étiquette `latest` par défaut).
+    """
+    return model if ":" in model else f"{model}:latest"
+
+
+def warm_up_models():
+    """
+    Charge les modèles par une requête minimale : génération sans prompt pour
+    le modèle de langage, embedding d'un mot pour le modèle d'embedding.
+
+    :return: Liste de dictionnaires `{"kind", "model", "warm", "seconds", "error"}`.
+    """
+    client = get_ollama_client()
+    results = []
+    for kind, model, keep_alive in configured_models():
+        start = time.perf_counter()
+        try:
+            if kind == "llm":
+                client.generate(model=model, prompt="", keep_alive=keep_alive)
+            else:
+                client.embed(model=model, input="warm-up", keep_alive=keep_alive)
+        except Exception as e:
+            logger.error(f"❌ Préchargement du modèle '{model}' impossible: {str(e)}")
+            results.append(
+                {
+                    "kind": kind,
+                    "model": model,
+                    "warm": False,
+                    "seconds": time.perf_counter() - start,
+                    "error": str(e),
+                }
+            )
+            continue
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"✅ Modèle '{model}' préchargé en {elapsed:.1f}s.")
+        results.append(
+            {
+                "kind": kind,
+                "model": model,
+                "warm": True,
+                "seconds": elapsed,
+                "error": None,
+            }
+        )
+    return results
+
+
+def start_warmup():
+    """
+    Lance le préchargement dans un thread, une seule fois par processus, pour
+    ne pas retarder le démarrage du serveur. Appelée au chargement de
+    l'application ASGI/WSGI, sans effet si `OLLAMA_WARMUP_ON_STARTUP` est faux.
+    """
+    if not settings.OLLAMA_WARMUP_ON_STARTUP or _warmup_started.is_set():
+        return
+    _warmup_started.set()
+    threading.Thread(target=warm_up_models, name="ollama-warmup", daemon=True).start()
+
+
+def model_status():
+    """
+    Interroge Ollama sur les modèles actuellement chargés en mémoire.
+
+    :return: Liste de dictionnaires `{"kind", "model", "loaded", "expires_at"}`.
+    :raises Exception: Si Ollama est injoignable.
+    """
+    running = {
+        entry["name"]: entry for entry in get_ollama_client().ps().get("models", [])
+    }
+    status = []
+    for kind, model, _ in configured_models():
+        entry = running.get(full_model_name(model))
+        status.append(
+            {
+                "kind": kind,
+                "model": model,
+                "loaded": entry is not None,
+                "expires_at": str(entry["expires_at"]) if entry else None,
+            }
+        )
+    return status
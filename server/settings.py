@@ -58,6 +58,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    "rag.metrics.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -157,14 +158,219 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # URL de l'API Llama
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
 
+# Clients HTTP Ollama partagés (rag/ollama_client.py) : timeouts en secondes
+# et taille du pool de connexions keep-alive
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "10")
+)
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+
+# Nombre de workers d'ingestion lancés dans le processus web (rag/ingestion.py).
+# 0 pour déléguer les jobs à la commande `python manage.py run_ingestion_workers`
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "4"))
+
+# Processus dédiés à la lecture/découpage des fichiers (parsing PDF limité par
+# le CPU) et nombre de pages d'un PDF confiées à un processus à la fois
+INGESTION_PARSE_PROCESSES = int(
+    os.getenv("INGESTION_PARSE_PROCESSES", str(os.cpu_count() or 1))
+)
+INGESTION_PARSE_WINDOW = int(os.getenv("INGESTION_PARSE_WINDOW", "16"))
+
+# Nombre maximal d'appels d'embedding simultanés pour l'ingestion, tous fichiers
+# confondus (limite de la classe "ingestion" de l'ordonnanceur)
+INGESTION_EMBED_CONCURRENCY = int(os.getenv("INGESTION_EMBED_CONCURRENCY", "2"))
+
+# Ordonnanceur des appels Ollama du processus (rag/scheduler.py) : nombre total
+# d'appels simultanés, puis par classe (de la plus prioritaire à la moins
+# prioritaire) : appels simultanés, taille de la file d'attente, comportement
+# quand elle est pleine ("reject" : refus, "backoff" : nouvel essai après un délai
+# croissant) et attente maximale en secondes (None : sans limite). L'ingestion
+# reste sous le total pour garder des places aux questions
+OLLAMA_SCHEDULER_MAX_CONCURRENCY = int(
+    os.getenv("OLLAMA_SCHEDULER_MAX_CONCURRENCY", "4")
+)
+OLLAMA_SCHEDULER_CLASSES = {
+    "chat": {
+        "priority": 0,
+        "concurrency": int(os.getenv("OLLAMA_CHAT_CONCURRENCY", "2")),
+        "queue_size": int(os.getenv("OLLAMA_CHAT_QUEUE_SIZE", "32")),
+        "on_full": "reject",
+        "timeout": 60,
+    },
+    "query": {
+        "priority": 1,
+        "concurrency": int(os.getenv("OLLAMA_QUERY_CONCURRENCY", "2")),
+        "queue_size": int(os.getenv("OLLAMA_QUERY_QUEUE_SIZE", "64")),
+        "on_full": "reject",
+        "timeout": 30,
+    },
+    "ingestion": {
+        "priority": 2,
+        "concurrency": INGESTION_EMBED_CONCURRENCY,
+        "queue_size": int(os.getenv("OLLAMA_INGESTION_QUEUE_SIZE", "8")),
+        "on_full": "backoff",
+        "timeout": None,
+    },
+}
+OLLAMA_SCHEDULER_BACKOFF_INITIAL = 0.5
+OLLAMA_SCHEDULER_BACKOFF_MAX = 10.0
+
 # Model utilisé pour les réponses de l'API
 LANGUAGE_MODEL_NAME = "llama3.2"
 
 # Modèle utilisé pour les embeddings
 EMBEDDING_MODEL_NAME = "nomic-embed-text"
 
+# Durée de maintien en mémoire des modèles par Ollama, transmise à chaque appel :
+# durée ("30m", "2h"), secondes, ou -1 pour ne jamais les décharger
+LANGUAGE_MODEL_KEEP_ALIVE = os.getenv("LANGUAGE_MODEL_KEEP_ALIVE", "30m")
+EMBEDDING_MODEL_KEEP_ALIVE = os.getenv("EMBEDDING_MODEL_KEEP_ALIVE", "30m")
+
+# Préchargement des deux modèles au démarrage du serveur (rag/warmup.py), pour que
+# la première question n'attende pas leur chargement. Voir aussi la commande
+# python manage.py warm_up_models et l'état exposé par /health/
+OLLAMA_WARMUP_ON_STARTUP = (
+    os.getenv("OLLAMA_WARMUP_ON_STARTUP", "true").lower() == "true"
+)
+
+# Cache des embeddings de requêtes (rag/embedding_cache.py) : nombre d'entrées en
+# mémoire, durée de vie en secondes et alias optionnel d'un cache Django partagé
+# entre les workers (ex. "default"), None pour un cache local uniquement
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+EMBEDDING_CACHE_ALIAS = os.getenv("EMBEDDING_CACHE_ALIAS") or None
+
+# Nombre de chunks envoyés à Ollama par appel d'embedding et insérés par requête
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+# Nombre maximal de lots en attente entre deux étapes du pipeline d'ingestion
+# (lecture/découpage -> embeddings -> insertion), borne la mémoire utilisée
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", "4"))
+
+# Backend de recherche vectorielle (rag/vector_store.py) : pgvector par défaut, ou
+# "rag.vector_store.NumpyVectorStore" (index NumPy en processus, fichier mappé en
+# mémoire dans VECTOR_STORE_PATH, recherche exacte par blocs de
+# VECTOR_STORE_BLOCK_SIZE vecteurs). Après changement de backend, relancer
+# python manage.py rebuild_vector_index
+VECTOR_STORE_BACKEND = os.getenv(
+    "VECTOR_STORE_BACKEND", "rag.vector_store.PgVectorStore"
+)
+VECTOR_STORE_BLOCK_SIZE = int(os.getenv("VECTOR_STORE_BLOCK_SIZE", "16384"))
+
+# Index ANN sur les embeddings (rag/vector_index.py) : "ivfflat" ou "hnsw".
+# VECTOR_INDEX_LISTS = 0 : nombre de listes IVFFlat calculé à partir du nombre de
+# chunks lors de la reconstruction (python manage.py rebuild_vector_index)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_INDEX_LISTS = int(os.getenv("VECTOR_INDEX_LISTS", "0"))
+VECTOR_INDEX_M = int(os.getenv("VECTOR_INDEX_M", "16"))
+VECTOR_INDEX_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_EF_CONSTRUCTION", "64"))
+
+# Compression des vecteurs dans l'index ANN : "none" (float32), "halfvec"
+# (demi-précision, index deux fois plus petit) ou "binary" (1 bit par dimension).
+# Avec compression, l'index fournit top_k * VECTOR_RERANK_OVERSAMPLING candidats
+# reclassés avec les vecteurs complets. Après modification, relancer
+# python manage.py rebuild_vector_index
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none")
+VECTOR_RERANK_OVERSAMPLING = int(os.getenv("VECTOR_RERANK_OVERSAMPLING", "4"))
+
+# Compromis rappel/latence appliqué à chaque recherche : nombre de listes IVFFlat
+# visitées (ivfflat.probes) et taille de la liste candidate HNSW (hnsw.ef_search)
+VECTOR_SEARCH_PROBES = int(os.getenv("VECTOR_SEARCH_PROBES", "10"))
+VECTOR_SEARCH_EF_SEARCH = int(os.getenv("VECTOR_SEARCH_EF_SEARCH", "40"))
+
+# Recherche restreinte à des documents ou à une collection : parcours itératif de
+# l'index (pgvector >= 0.8) pour ne pas perdre de résultats à cause du filtre.
+# "relaxed_order" (les résultats sont reclassés ensuite), "strict_order" ou "off".
+# HNSW s'arrête après VECTOR_ITERATIVE_MAX_SCAN_TUPLES tuples lus
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order")
+VECTOR_ITERATIVE_MAX_SCAN_TUPLES = int(
+    os.getenv("VECTOR_ITERATIVE_MAX_SCAN_TUPLES", "20000")
+)
+
+# Diversification MMR des chunks récupérés (rag/mmr.py) : top_k * MMR_OVERSAMPLING
+# candidats, réduits à top_k. MMR_LAMBDA = 1 : pertinence seule, 0 : diversité seule
+MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.5"))
+MMR_OVERSAMPLING = int(os.getenv("MMR_OVERSAMPLING", "4"))
+
+# Mode de récupération du contexte : "vector" (distance cosinus seule) ou "hybrid"
+# (fusion RRF des recherches vectorielle et plein texte, en une requête SQL).
+# En mode hybride : nombre de candidats de chaque recherche, poids de chacune
+# dans la fusion et constante k de la formule poids / (k + rang)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+HYBRID_VECTOR_CANDIDATES = int(os.getenv("HYBRID_VECTOR_CANDIDATES", "40"))
+HYBRID_LEXICAL_CANDIDATES = int(os.getenv("HYBRID_LEXICAL_CANDIDATES", "40"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# Cache sémantique des réponses (rag/answer_cache.py) : une question dont la
+# similarité cosinus avec une question déjà traitée atteint le seuil reçoit la
+# réponse enregistrée. Durée de vie en secondes, 0 pour aucune expiration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Intervalle minimal en secondes entre deux suppressions des réponses expirées
+ANSWER_CACHE_PRUNE_INTERVAL = int(os.getenv("ANSWER_CACHE_PRUNE_INTERVAL", "600"))
+
+# Regroupement des tokens publiés par SSE pendant la génération (rag/streaming.py) :
+# un événement est envoyé dès que le tampon atteint SSE_FLUSH_CHARS caractères
+# ou que son plus ancien token attend depuis SSE_FLUSH_INTERVAL secondes
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "64"))
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.04"))
+
+# Durée des étapes des questions et de l'ingestion (rag/metrics.py), exportée sur
+# /metrics au format Prometheus et journalisée à la fin de chaque requête
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Port où `run_ingestion_workers` expose ses propres métriques (0 : désactivé),
+# les métriques étant tenues par processus
+METRICS_WORKER_PORT = int(os.getenv("METRICS_WORKER_PORT", "0"))
+
+# Journaux sur la sortie standard, avec l'identifiant de corrélation de la
+# requête ou du job d'ingestion en cours
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "correlation_id": {"()": "rag.metrics.CorrelationIdFilter"},
+    },
+    "formatters": {
+        "correlated": {
+            "format": "%(asctime)s %(levelname)s [%(correlation_id)s] "
+            "%(name)s: %(message)s",
+        },
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "filters": ["correlation_id"],
+            "formatter": "correlated",
+        },
+    },
+    "loggers": {
+        "rag": {
+            "handlers": ["console"],
+            "level": os.getenv("RAG_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
+# Contexte envoyé au modèle (rag/context.py) : budget en tokens, estimés à raison de
+# CONTEXT_CHARS_PER_TOKEN caractères par token. Les chunks voisins d'une même page
+# sont fusionnés en retirant jusqu'à CONTEXT_MAX_OVERLAP caractères répétés
+# (chunk_overlap du découpage). Un chevauchement plus court que CONTEXT_MIN_OVERLAP
+# caractères, ou qui ne commence pas sur un mot entier, est ignoré
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_CHARS_PER_TOKEN = int(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+CONTEXT_MAX_OVERLAP = int(os.getenv("CONTEXT_MAX_OVERLAP", "200"))
+CONTEXT_MIN_OVERLAP = int(os.getenv("CONTEXT_MIN_OVERLAP", "20"))
+
 # Modèle de pre-prompts pour les questions, le contexte correpond aux documents similaires trouvés
 # et la question est la question posée par l'utilisateur
+
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
 
@@ -178,3 +384,19 @@ Finished your answer by your level of confidence in the answer from the given co
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+
+# Nombre de chunks par page de l'API /api/chunk/ et de la page /chunks/
+CHUNK_PAGE_SIZE = int(os.getenv("CHUNK_PAGE_SIZE", "100"))
+
+# Projections 3D du corpus (PCA, t-SNE, UMAP) ajustées par rag/projections.py
+PROJECTIONS_PATH = Path(MEDIA_ROOT) / "projections" / "projections.joblib"
+
+# Fichiers de l'index NumPy (VECTOR_STORE_BACKEND = NumpyVectorStore)
+VECTOR_STORE_PATH = Path(os.getenv("VECTOR_STORE_PATH", Path(MEDIA_ROOT) / "vector_store"))
+
+# Vue 3D (rag/graph.py) : voisins de la requête toujours affichés, nombre maximal
+# de points par graphique (0 : tous) et nombre de strates de score pour
+# l'échantillonnage des autres chunks
+VIEW_3D_NEIGHBORS = int(os.getenv("VIEW_3D_NEIGHBORS", "50"))
+VIEW_3D_MAX_POINTS = int(os.getenv("VIEW_3D_MAX_POINTS", "5000"))
+VIEW_3D_STRATA = int(os.getenv("VIEW_3D_STRATA", "10"))
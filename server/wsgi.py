@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_wsgi_application()
+
+# Préchargement des modèles Ollama au démarrage du serveur (rag/warmup.py)
+from rag.warmup import start_warmup  # noqa: E402
+
+start_warmup()
+
+# Reprise des jobs d'ingestion en attente ou interrompus (rag/ingestion.py)
+from rag.ingestion import start_recovery  # noqa: E402
+
+start_recovery()